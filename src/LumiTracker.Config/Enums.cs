@@ -94,6 +94,8 @@ namespace LumiTracker.Config
     public enum EInputType : int
     {
         CaptureTest = 0,
+        ReloadDatabase,
+        MyDeck,
 
         NumInputTypes,
         Invalid = NumInputTypes
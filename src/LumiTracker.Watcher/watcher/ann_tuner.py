@@ -0,0 +1,157 @@
+from annoy import AnnoyIndex
+import numpy as np
+
+import argparse
+import itertools
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from .config import cfg
+from .enums import EAnnType
+from .database import Database
+from .feature import ImageHash
+from .search_engine import ExactSearchEngine
+
+def QueryBits(matrix, num_bits, num_real, num_synthetic, rng):
+    """
+    real      : database hashes with up to cfg.threshold flipped bits, like captured cards
+    synthetic : uniform random hashes, like frames without a card
+    """
+    bits = np.unpackbits(matrix.astype(">u8").view(np.uint8), axis=-1)[:, -num_bits:].astype(bool)
+    real = bits[rng.integers(bits.shape[0], size=num_real)].copy()
+    for row in real:
+        row[rng.choice(num_bits, int(rng.integers(0, cfg.threshold + 1)), replace=False)] ^= True
+    synthetic = rng.random((num_synthetic, num_bits)) < 0.5
+    return {"real": real, "synthetic": synthetic}
+
+def ExactTies(exact, queries):
+    """
+    Best distance and the full set of ids tied at it, for each query.
+    """
+    truths = []
+    for bits in queries:
+        ids, dists = exact.Search(ImageHash.FromBits(bits), exact.GetNumItems())
+        num_ties = dists.count(dists[0])
+        truths.append((dists[0], set(ids[:num_ties])))
+    return truths
+
+def Measure(ann, queries, truths, n, search_k):
+    """
+    recall@1   : the first result is at the exact best distance
+    recall@tie : fraction of the exact tie group found at the best distance, averaged
+    """
+    num_top1 = 0
+    tie_recall = 0.0
+    begin_time = time.perf_counter()
+    results = [ann.get_nns_by_vector(bits, n, search_k=search_k, include_distances=True) for bits in queries]
+    latency = (time.perf_counter() - begin_time) / len(queries)
+
+    for (ids, dists), (best_dist, ties) in zip(results, truths):
+        if dists and int(dists[0]) == best_dist:
+            num_top1 += 1
+        found = {i for i, d in zip(ids, dists) if int(d) == best_dist}
+        tie_recall += len(found & ties) / len(ties)
+    return num_top1 / len(queries), tie_recall / len(queries), latency
+
+def BuildAnnoy(bits, n_trees):
+    ann = AnnoyIndex(bits.shape[1], cfg.ann_metric)
+    for i, row in enumerate(bits):
+        ann.add_item(i, row.tolist())
+    ann.build(n_trees)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "tune.ann")
+        ann.save(path)
+        index_size = os.path.getsize(path)
+        ann.unload()
+        ann.load(path, prefault=True)
+    return ann, index_size
+
+def Recommend(rows, target_recall):
+    """
+    The fastest setting whose worst recall@tie over all indexes and query sets reaches target_recall,
+    or the most accurate one if none does.
+    """
+    settings = {}
+    for row in rows:
+        key = (row["n_trees"], row["search_k"], row["n"])
+        worst, latency = settings.get(key, (1.0, 0.0))
+        settings[key] = (min(worst, row["recall_tie"]), latency + row["latency_us"])
+
+    passed = [(latency, key) for key, (worst, latency) in settings.items() if worst >= target_recall]
+    if passed:
+        _, key = min(passed)
+    else:
+        key = max(settings, key=lambda k: (settings[k][0], -settings[k][1]))
+    n_trees, search_k, n = key
+    return {"ann_n_trees": n_trees, "ann_search_k": search_k, "ann_search_n": n}, settings[key][0]
+
+def main():
+    """
+    Sweep the Annoy parameters and compare each setting with exact search on every index.
+    Write all measurements and a recommended config block to --output.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-trees",  type=int, nargs="+", default=[5, 10, 20, 40])
+    parser.add_argument("--search-k", type=int, nargs="+", default=[-1, 200, 1000, 5000])
+    parser.add_argument("--n",        type=int, nargs="+", default=[4, 10, 20, 40])
+    parser.add_argument("--real",      type=int, default=500, help="number of perturbed database queries per index")
+    parser.add_argument("--synthetic", type=int, default=200, help="number of random queries per index")
+    parser.add_argument("--target-recall", type=float, default=1.0)
+    parser.add_argument("--output", default=os.path.join(cfg.debug_dir, "ann_tuning.json"))
+    args = parser.parse_args()
+
+    db = Database()
+    db.Load()
+    rng = np.random.default_rng(0)
+
+    rows = []
+    begin_time = time.perf_counter()
+    for i in range(EAnnType.ANN_COUNT.value):
+        ann_type = EAnnType(i)
+        exact = ExactSearchEngine(ann_type)
+        exact.SetMatrix(db.GetEngine(ann_type).GetMatrix())
+        num_bits = exact.num_bits
+        item_bits = np.unpackbits(exact.matrix.astype(">u8").view(np.uint8), axis=-1)[:, -num_bits:]
+
+        query_sets = QueryBits(exact.matrix, num_bits, args.real, args.synthetic, rng)
+        truths = {name: ExactTies(exact, queries) for name, queries in query_sets.items()}
+        query_lists = {name: [row.tolist() for row in queries.astype(np.uint8)] for name, queries in query_sets.items()}
+
+        for n_trees in args.n_trees:
+            ann, index_size = BuildAnnoy(item_bits, n_trees)
+            for search_k, n in itertools.product(args.search_k, args.n):
+                for name in query_sets:
+                    recall_1, recall_tie, latency = Measure(ann, query_lists[name], truths[name], n, search_k)
+                    rows.append({
+                        "ann_type"   : ann_type.name,
+                        "queries"    : name,
+                        "n_trees"    : n_trees,
+                        "search_k"   : search_k,
+                        "n"          : n,
+                        "recall_1"   : recall_1,
+                        "recall_tie" : recall_tie,
+                        "latency_us" : latency * 1e6,
+                        "index_size" : index_size,
+                    })
+            ann.unload()
+
+        current = [row for row in rows if row["ann_type"] == ann_type.name and row["n_trees"] == cfg.ann_n_trees
+                   and row["search_k"] == cfg.ann_search_k and row["n"] == cfg.ann_search_n]
+        for row in current:
+            print(f"{ann_type.name} ({row['queries']}), current config: recall@1 = {row['recall_1']:.4f}, "
+                  f"recall@tie = {row['recall_tie']:.4f}, {row['latency_us']:.1f}us, {row['index_size']} bytes")
+
+    recommended, worst_recall = Recommend(rows, args.target_recall)
+    print(f"Done in {time.perf_counter() - begin_time:.1f}s, recommended (worst recall@tie = {worst_recall:.4f}):")
+    print(json.dumps(recommended, indent=2))
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({"recommended": recommended, "worst_recall_tie": worst_recall, "results": rows}, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+import numpy as np
+
+import hashlib
+import mmap
+import os
+
+# Bump when the layout changes, files of other versions are ignored
+# and Database.Load falls back to db.json and the .ann files
+BINARY_DB_VERSION = 2
+
+_MAGIC     = b"LTDB"
+_ALIGNMENT = 16
+
+_HEADER_DTYPE = np.dtype([
+    ("magic",         "S4"),
+    ("version",       "<u4"),
+    ("num_sections",  "<u4"),
+    ("hash_size",     "<u4"),
+    ("source_digest", "S40"),   # SourceDigest of the files it was converted from
+])
+
+_SECTION_DTYPE = np.dtype([
+    ("name",   "S40"),
+    ("kind",   "S8"),
+    ("dtype",  "S8"),
+    ("offset", "<u8"),
+    ("rows",   "<u4"),
+    ("cols",   "<u4"),
+])
+
+def SourceDigest(paths, hash_size):
+    """
+    Digest of the files a binary database is converted from, with what else its content depends on.
+    """
+    digest = hashlib.sha1(f"{BINARY_DB_VERSION}:{hash_size}".encode("ascii"))
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def VersionedPath(path, source_digest):
+    """
+    db.bin -> db.<digest>.bin, a file is never rewritten once a watcher may have mapped it.
+    """
+    root, ext = os.path.splitext(path)
+    return f"{root}.{source_digest[:16]}{ext}"
+
+
+class _SectionKind:
+    HASH    = b"hash"       # packed hash matrix of an index, (num_items, num_words) <u8
+    INTS    = b"ints"       # list of ints, (n, 1) <i4
+    MAP     = b"map"        # int to int dict, (n, 2) <i4
+    STRS    = b"strs"       # list of strings, (n, 1) string ids
+    RECORDS = b"records"    # list of dicts, no data, its columns follow
+    COLUMN  = b"column"     # one key of a record list: string ids, bools or ints, cols > 1 means a list
+    STRINGS = b"strings"    # string table: offsets (n + 1, 1) <u4 and utf-8 blob (size, 1) u1
+
+_DATA_KINDS = (_SectionKind.INTS, _SectionKind.MAP, _SectionKind.STRS, _SectionKind.RECORDS)
+
+
+class BinaryDatabaseWriter:
+    """
+    Versioned single-file container of the database:
+        header | section directory | section data, each aligned to 16 bytes
+    All arrays are little-endian, so they can be mapped without conversion.
+    """
+    def __init__(self, hash_size, source_digest):
+        self.hash_size     = hash_size
+        self.source_digest = source_digest
+        self.sections      = []   # (name, kind, array)
+        self.strings       = []
+        self.string_ids    = {}
+
+    def AddString(self, s):
+        string_id = self.string_ids.get(s)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(s)
+            self.string_ids[s] = string_id
+        return string_id
+
+    def AddArray(self, name, kind, array):
+        array = np.asarray(array)
+        if array.ndim == 1:
+            array = array.reshape(-1, 1)
+        self.sections.append((name, kind, array.astype(array.dtype.newbyteorder("<"), copy=False)))
+
+    def AddHashes(self, name, matrix):
+        self.AddArray(f"hash/{name}", _SectionKind.HASH, np.asarray(matrix, dtype="<u8"))
+
+    def AddData(self, key, value):
+        """
+        Add a value of Database.data, the section kind follows its type.
+        """
+        if isinstance(value, dict):
+            pairs = [(int(k), int(v)) for k, v in value.items()]
+            self.AddArray(key, _SectionKind.MAP, np.array(pairs, dtype="<i4").reshape(-1, 2))
+        elif value and isinstance(value[0], dict):
+            self._AddRecords(key, value)
+        elif value and isinstance(value[0], str):
+            self.AddArray(key, _SectionKind.STRS, np.array([self.AddString(s) for s in value], dtype="<u4"))
+        else:
+            self.AddArray(key, _SectionKind.INTS, np.array(value, dtype="<i4"))
+
+    def _AddRecords(self, key, records):
+        self.AddArray(key, _SectionKind.RECORDS, np.zeros((len(records), 0), dtype="<u4"))
+        for column in records[0].keys():
+            values = [record[column] for record in records]
+            if isinstance(values[0], str):
+                array = np.array([self.AddString(v) for v in values], dtype="<u4")
+            elif isinstance(values[0], bool):
+                array = np.array(values, dtype=bool)
+            else:
+                array = np.array(values, dtype="<i4")
+            self.AddArray(f"{key}/{column}", _SectionKind.COLUMN, array)
+
+    def Save(self, path):
+        blobs   = [s.encode("utf-8") for s in self.strings]
+        offsets = np.zeros((len(blobs) + 1,), dtype="<u4")
+        offsets[1:] = np.cumsum([len(blob) for blob in blobs])
+        sections = self.sections + [
+            ("strings.offsets", _SectionKind.STRINGS, offsets.reshape(-1, 1)),
+            ("strings.blob",    _SectionKind.STRINGS, np.frombuffer(b"".join(blobs), dtype=np.uint8).reshape(-1, 1)),
+        ]
+
+        header = np.zeros((1,), dtype=_HEADER_DTYPE)
+        header["magic"]         = _MAGIC
+        header["version"]       = BINARY_DB_VERSION
+        header["num_sections"]  = len(sections)
+        header["hash_size"]     = self.hash_size
+        header["source_digest"] = self.source_digest.encode("ascii")
+
+        directory = np.zeros((len(sections),), dtype=_SECTION_DTYPE)
+        offset = _HEADER_DTYPE.itemsize + directory.nbytes
+        for i, (name, kind, array) in enumerate(sections):
+            offset = _Align(offset)
+            directory[i] = (name.encode("utf-8"), kind, array.dtype.str.encode("ascii"), offset, array.shape[0], array.shape[1])
+            offset += array.nbytes
+
+        # Write aside and replace, so that a running watcher never maps a partial file
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header.tobytes())
+            f.write(directory.tobytes())
+            for entry, (_, _, array) in zip(directory, sections):
+                f.write(b"\0" * (int(entry["offset"]) - f.tell()))
+                f.write(np.ascontiguousarray(array).tobytes())
+        try:
+            os.replace(tmp_path, path)
+        except PermissionError:
+            # Windows does not replace a file mapped by a running watcher. It has the same digest,
+            # so the same content, keep it.
+            os.remove(tmp_path)
+
+
+class BinaryDatabase:
+    """
+    Memory-mapped reader of BinaryDatabaseWriter files.
+    Opening only reads the header and the section directory, sections are views of the mapping.
+    """
+    def __init__(self, path, hash_size, source_digest=None):
+        """
+        source_digest: SourceDigest of the current files, the file must have been converted from them
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.mm) < _HEADER_DTYPE.itemsize:
+            raise ValueError(f"{path} is too small for a binary database")
+        header = np.frombuffer(self.mm, dtype=_HEADER_DTYPE, count=1)[0]
+        if header["magic"] != _MAGIC:
+            raise ValueError(f"{path} is not a binary database")
+        if header["version"] != BINARY_DB_VERSION:
+            raise ValueError(f"{path} has version {header['version']}, expected {BINARY_DB_VERSION}")
+        if header["hash_size"] != hash_size:
+            raise ValueError(f"{path} has hash_size {header['hash_size']}, expected {hash_size}")
+        if source_digest is not None and header["source_digest"] != source_digest.encode("ascii"):
+            raise ValueError(f"{path} was converted from other database files")
+
+        directory = np.frombuffer(self.mm, dtype=_SECTION_DTYPE, count=int(header["num_sections"]), offset=_HEADER_DTYPE.itemsize)
+        self.directory = [(entry["name"].decode("utf-8"), entry) for entry in directory]
+        self.entries   = dict(self.directory)
+
+        self.string_offsets = self.Section("strings.offsets")[:, 0]
+        self.string_base    = int(self.entries["strings.blob"]["offset"])
+
+    def Section(self, name):
+        entry = self.entries[name]
+        rows, cols = int(entry["rows"]), int(entry["cols"])
+        array = np.frombuffer(self.mm, dtype=np.dtype(entry["dtype"].decode("ascii")),
+                              count=rows * cols, offset=int(entry["offset"]))
+        return array.reshape(rows, cols)
+
+    def String(self, string_id):
+        begin = self.string_base + int(self.string_offsets[string_id])
+        end   = self.string_base + int(self.string_offsets[string_id + 1])
+        return self.mm[begin:end].decode("utf-8")
+
+    def Hashes(self, name):
+        return self.Section(f"hash/{name}")
+
+    def HasData(self, name):
+        entry = self.entries.get(name)
+        return entry is not None and entry["kind"] in _DATA_KINDS
+
+    def DataNames(self):
+        return [name for name, entry in self.directory if entry["kind"] in _DATA_KINDS]
+
+    def Data(self, name):
+        """
+        View of a data section, with the same access patterns as the value loaded from db.json.
+        """
+        entry = self.entries[name]
+        kind  = entry["kind"]
+        if kind == _SectionKind.INTS:
+            return IntList(self.Section(name)[:, 0])
+        elif kind == _SectionKind.MAP:
+            return IntMap(self.Section(name))
+        elif kind == _SectionKind.STRS:
+            return StringList(self, self.Section(name)[:, 0])
+        elif kind == _SectionKind.RECORDS:
+            prefix  = name + "/"
+            columns = [(n[len(prefix):], self.Section(n)) for n, e in self.directory
+                       if e["kind"] == _SectionKind.COLUMN and n.startswith(prefix)]
+            return RecordList(self, int(entry["rows"]), columns)
+        raise KeyError(name)
+
+
+def _Align(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+class IntList:
+    def __init__(self, array):
+        self.array = array
+
+    def __getitem__(self, index):
+        return int(self.array[index])
+
+    def __len__(self):
+        return self.array.shape[0]
+
+    def __iter__(self):
+        return iter(self.array.tolist())
+
+
+class IntMap:
+    """
+    db.json stores these dicts with string keys, so both int and str keys are accepted.
+    """
+    def __init__(self, pairs):
+        self.pairs = pairs
+        self.dict  = None
+
+    def _Dict(self):
+        if self.dict is None:
+            self.dict = dict(self.pairs.tolist())
+        return self.dict
+
+    def __getitem__(self, key):
+        return self._Dict()[int(key)]
+
+    def __contains__(self, key):
+        return int(key) in self._Dict()
+
+    def __len__(self):
+        return self.pairs.shape[0]
+
+    def items(self):
+        return self._Dict().items()
+
+
+class StringList:
+    def __init__(self, binary, string_ids):
+        self.binary     = binary
+        self.string_ids = string_ids
+
+    def __getitem__(self, index):
+        return self.binary.String(self.string_ids[index])
+
+    def __len__(self):
+        return self.string_ids.shape[0]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class RecordList:
+    """
+    Each record is assembled as a dict on access, from one column per key.
+    """
+    def __init__(self, binary, num_records, columns):
+        self.binary      = binary
+        self.num_records = num_records
+        self.columns     = columns
+
+    def __getitem__(self, index):
+        record = {}
+        for key, column in self.columns:
+            if column.dtype == np.uint32:
+                record[key] = self.binary.String(column[index, 0])
+            elif column.dtype == np.bool_:
+                record[key] = bool(column[index, 0])
+            elif column.shape[1] > 1:
+                record[key] = column[index].tolist()
+            else:
+                record[key] = int(column[index, 0])
+        return record
+
+    def __len__(self):
+        return self.num_records
+
+    def __iter__(self):
+        return (self[i] for i in range(self.num_records))
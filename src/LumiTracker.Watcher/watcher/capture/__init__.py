@@ -1,2 +1,7 @@
-from .bit_blt import BitBlt
-from .windows_capture import WindowsCapture
\ No newline at end of file
+import sys
+
+# The window captures are Win32-only, ReplayCapture runs anywhere
+if sys.platform == "win32":
+    from .bit_blt import BitBlt
+    from .windows_capture import WindowsCapture
+from .replay import ReplayCapture
\ No newline at end of file
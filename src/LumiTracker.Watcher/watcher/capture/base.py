@@ -5,6 +5,7 @@ from abc import ABC, abstractmethod
 
 from ..config import cfg, LogDebug, LogInfo
 from ..frame_manager import FrameManager
+from ..frame_pipeline import FramePipeline
 from ..input_manager import InputManager
 
 kernel32 = ctypes.WinDLL('kernel32')
@@ -23,6 +24,7 @@ class CaptureBase(ABC):
         self.frame_manager  = None
         self.frame_interval = 1.0 / cfg.frame_limit
         self.input_manager  = None
+        self.pipeline       = None
 
         # set timer resolution to 1 ms
         winmm.timeBeginPeriod(1)
@@ -31,6 +33,10 @@ class CaptureBase(ABC):
         self.hwnd = hwnd
         self.frame_manager = FrameManager(client_type, log_dir, test_on_resize)
         self.input_manager = InputManager(port, self.frame_manager)
+        if cfg.frame_pipeline:
+            # This thread only captures and polls the input, frames are processed in the pipeline thread
+            self.pipeline = FramePipeline(self.frame_manager)
+            self.pipeline.Start()
 
         self.OnStart(hwnd)
         self.MainLoop()
@@ -38,6 +44,11 @@ class CaptureBase(ABC):
     def Close(self):
         self.OnClosed()
         self.input_manager.Close()
+        if self.pipeline is not None:
+            self.pipeline.Close()
+        self.frame_manager.task_runner.Close()
+        # Write out the queued debug images
+        self.frame_manager.image_writer.Close()
     
     @abstractmethod
     def OnStart(self, hwnd):
@@ -60,7 +71,15 @@ class CaptureBase(ABC):
 
     def OnFrameArrived(self, frame_buffer):
         # frame_buffer: 4-channels, BGRX
-        self.frame_manager.OnFrameArrived(frame_buffer)
+        if self.pipeline is not None:
+            self.pipeline.Push(frame_buffer)
+        else:
+            self.frame_manager.OnFrameArrived(frame_buffer)
+
+    def ResizeFrameManager(self, width, height):
+        # The pipeline resizes it from the frame size, in order with the queued frames
+        if self.pipeline is None:
+            self.frame_manager.Resize(width, height)
 
     def WaitForFrameRateLimit(self, elapsed_time):
         # use Windows native api to get accurate sleep interval
@@ -73,7 +73,7 @@ class BitBlt(CaptureBase):
         client_width, client_height = width, height
         self.DestroyBitmap()
         self.CreateBitmap(client_width, client_height)
-        self.frame_manager.Resize(client_width, client_height)
+        self.ResizeFrameManager(client_width, client_height)
     
     def CreateBitmap(self, width, height):
         hbitmap = win32gui.CreateCompatibleBitmap(self.hdc, width, height)
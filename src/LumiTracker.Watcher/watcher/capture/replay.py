@@ -0,0 +1,149 @@
+import argparse
+import os
+import time
+
+import cv2
+
+from ..config import cfg, LogInfo, LogError
+from ..enums import EClientType
+from ..database import LoadImage
+from ..frame_manager import FrameManager
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+class VideoFrameSource:
+    """
+    Frames of a video file, with the timestamps of the video.
+    """
+    def __init__(self, path):
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise ValueError(f"Failed to open video {path}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or cfg.frame_limit
+
+    def __iter__(self):
+        index = 0
+        while True:
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            yield frame, index / self.fps
+            index += 1
+
+    def Close(self):
+        self.cap.release()
+
+
+class ImageFrameSource:
+    """
+    Frames of the images in a directory, sorted by name and spaced by 1 / fps.
+    """
+    def __init__(self, path, fps):
+        self.paths = sorted(os.path.join(path, name) for name in os.listdir(path)
+                            if name.lower().endswith(IMAGE_EXTENSIONS))
+        self.fps   = fps
+
+    def __iter__(self):
+        for index, path in enumerate(self.paths):
+            frame = LoadImage(path)
+            if frame is None:
+                LogError(info=f"[ReplayCapture] Failed to load {path}")
+                continue
+            yield frame, index / self.fps
+
+    def Close(self):
+        pass
+
+
+class ReplayCapture:
+    """
+    Drives a FrameManager from a recording instead of a window, so it also runs where the Win32 captures do not.
+    Same flow as CaptureBase, without the backend input: every frame goes to OnFrameArrived,
+    and Resize is called whenever the frame size changes.
+    speed: 1.0 replays at the pace of the recording, 0 as fast as possible
+    """
+    def __init__(self, speed=0.0):
+        self.speed          = speed
+        self.frame_manager  = None
+        self.source         = None
+        self.width          = 0
+        self.height         = 0
+
+        self.num_frames     = 0
+        self.wall_time      = 0.0
+
+    def Start(self, path, client_type=EClientType.Video.name, log_dir="", fps=cfg.frame_limit):
+        self.frame_manager = FrameManager(client_type, log_dir)
+        self.OnStart(path, fps)
+        self.MainLoop()
+        self.Close()
+
+    def Close(self):
+        self.OnClosed()
+        self.frame_manager.task_runner.Close()
+        self.frame_manager.image_writer.Close()
+
+    def OnStart(self, path, fps):
+        if os.path.isdir(path):
+            self.source = ImageFrameSource(path, fps)
+        else:
+            self.source = VideoFrameSource(path)
+
+    def OnClosed(self):
+        if self.source is not None:
+            self.source.Close()
+            self.source = None
+        LogInfo(
+            info="[ReplayCapture] Done.",
+            num_frames=self.num_frames,
+            wall_time=self.wall_time,
+            fps=self.num_frames / self.wall_time if self.wall_time > 0 else 0.0,
+            )
+
+    def MainLoop(self):
+        begin_time = time.perf_counter()
+        for frame, timestamp in self.source:
+            if self.speed > 0:
+                dt = begin_time + timestamp / self.speed - time.perf_counter()
+                if dt > 0:
+                    time.sleep(dt)
+
+            height, width = frame.shape[:2]
+            if width != self.width or height != self.height:
+                self.OnResize(width, height)
+
+            self.OnFrameArrived(self.ToBGRA(frame), timestamp)
+            self.num_frames += 1
+        self.wall_time = time.perf_counter() - begin_time
+
+    def OnResize(self, width, height):
+        self.width  = width
+        self.height = height
+        self.frame_manager.Resize(width, height)
+
+    def OnFrameArrived(self, frame_buffer, timestamp):
+        # frame_buffer: 4-channels, BGRX
+        # timestamp: time in the recording, so the events do not depend on the replay speed
+        self.frame_manager.OnFrameArrived(frame_buffer, timestamp)
+
+    @staticmethod
+    def ToBGRA(frame):
+        # A new buffer each frame like the Win32 captures, tasks may keep views of the previous ones
+        if frame.ndim == 2:
+            return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGRA)
+        if frame.shape[-1] == 3:
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA)
+        return frame
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a video file or a directory of frames through the watcher.")
+    parser.add_argument("path", help="video file, or directory of frames sorted by name")
+    parser.add_argument("--speed", type=float, default=0.0, help="1.0 for the pace of the recording, 0 for as fast as possible")
+    parser.add_argument("--fps", type=float, default=cfg.frame_limit, help="frame rate of a directory of frames")
+    parser.add_argument("--client-type", default=EClientType.Video.name)
+    parser.add_argument("--log-dir", default="")
+    args = parser.parse_args()
+
+    capture = ReplayCapture(speed=args.speed)
+    capture.Start(args.path, client_type=args.client_type, log_dir=args.log_dir, fps=args.fps)
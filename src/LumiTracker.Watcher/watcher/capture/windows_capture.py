@@ -55,7 +55,7 @@ class WindowsCapture(CaptureBase):
 
         # LogDebug(window_size=self.window_size, client_size=self.client_size, border_size=self.border_size)
 
-        self.frame_manager.Resize(self.client_size[0], self.client_size[1])
+        self.ResizeFrameManager(self.client_size[0], self.client_size[1])
 
     # Called Every Time A New Frame Is Available
     def on_frame_arrived(self, frame: Frame, capture_control: InternalCaptureControl):
@@ -1,4 +1,5 @@
 import json
+import threading
 from types import SimpleNamespace
 
 def dict_to_simplenamespace(d):
@@ -25,11 +26,42 @@ logging.basicConfig(level=logging.DEBUG if cfg.DEBUG else logging.INFO,
                     format='{"level":"%(levelname)s", "data":%(message)s}')
 logging.getLogger("PIL.PngImagePlugin").setLevel(logging.WARNING)
 
+_deferred = threading.local()
+
+def BeginDeferred():
+    """
+    Buffer the logs and Deferred calls of this thread until EndDeferred.
+    """
+    _deferred.effects = []
+
+def EndDeferred():
+    """
+    Stop buffering and return the buffered calls as [(func, args)], to be applied with ApplyDeferred.
+    """
+    effects = getattr(_deferred, "effects", None)
+    _deferred.effects = None
+    return effects if effects is not None else []
+
+def ApplyDeferred(effects):
+    for func, args in effects:
+        func(*args)
+
+def Deferred(func, *args):
+    """
+    Call func now, or buffer it when this thread is between BeginDeferred and EndDeferred.
+    """
+    effects = getattr(_deferred, "effects", None)
+    if effects is None:
+        func(*args)
+    else:
+        effects.append((func, args))
+
 def _Log(log_func, message_dict, indent, **kwargs):
     if message_dict is None:
         message_dict = {}
     message_dict.update(kwargs)
-    log_func(json.dumps(message_dict, indent=indent, ensure_ascii=False))
+    # Formatted now, the dict may be changed by the caller before a buffered log is written
+    Deferred(log_func, json.dumps(message_dict, indent=indent, ensure_ascii=False))
 
 def LogDebug(message_dict=None, indent=None, **kwargs):
     if not cfg.DEBUG:
@@ -1,4 +1,3 @@
-from annoy import AnnoyIndex
 import numpy as np
 import cv2
 
@@ -7,15 +6,21 @@ import time
 import json
 import csv
 import os
+import glob
 import re
 import shutil
+import threading
 from pathlib import Path
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 from .config import cfg, LogDebug, LogInfo, LogWarning, LogError
-from .enums import ECtrlType, EAnnType, EActionCardType, EElementType, ECostType, ELanguage
-from .feature import CropBox, ActionCardHandler, CharacterCardHandler, FeatureDistance, GetHashSize, ImageHash
+from .enums import ECtrlType, EAnnType, EActionCard, EActionCardType, EElementType, ECostType, ELanguage
+from .feature import CropBox, ActionCardHandler, CharacterCardHandler, PairwiseDistances, CandidateMask
 from .feature import ExtractFeature_Control, ExtractFeature_Digit, ExtractFeature_Control_Single
+from .search_engine import AnnoySearchEngine, ExactSearchEngine, CascadeStats, QueryMemo, CreateSearchEngine
+from .binary_database import BinaryDatabase, BinaryDatabaseWriter, SourceDigest, VersionedPath
+from .feature_cache import FeatureCache
 
 def Alert(info):
     print("***** Fatal Error: " + info)
@@ -33,15 +38,15 @@ def SaveImage(image, path, remove_alpha=False):
     cv2.imencode(Path(path).suffix, image)[1].tofile(path)
 
 def CheckHashDistances(test_name, hashs, name_func):
-    n = len(hashs)
-    min_dist = 100000
+    # Pairs (i < j) in row-major order, see hash_analyzer for the full report
+    dists = PairwiseDistances(np.stack([feature.words for feature in hashs]))
+    rows, cols = np.triu_indices(len(hashs), k=1)
+    pair_dists = dists[rows, cols]
+    min_dist = int(pair_dists.min()) if pair_dists.size > 0 else 100000
     close_dists = defaultdict(list)
-    for i in range(n):
-        for j in range(i + 1, n):
-            dist = FeatureDistance(hashs[i], hashs[j])
-            min_dist = min(dist, min_dist)
-            if dist <= cfg.threshold:
-                close_dists[dist].append(f'{i}{name_func(i)} <-----> {j}{name_func(j)}') 
+    for k in np.flatnonzero(pair_dists <= cfg.threshold):
+        i, j = int(rows[k]), int(cols[k])
+        close_dists[int(pair_dists[k])].append(f'{i}{name_func(i)} <-----> {j}{name_func(j)}') 
     
     close_dists = {key: close_dists[key] for key in sorted(close_dists)}
     LogWarning(
@@ -63,6 +68,100 @@ def StringToVariableName(s):
     # Join the words together to form the variable name
     return "".join(words)
 
+# Worker side of the database build. These run in the processes of DatabaseUpdateContext.executor,
+# or in the main process when num_jobs is 1, so that both builds share the exact same code.
+# A failed image load returns None, the main process alerts with the path.
+# Features depend on the image, the other task items and the code of these tasks and of feature.py.
+# FeatureCache keys its entries on all of them, see FeatureParams.
+
+_worker_handlers = {}
+
+def _WorkerCardHandler(handler_type):
+    handler = _worker_handlers.get(handler_type)
+    if handler is None:
+        handler = handler_type()
+        handler.OnResize(CropBox(0, 0, 420, 720))
+        _worker_handlers[handler_type] = handler
+    return handler
+
+def _ExtractControlTask(task):
+    """
+    task: (image_path, single)
+    """
+    image_path, single = task
+    image = LoadImage(image_path)
+    if image is None:
+        return None
+    return ExtractFeature_Control_Single(image) if single else ExtractFeature_Control(image)
+
+def _ExtractDigitTask(task):
+    """
+    task: (image_path,)
+    """
+    image_path, = task
+    image = LoadImage(image_path)
+    if image is None:
+        return None
+    image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGRA)
+    return ExtractFeature_Digit(image)
+
+def _SaveSnapshotTask(task):
+    """
+    task: (image_path, crop_box, snapshot_path)
+    """
+    image_path, crop_box, snapshot_path = task
+    image = LoadImage(image_path)
+    if image is None:
+        return None
+    SaveImage(image[crop_box.top : crop_box.bottom, crop_box.left : crop_box.right], snapshot_path)
+    return snapshot_path
+
+def _ExtractCardTask(task):
+    """
+    task: (handler_type, image_path)
+    """
+    handler_type, image_path = task
+    image = LoadImage(image_path)
+    if image is None:
+        return None
+
+    handler = _WorkerCardHandler(handler_type)
+    handler.frame_buffer = image
+    ahash, dhash = handler.ExtractCardFeatures()
+    return ahash.Copy(), dhash.Copy()
+
+def _ExtractArcaneLegendTask(task):
+    """
+    task: (image_path, (left, top, width, height)) of the card region shown in game
+    """
+    image_path, (left, top, width, height) = task
+    image = LoadImage(image_path)
+    if image is None:
+        return None
+
+    r = min(left + width, 420)
+    b = min(top + height, 720)
+    l = max(left, 0)
+    t = max(top, 0)
+    region = image[t:b, l:r]
+
+    buffer = np.zeros((height, width, 4), dtype=image.dtype)
+    if left < 0:
+        buffer[-top:, -left:] = region
+    else:
+        buffer[:720-top, :420-left] = region
+    buffer = cv2.resize(buffer, (420, 720), interpolation=cv2.INTER_LANCZOS4)
+    # cv2.imshow("name", buffer)
+    # cv2.waitKey(0)
+    handler = _WorkerCardHandler(ActionCardHandler)
+    handler.frame_buffer = buffer
+    ahash, dhash = handler.ExtractCardFeatures()
+    return ahash.Copy(), dhash.Copy()
+
+def _CacheTag(func, task, path):
+    items = [item.__name__ if isinstance(item, type) else repr(item) for item in task if item != path]
+    return "|".join([func.__name__] + items)
+
 class DatabaseUpdateContext:
     def __init__(self):
         self.save_image_assets      = False
@@ -71,19 +170,65 @@ class DatabaseUpdateContext:
         self.num_arcane_legends     = 0
         self.num_artifacts          = 0
         self.num_characters         = 0
+        self.num_jobs               = 1
+        self.executor               = None
+        self.feature_cache          = None
+
+    def Map(self, func, tasks, paths, cached=True):
+        """
+        Run func over tasks, in the worker processes if any.
+        Results are always in the order of tasks, so the database does not depend on num_jobs.
+        With a feature cache, only the tasks missing from it are run.
+        """
+        results = [None] * len(tasks)
+        keys    = [None] * len(tasks)
+        cache   = self.feature_cache if cached else None
+        if cache is not None:
+            for i, (task, path) in enumerate(zip(tasks, paths)):
+                keys[i] = cache.Key(_CacheTag(func, task, path), path)
+                if keys[i] is not None:
+                    results[i] = cache.Get(keys[i])
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        missing_tasks = [tasks[i] for i in missing]
+        if self.executor is None:
+            computed = [func(task) for task in missing_tasks]
+        else:
+            chunksize = max(1, len(missing_tasks) // (self.num_jobs * 4))
+            computed = list(self.executor.map(func, missing_tasks, chunksize=chunksize))
+
+        for i, result in zip(missing, computed):
+            results[i] = result
+            if cache is not None and result is not None and keys[i] is not None:
+                cache.Put(keys[i], result)
+
+        for result, path in zip(results, paths):
+            if result is None:
+                Alert(info=f"Failed to load image: {path}")
+        return results
 
 class Database:
     def __init__(self):
         self.data       = {}
         self.anns       = [None] * EAnnType.ANN_COUNT.value
         self.rounds_ann = None
+        self.binary     = None
+        self.json_path  = None  # set when the db.json fallback is used
+        self.lock       = threading.RLock()
+        self.prefetch_thread = None
+        self.cascade_stats   = CascadeStats()
+        self.query_memo      = QueryMemo(cfg.query_memo_size)
+        self.cost_masks      = {}   # cost digit -> CandidateMask of ACTIONS
 
         Path(cfg.database_dir).mkdir(parents=True, exist_ok=True)
         if cfg.DEBUG:
             Path(cfg.debug_dir).mkdir(parents=True, exist_ok=True)
 
     def __getitem__(self, key):
-        return self.data[key]
+        value = self.data.get(key)
+        if value is None:
+            value = self._LoadData(key)
+        return value
 
     def __setitem__(self, key, value):
         self.data[key] = value
@@ -92,27 +237,19 @@ class Database:
         LogDebug(ctrl_types=[(e.name, e.value) for e in ECtrlType], indent=2)
 
         n_controls = ECtrlType.NUM_CTRLS_ANN.value
-        features = [None] * n_controls
 
         controls_dir = os.path.join(cfg.cards_dir, "controls")
-        for i in range(n_controls):
-            name = ECtrlType(i).name.lower()
-            image = LoadImage(os.path.join(controls_dir, f"control_{name}.png"))
-            feature = ExtractFeature_Control(image)
-            features[i] = feature
+        paths = [os.path.join(controls_dir, f"control_{ECtrlType(i).name.lower()}.png") for i in range(n_controls)]
+        features = ctx.Map(_ExtractControlTask, [(path, False) for path in paths], paths)
 
         ann = self.CreateAndSaveAnn(features, EAnnType.CTRLS)
         self.anns[EAnnType.CTRLS.value] = ann
 
         print(f"Loaded {n_controls} images from {controls_dir}")
 
-        single_ctrls = []    
-        for i in range(ECtrlType.CTRL_SINGLE_FIRST.value, ECtrlType.CTRL_SINGLE_LAST.value + 1):
-            ctrl_type = ECtrlType(i)
-            name = ctrl_type.name.lower()
-            image = LoadImage(os.path.join(controls_dir, f"control_{name}.png"))
-            feature = ExtractFeature_Control_Single(image)
-            single_ctrls.append(f"{ImageHash(feature)}")
+        paths = [os.path.join(controls_dir, f"control_{ECtrlType(i).name.lower()}.png")
+                 for i in range(ECtrlType.CTRL_SINGLE_FIRST.value, ECtrlType.CTRL_SINGLE_LAST.value + 1)]
+        single_ctrls = [f"{feature}" for feature in ctx.Map(_ExtractControlTask, [(path, True) for path in paths], paths)]
         print(f"Added {ECtrlType.NUM_CTRLS_SINGLE.value} ctrl hashs to database")
         self.data["ctrls"] = single_ctrls
 
@@ -122,16 +259,16 @@ class Database:
             game_start_test_path = "temp/test/game_start_frame.png"
             image = LoadImage(game_start_test_path)
             feature = ExtractFeature_Control(image)
-            ctrl_ids, dists = self.SearchByFeature(feature, EAnnType.CTRLS)
-            LogDebug(info=f'{game_start_test_path}, {dists[0]=}, {ECtrlType(ctrl_ids[0]).name}')
+            result = self.SearchByFeature(feature, EAnnType.CTRLS)
+            LogDebug(info=f'{game_start_test_path}, {result.dist=}, {ECtrlType(result.ids[0]).name}')
 
             # Game over test
             from .tasks import GameOverTask
             image = LoadImage(os.path.join(cfg.debug_dir, f"GameOverTest.png"))
             main_content, valid = GameOverTask.CropMainContent(image)
             feature = ExtractFeature_Control(main_content)
-            ctrl_ids, dists = self.SearchByFeature(feature, EAnnType.CTRLS)
-            LogDebug(info=f"GameOverTest, {dists[0]=}, {ECtrlType(ctrl_ids[0]).name}")
+            result = self.SearchByFeature(feature, EAnnType.CTRLS)
+            LogDebug(info=f"GameOverTest, {result.dist=}, {ECtrlType(result.ids[0]).name}")
             SaveImage(main_content, os.path.join(cfg.debug_dir, f"GameOverTest_MainContent.png"))
 
 
@@ -169,16 +306,14 @@ class Database:
         # crop_box2 = CropBox(left, top, left + width, top + height)
         # cfg.feature_crop_box2 = ((crop_box2.left / 420, crop_box2.top / 720, crop_box2.width / 420, crop_box2.height / 720))
 
-        handler = ActionCardHandler()
-        handler.OnResize(CropBox(0, 0, 420, 720))
-
         arcane_legends = []
 
         action_cards_dir = os.path.join(cfg.cards_dir, "actions")
         num_actions = len(csv_data)
         actions  = [None] * num_actions
-        ahashs   = [None] * num_actions
-        dhashs   = [None] * num_actions
+        tasks       = [None] * num_actions
+        image_paths = [None] * num_actions
+        snapshot_tasks = []
         for image_idx, row in enumerate(csv_data):
             card_id = int(row["id"])
             if image_idx < num_sharable:
@@ -187,27 +322,19 @@ class Database:
                 image_file = f'tokens/token_{card_id - num_sharable}_{row["zh-HANS"]}.png'
 
             image_path = os.path.join(action_cards_dir, image_file)
-            image = LoadImage(image_path)
-            if image is None:
-                Alert(info=f"Failed to load image: {image_path}")
-        
-            snapshot_path = os.path.join(
-                cfg.assets_dir, "images", "snapshots", f"{card_id}.jpg")
+            image_paths[card_id] = image_path
+
+            tasks[card_id] = (ActionCardHandler, image_path)
+
             if ctx.save_image_assets:
                 # create snapshot
                 top    = int(row["snapshot_top"])
                 left   = 12
                 height = 150
                 crop_box = CropBox(left, top, 420 - left, top + height)
-                snapshot = image[
-                    crop_box.top  : crop_box.bottom, 
-                    crop_box.left : crop_box.right
-                ]
-                SaveImage(snapshot, snapshot_path)
-
-            handler.frame_buffer = image
-            ahash, dhash = handler.ExtractCardFeatures()
-            # SaveImage(handler.feature_buffer, snapshot_path)
+                snapshot_path = os.path.join(
+                    cfg.assets_dir, "images", "snapshots", f"{card_id}.jpg")
+                snapshot_tasks.append((image_path, crop_box, snapshot_path))
 
             cost_type = row["element"]
             # special case: talent for Attack
@@ -232,14 +359,17 @@ class Database:
                 "cost" : (cost, cost_type),
             }
             if action["type"] == EActionCardType.ArcaneLegend.value:
-                arcane_legends.append((card_id, image))
+                arcane_legends.append((card_id, image_path))
             elif action["type"] == EActionCardType.Artifact.value:
                 ctx.num_artifacts += 1
 
-            ahashs[card_id]   = ahash
-            dhashs[card_id]   = dhash
             actions[card_id]  = action
 
+        features = ctx.Map(_ExtractCardTask, tasks, image_paths)
+        ahashs   = [ahash for ahash, _ in features]
+        dhashs   = [dhash for _, dhash in features]
+        ctx.Map(_SaveSnapshotTask, snapshot_tasks, [task[0] for task in snapshot_tasks], cached=False)
+
         print(f"Loaded {len(ahashs)} images from {action_cards_dir}")
         self.data["actions"] = actions
 
@@ -251,8 +381,8 @@ class Database:
         num_arcane_legends = len(arcane_legends)
         num_extras = num_extra_goldens + num_arcane_legends * 2
         extras = [None] * num_extras
-        ahash_extras = [None] * num_extras
-        dhash_extras = [None] * num_extras
+        tasks  = [None] * num_extras
+        extra_paths = [None] * num_extras
 
         for extra_image_name in extra_image_names:
             info = extra_image_name[:-4] # remove ".png"
@@ -263,44 +393,25 @@ class Database:
                 mapped_id += num_sharable
 
             extra_path = os.path.join(action_cards_dir, "extras", extra_image_name)
-            image = LoadImage(extra_path)
-            if image is None:
-                Alert(info=f"Failed to load image: {extra_path}")
-        
-            handler.frame_buffer = image
-            ahash, dhash = handler.ExtractCardFeatures()
-    
             extras[extra_id] = mapped_id
-            ahash_extras[extra_id] = ahash
-            dhash_extras[extra_id] = dhash
+            tasks[extra_id]  = (ActionCardHandler, extra_path)
+            extra_paths[extra_id] = extra_path
 
         boxes = [
             (-22, 0, 315, 540), # my
             (128, 50, 315, 540), # op
         ]
-        for j, (left, top, width, height) in enumerate(boxes):
-            for i, (mapped_id, image) in enumerate(arcane_legends):
-                r = min(left + width, 420)
-                b = min(top + height, 720)
-                l = max(left, 0)
-                t = max(top, 0)
-                region = image[t:b, l:r]
-
-                buffer = np.zeros((height, width, 4), dtype=image.dtype)
-                if left < 0:
-                    buffer[-top:, -left:] = region
-                else:
-                    buffer[:720-top, :420-left] = region
-                buffer = cv2.resize(buffer, (420, 720), interpolation=cv2.INTER_LANCZOS4)
-                # cv2.imshow("name", buffer)
-                # cv2.waitKey(0)
-                handler.frame_buffer = buffer
-                ahash, dhash = handler.ExtractCardFeatures()
-
+        for j, box in enumerate(boxes):
+            for i, (mapped_id, image_path) in enumerate(arcane_legends):
                 extra_id = j * num_arcane_legends + i + num_extra_goldens
                 extras[extra_id] = mapped_id
-                ahash_extras[extra_id] = ahash
-                dhash_extras[extra_id] = dhash
+                tasks[extra_id]  = (image_path, box)
+                extra_paths[extra_id] = image_path
+
+        features = ctx.Map(_ExtractCardTask, tasks[:num_extra_goldens], extra_paths[:num_extra_goldens])
+        features += ctx.Map(_ExtractArcaneLegendTask, tasks[num_extra_goldens:], extra_paths[num_extra_goldens:])
+        ahash_extras = [ahash for ahash, _ in features]
+        dhash_extras = [dhash for _, dhash in features]
 
         print(f"Added {len(ahash_extras)} extra images = {num_extra_goldens} goldens + {num_arcane_legends} arcane legends * 2")
 
@@ -348,16 +459,16 @@ class Database:
                 handler.OnResize(CropBox(0, 0, width, height))
                 handler.frame_buffer = image
                 ahash, dhash = handler.ExtractCardFeatures()
-                card_ids_a, dists_a = db.SearchByFeature(ahash, EAnnType.ACTIONS_A)
-                card_ids_d, dists_d = db.SearchByFeature(dhash, EAnnType.ACTIONS_D)
+                result_a = self.SearchByFeature(ahash, EAnnType.ACTIONS_A)
+                result_d = self.SearchByFeature(dhash, EAnnType.ACTIONS_D)
 
                 dt = time.perf_counter() - begin_time
-                name_a = actions[card_ids_a[0]]['zh-HANS']
-                name_d = actions[card_ids_d[0]]['zh-HANS']
+                name_a = actions[result_a.ids[0]]['zh-HANS']
+                name_d = actions[result_d.ids[0]]['zh-HANS']
                 LogDebug(
                     indent=2, file=file,
-                    name_a=name_a, card_ids_a=card_ids_a[:3], dists_a=dists_a[:3],
-                    name_d=name_d, card_ids_d=card_ids_d[:3], dists_d=dists_d[:3],
+                    name_a=name_a, card_ids_a=result_a.ids, dists_a=result_a.dists,
+                    name_d=name_d, card_ids_d=result_d.ids, dists_d=result_d.dists,
                     dt=dt, 
                     )
 
@@ -372,11 +483,9 @@ class Database:
             data = [row for row in reader]
         num_characters = len(data)
 
-        handler = CharacterCardHandler()
-        handler.OnResize(CropBox(0, 0, 420, 720))
         characters_dir = os.path.join(cfg.cards_dir, "characters")
-        ahashs  = [None] * num_characters
-        dhashs  = [None] * num_characters
+        tasks       = [None] * num_characters
+        image_paths = [None] * num_characters
 
         talent_to_character = {}
         characters = [None] * num_characters
@@ -384,15 +493,8 @@ class Database:
             card_id = int(row["id"])
 
             image_path = os.path.join(characters_dir, f"character_{card_id}_{row['zh-HANS']}.png")
-            image = LoadImage(image_path)
-            if image is None:
-                Alert(info=f"Failed to load image: {image_path}")
-
-            handler.frame_buffer = image
-            ahash, dhash = handler.ExtractCardFeatures()
-            ahashs[card_id] = ahash
-            dhashs[card_id] = dhash
-            # SaveImage(handler.feature_buffer, snapshot_path)
+            tasks[card_id]       = (CharacterCardHandler, image_path)
+            image_paths[card_id] = image_path
 
             name_langs = {}
             for lang in range(ELanguage.NumELanguages.value):
@@ -421,6 +523,10 @@ class Database:
                     )
                 shutil.copy(src_file, dst_file)
 
+        features = ctx.Map(_ExtractCardTask, tasks, image_paths)
+        ahashs   = [ahash for ahash, _ in features]
+        dhashs   = [dhash for _, dhash in features]
+
         print(f"Loaded {num_characters} images from {characters_dir}")
         self.data["characters"] = characters
         self.data["talent_to_character"] = talent_to_character
@@ -570,12 +676,8 @@ class Database:
         self.data["artifacts_order"] = artifacts_order
 
         # digits
-        digit_hashs = [None] * 20
-        for i in range(20):
-            image = LoadImage(os.path.join(cfg.cards_dir, "digits", f"{i}.png"))
-            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGRA)
-            feature = ExtractFeature_Digit(image)
-            digit_hashs[i] = feature
+        paths = [os.path.join(cfg.cards_dir, "digits", f"{i}.png") for i in range(20)]
+        digit_hashs = ctx.Map(_ExtractDigitTask, [(path,) for path in paths], paths)
         ann_digits = self.CreateAndSaveAnn(digit_hashs, EAnnType.DIGITS)
         self.anns[EAnnType.DIGITS.value] = ann_digits
         if cfg.DEBUG:
@@ -597,57 +699,279 @@ class Database:
                         os.path.join(cfg.assets_dir, "images", 'empty.png'))
 
     def _Update(self, ctx: DatabaseUpdateContext):
-        self._UpdateControls(ctx)
-        self._UpdateActionCards(ctx)
-        self._UpdateCharacters(ctx)
-        self._UpdateExtraInfos(ctx)
+        self._Build(ctx)
         self._UpdateGeneratedEnums(ctx)
 
-        with open(os.path.join(cfg.database_dir, cfg.db_filename), 'w', encoding='utf-8') as f:
-            json.dump(self.data, f, indent=None, ensure_ascii=False)
+        if ctx.feature_cache is not None:
+            ctx.feature_cache.Save()
+            print(f"Feature cache: {ctx.feature_cache.num_reused} images reused, {ctx.feature_cache.num_computed} recomputed")
+
+        self._SaveDatabase()
         
         with open("assets/config.json", 'w') as f:
             json.dump(vars(cfg), f, indent=2, ensure_ascii=False)
 
+    def _Build(self, ctx: DatabaseUpdateContext):
+        """
+        Build the data and the indexes from the card images, the .ann files are saved to cfg.database_dir.
+        """
+        if ctx.num_jobs > 1:
+            # Image decode and hashing go to the workers, the rest of the build stays serial
+            with ProcessPoolExecutor(max_workers=ctx.num_jobs) as executor:
+                ctx.executor = executor
+                self._UpdateControls(ctx)
+                self._UpdateActionCards(ctx)
+                self._UpdateCharacters(ctx)
+            ctx.executor = None
+        else:
+            self._UpdateControls(ctx)
+            self._UpdateActionCards(ctx)
+            self._UpdateCharacters(ctx)
+        self._UpdateExtraInfos(ctx)
+
+    def _SaveDatabase(self):
+        with open(os.path.join(cfg.database_dir, cfg.db_filename), 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=None, ensure_ascii=False)
+        self.SaveBinary()
+
+    def SaveBinary(self):
+        """
+        Pack hashes and data into the memory-mapped format read by Load.
+        db.json and the .ann files are still written, the app and the fallback loader use them,
+        and the file is named after their digest.
+        """
+        source_digest = self._SourceDigest()
+        writer = BinaryDatabaseWriter(cfg.hash_size, source_digest)
+        for i in range(EAnnType.ANN_COUNT.value):
+            ann_type = EAnnType(i)
+            writer.AddHashes(ann_type.name.lower(), self.GetEngine(ann_type).GetMatrix())
+        for key, value in self.data.items():
+            writer.AddData(key, value)
+        binary_path = self._BinaryPath(source_digest)
+        writer.Save(binary_path)
+
+        # Files of older digests, the ones still mapped by a running watcher are removed by a later build
+        root, ext = os.path.splitext(os.path.join(cfg.database_dir, cfg.db_binary_filename))
+        for path in glob.glob(f"{root}.*{ext}"):
+            if os.path.normpath(path) != os.path.normpath(binary_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
     def Load(self):
+        """
+        Only open the database here. Indexes and data sections are loaded on first access,
+        call Prefetch to load the ones needed later in background.
+        """
+        # db.json or the .ann files may have changed since the binary database was converted,
+        # then it has another digest and the files are loaded instead
+        source_digest = self._SourceDigest()
+        binary_path = self._BinaryPath(source_digest)
+        if os.path.exists(binary_path):
+            try:
+                self.binary = BinaryDatabase(binary_path, cfg.hash_size, source_digest)
+            except ValueError as e:
+                LogWarning(info=f"Failed to load {binary_path}, fallback to {cfg.db_filename}", error=str(e))
+        else:
+            LogWarning(info=f"No binary database of the current database files, fallback to {cfg.db_filename}")
+
+        if self.binary is None:
+            self.json_path = os.path.join(cfg.database_dir, cfg.db_filename)
+
+    def Prefetch(self, ann_types, keys=()):
+        """
+        Load the given indexes and data sections in a background thread.
+        Accessing them before it finishes just waits for the same lock.
+        """
+        def _Prefetch():
+            begin_time = time.perf_counter()
+            for ann_type in ann_types:
+                self.GetEngine(ann_type)
+            for key in keys:
+                self[key]
+            LogDebug(info="[Database] prefetched", 
+                     anns=[ann_type.name for ann_type in ann_types], keys=list(keys), 
+                     dt=time.perf_counter() - begin_time)
+
+        self.prefetch_thread = threading.Thread(target=_Prefetch, name="DatabasePrefetch", daemon=True)
+        self.prefetch_thread.start()
+
+    def LoadAll(self):
+        """
+        Resolve every index and data section now, so that later accesses never load anything.
+        """
+        for i in range(EAnnType.ANN_COUNT.value):
+            self.GetEngine(EAnnType(i))
+        if self.binary is not None:
+            for key in self.binary.DataNames():
+                self[key]
+        if self.json_path is not None:
+            self._LoadData("ctrls")
+
+    def GetEngine(self, ann_type):
+        engine = self.anns[ann_type.value]
+        if engine is None:
+            with self.lock:
+                engine = self.anns[ann_type.value]
+                if engine is None:
+                    engine = self._LoadEngine(ann_type)
+                    self.anns[ann_type.value] = engine
+        return engine
+
+    def GetCostMask(self, cost):
+        """
+        CandidateMask of the ACTIONS items showing the cost digit, partitioned by CardCost,
+        plus the items whose shown digit may differ from it.
+        """
+        mask = self.cost_masks.get(cost)
+        if mask is None:
+            costs, cost_modified = self._ActionCostDigits()
+            mask = CandidateMask((costs == cost) | cost_modified)
+            self.cost_masks[cost] = mask
+        return mask
+
+    def _ActionCostDigits(self):
+        """
+        Cost of each ACTIONS item, extras have the cost of their card,
+        and whether the shown digit may differ from it.
+        """
+        actions = self["actions"]
+        card_ids = list(range(EActionCard.NumActions.value)) + list(self["extras"])
+        costs = np.array([actions[card_id]["cost"][0] for card_id in card_ids], dtype=np.int32)
+
+        # Talents of attacks have split costs, which are summed in CardCost.
+        # Negative costs are unknown ones.
+        attack_types = [ECostType[f"{element.name}Attack"].value for element in EElementType]
+        cost_types = np.array([actions[card_id]["cost"][1] for card_id in card_ids], dtype=np.int32)
+        cost_modified = np.isin(cost_types, attack_types) | (costs < 0)
+
+        # Talents and equipments are the usual targets of cost reductions, e.g. of locations and companions
+        discounted_types = [EActionCardType.Talent.value, EActionCardType.Artifact.value, EActionCardType.Catalyst.value,
+                            EActionCardType.Bow.value, EActionCardType.Claymore.value, EActionCardType.Polearm.value,
+                            EActionCardType.Sword.value]
+        card_types = np.array([actions[card_id]["type"] for card_id in card_ids], dtype=np.int32)
+        cost_modified |= np.isin(card_types, discounted_types)
+        return costs, cost_modified
+
+    def _LoadEngine(self, ann_type):
+        engine = CreateSearchEngine(ann_type)
+        if (self.binary is not None) and isinstance(engine, ExactSearchEngine):
+            # Zero copy, the matrix is a view of the mapped file
+            engine.SetMatrix(self.binary.Hashes(ann_type.name.lower()))
+            return engine
+        return engine.Load(self._AnnPath(ann_type))
+
+    def _LoadData(self, key):
+        with self.lock:
+            if key in self.data:
+                return self.data[key]
+
+            if (self.binary is not None) and self.binary.HasData(key):
+                self.data[key] = self.binary.Data(key)
+            elif self.json_path is not None:
+                # db.json can only be parsed as a whole, keep what has been set already
+                with open(self.json_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.json_path = None
+                for k, v in data.items():
+                    self.data.setdefault(k, v)
+            return self.data[key]
+
+    def _LoadFiles(self):
+        """
+        Eagerly load db.json and all .ann files, ignoring the binary database.
+        """
         n_anns = EAnnType.ANN_COUNT.value
         for i in range(n_anns):
-            hash_size = GetHashSize(EAnnType(i))
-            ann_index_len = hash_size * hash_size
-            ann = AnnoyIndex(ann_index_len, cfg.ann_metric)
-            ann_filename = f"{EAnnType(i).name.lower()}.ann"
-            ann.load(os.path.join(cfg.database_dir, ann_filename))
-            self.anns[i] = ann
+            ann_type = EAnnType(i)
+            self.anns[i] = CreateSearchEngine(ann_type).Load(self._AnnPath(ann_type))
 
         with open(os.path.join(cfg.database_dir, cfg.db_filename), 'r', encoding='utf-8') as f:
             self.data = json.load(f)
+
+    def _BinaryPath(self, source_digest=None):
+        if source_digest is None:
+            source_digest = self._SourceDigest()
+        return VersionedPath(os.path.join(cfg.database_dir, cfg.db_binary_filename), source_digest)
+
+    def _SourceDigest(self):
+        paths = [os.path.join(cfg.database_dir, cfg.db_filename)]
+        paths += [self._AnnPath(EAnnType(i)) for i in range(EAnnType.ANN_COUNT.value)]
+        return SourceDigest(paths, cfg.hash_size)
     
-    def CreateAndSaveAnn(self, features, ann_type):
-        hash_size = GetHashSize(ann_type)
-        index_len = hash_size * hash_size
-        ann = AnnoyIndex(index_len, cfg.ann_metric)
-        for i in range(len(features)):
-            ann.add_item(i, features[i])
-        ann.build(cfg.ann_n_trees)
+    def _AnnPath(self, ann_type):
         ann_filename = f"{ann_type.name.lower()}.ann"
-        ann.save(os.path.join(cfg.database_dir, ann_filename))
-        return ann
+        return os.path.join(cfg.database_dir, ann_filename)
 
-    def SearchByFeature(self, feature, ann_type):
-        ann = self.anns[ann_type.value]
-
-        # !!!!! Must use a large n, or it may not find the optimal result !!!!!
-        ids, dists = ann.get_nns_by_vector(feature, n=20, include_distances=True)
-        return ids, dists
+    def CreateAndSaveAnn(self, features, ann_type):
+        # Annoy files are always saved, they are the shipped index format
+        ann = AnnoySearchEngine(ann_type).Build(features)
+        ann.Save(self._AnnPath(ann_type))
+
+        engine = CreateSearchEngine(ann_type)
+        if isinstance(engine, AnnoySearchEngine):
+            return ann
+        return engine.Build(features)
+
+    def SearchByFeature(self, feature, ann_type, bound=None, mask=None):
+        """
+        Return a SearchResult of the nearest items, which must not be modified, it may be shared through query_memo.
+        bound: results farther than it may be inexact, see SearchEngine.Search
+        mask : CandidateMask of the only ids to search
+        """
+        key = QueryMemo.Key(ann_type, feature.words, bound, mask)
+        result = self.query_memo.Get(key)
+        if result is None:
+            engine = self.GetEngine(ann_type)
+            result = engine.SearchNearest(feature, bound=bound, mask=mask)
+            self.query_memo.Put(key, result)
+        return result
     
+    def SearchByFeatureBatch(self, features, ann_type, bound=None, mask=None):
+        """
+        features: packed hashes, shape (N, num_words)
+        Return a list of SearchResult, one for each row. Only the rows missing from query_memo are searched.
+        """
+        keys    = [QueryMemo.Key(ann_type, words, bound, mask) for words in features]
+        results = [self.query_memo.Get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            engine = self.GetEngine(ann_type)
+            for i, result in zip(missing, engine.SearchNearestBatch(features[missing], bound=bound, mask=mask)):
+                results[i] = result
+                self.query_memo.Put(keys[i], result)
+        return results
+
     def GetFeatureById(self, target_id, ann_type):
-        ann = self.anns[ann_type.value]
-        return np.array(ann.get_item_vector(target_id))
+        engine = self.GetEngine(ann_type)
+        return engine.GetFeatureById(target_id)
 
 if __name__ == '__main__':
+    import argparse
     import sys
+    parser = argparse.ArgumentParser()
+    parser.add_argument("mode", nargs="?", choices=["image", "binary"],
+                        help="image: also save image assets, binary: only convert the current files to the binary database")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of worker processes for image decode and hashing, 1 builds in this process")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="recompute all features instead of reusing the unchanged ones from the feature cache")
+    args = parser.parse_args()
+
+    if args.mode == "binary":
+        # Only convert the current db.json and .ann files, without rebuilding from images
+        db = Database()
+        db._LoadFiles()
+        db.SaveBinary()
+        print(f"Binary database saved to {db._BinaryPath()}.")
+        sys.exit(0)
+
     ctx = DatabaseUpdateContext()
-    ctx.save_image_assets = (len(sys.argv) > 1 and sys.argv[1] == "image")
+    ctx.save_image_assets = (args.mode == "image")
+    ctx.num_jobs          = max(1, args.jobs)
+    if not args.no_cache:
+        ctx.feature_cache = FeatureCache(cfg.feature_cache_path)
 
     db = Database()
     db._Update(ctx)
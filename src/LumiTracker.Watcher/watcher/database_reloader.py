@@ -0,0 +1,86 @@
+import glob
+import os
+import threading
+import time
+
+from .config import cfg, LogDebug, LogError
+from .database import Database
+
+class DatabaseReloader:
+    """
+    Build a new Database in background when the database files change, or when Request is called.
+    The running one is never modified: FrameManager swaps the new one in between frames,
+    after it is fully loaded, so a frame only ever sees one complete database.
+    """
+    def __init__(self):
+        # Binary databases are named after the digest of the files, see Database.SaveBinary
+        root, ext = os.path.splitext(os.path.join(cfg.database_dir, cfg.db_binary_filename))
+        self.json_path       = os.path.join(cfg.database_dir, cfg.db_filename)
+        self.binary_pattern  = f"{root}.*{ext}"
+        self.loaded_stamps   = self._Stamps()
+        self.pending_stamps  = self.loaded_stamps
+        self.next_check_time = time.perf_counter() + cfg.db_watch_interval
+
+        self.requested       = False
+        self.request_time    = 0.0
+        self.thread          = None
+        self.result          = None  # (db, build_time), set by the build thread
+
+    def _Stamps(self):
+        stamps = []
+        for path in [self.json_path] + sorted(glob.glob(self.binary_pattern)):
+            try:
+                stat = os.stat(path)
+                stamps.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stamps.append((path, None))
+        return stamps
+
+    def Request(self):
+        if not self.requested:
+            self.requested    = True
+            self.request_time = time.perf_counter()
+
+    def Poll(self):
+        """
+        Called between frames. Return (db, build_time, latency) when a new database is ready, otherwise None.
+        latency: seconds from the request to now
+        """
+        cur_time = time.perf_counter()
+        if self.thread is not None:
+            if self.thread.is_alive():
+                return None
+            self.thread = None
+            result, self.result = self.result, None
+            if result is None:
+                return None
+            db, build_time = result
+            return db, build_time, cur_time - self.request_time
+
+        if cur_time >= self.next_check_time:
+            self.next_check_time = cur_time + cfg.db_watch_interval
+            # A build writes several files, wait until they stay the same for one interval
+            stamps = self._Stamps()
+            if stamps != self.loaded_stamps and stamps == self.pending_stamps:
+                LogDebug(info="[DatabaseReloader] Database files changed.")
+                self.Request()
+            self.pending_stamps = stamps
+
+        if self.requested:
+            self.requested      = False
+            self.loaded_stamps  = self._Stamps()
+            self.pending_stamps = self.loaded_stamps
+            self.thread = threading.Thread(target=self._Build, name="DatabaseReload", daemon=True)
+            self.thread.start()
+        return None
+
+    def _Build(self):
+        begin_time = time.perf_counter()
+        try:
+            db = Database()
+            db.Load()
+            db.LoadAll()
+        except Exception as e:
+            LogError(info=f"[DatabaseReloader] Failed to load the new database, keep the current one: {e}")
+            return
+        self.result = (db, time.perf_counter() - begin_time)
@@ -0,0 +1,66 @@
+import numpy as np
+import base64
+import binascii
+
+from .enums import EActionCard
+from .feature import ActionCardHandler, CandidateMask
+
+NUM_DECK_CHARACTERS = 3
+NUM_DECK_CARDS      = 33  # characters and actions
+
+def DecodeShareCode(sharecode, db):
+    """
+    Port of DeckUtils.DecodeShareCode of the backend.
+    Return (character_ids, action_ids) of internal ids, -1 for unknown share ids, or None if sharecode is invalid.
+    Reference: https://gist.github.com/zyr17/36aae02c77d02602d6089f967027372a#file-deck_str_to_cards_4_2-py
+    """
+    try:
+        code = base64.b64decode(sharecode, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    if len(code) != 51:
+        return None
+
+    # 1. subtract the obfuscation code
+    LENGTH = 50
+    key  = code[LENGTH]
+    code = [(b - key) & 0xff for b in code[:LENGTH]]
+
+    # 2. swap the bytes
+    swapped = [0] * LENGTH
+    for i in range(LENGTH):
+        swapped[i // 2 + ((LENGTH // 2) if (i & 0x1) else 0)] = code[i]
+
+    # 3. decode by 12-bits stride, 4. share id to internal id
+    share_to_internal = db["share_to_internal"]
+    ids = []
+    for i in range(NUM_DECK_CARDS):
+        bit_index  = i * 12
+        cur_byte   = swapped[bit_index >> 3]
+        next_byte  = swapped[(bit_index >> 3) + 1]
+        if (bit_index & 0x7) == 0:
+            share_id = (cur_byte << 4 | next_byte >> 4) & 0xfff
+        else:
+            share_id = ((cur_byte & 0x0f) << 8 | next_byte) & 0xfff
+
+        internal_id = -1
+        if 0 < share_id < len(share_to_internal):
+            internal_id = share_to_internal[share_id]
+            internal_id = (-internal_id - 1) if internal_id < 0 else (internal_id - 1)
+        ids.append(internal_id)
+
+    return ids[:NUM_DECK_CHARACTERS], ids[NUM_DECK_CHARACTERS:]
+
+def DeckCandidateMask(action_ids, db, game_event):
+    """
+    CandidateMask of the cards that can come from a deck: its actions, their extras,
+    and the non-sharable cards, which are tokens and cards generated during the game.
+    """
+    num_actions = EActionCard.NumActions.value
+    in_deck = np.zeros((num_actions,), dtype=bool)
+    in_deck[[card_id for card_id in action_ids if 0 <= card_id < num_actions]] = True
+    in_deck[EActionCard.NumSharables.value:] = True
+
+    extras  = np.array(list(db["extras"]), dtype=np.int64)
+    allowed = np.concatenate([in_deck, in_deck[extras]])
+    return CandidateMask(allowed & ActionCardHandler.CandidateMaskOf(game_event).mask)
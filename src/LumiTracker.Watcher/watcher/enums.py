@@ -61,6 +61,8 @@ class ETurn(enum.Enum):
 
 class EInputType(enum.Enum):
     CaptureTest       = 0
+    ReloadDatabase    = enum.auto()
+    MyDeck            = enum.auto()
 
     NumInputTypes     = enum.auto()
     Invalid           = NumInputTypes
@@ -211,6 +213,15 @@ class EAnnType(enum.Enum):
 
     ANN_COUNT    = enum.auto()
 
+class ESearchEngine(enum.Enum):
+    Annoy = 0
+    Exact = enum.auto()
+
+class EFrameQueuePolicy(enum.Enum):
+    DropOldest = 0
+    DropNewest = enum.auto()
+    Block      = enum.auto()
+
 class EActionCardType(enum.Enum):
     Talent       = 0
     Token        = enum.auto()
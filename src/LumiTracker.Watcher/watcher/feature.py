@@ -6,6 +6,9 @@ from .config import LogWarning, cfg, LogDebug, override
 from .enums import EAnnType, EActionCard, ECharacterCard, ECtrlType, EGameEvent
 
 import itertools
+import functools
+import weakref
+from collections import OrderedDict
 
 class Counter:
     def __init__(self, data=None):
@@ -78,56 +81,184 @@ def GetHashSize(ann_type):
     # else:
     #     return 10
 
+_POPCOUNT_TABLE   = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+_POPCOUNT_TABLE16 = (_POPCOUNT_TABLE[np.arange(65536) >> 8] + _POPCOUNT_TABLE[np.arange(65536) & 0xFF]).astype(np.uint8)
+
+def PopcountWords(words):
+    """
+    Popcount of each uint64 in a contiguous array, same shape.
+    The four 16-bit counts of a word are summed in a uint32 lane with one multiplication.
+    """
+    counts = np.take(_POPCOUNT_TABLE16, words.view(np.uint16))
+    return (counts.view(np.uint32) * np.uint32(0x01010101)) >> np.uint32(24)
+
 class ImageHash:
     """
     Hash encapsulation. Can be used for dictionary keys and comparisons.
     Reference: https://github.com/JohannesBuchner/imagehash/blob/master/imagehash/__init__.py
+
+    Bits are packed into uint64 words, most significant word first, so that a
+    100-bit hash (hash_size=10) takes two words. The bit order matches the hex
+    string, i.e. the first bit of the flattened array is the most significant bit.
     """
+    __slots__ = ("words", "num_bits")
 
-    def _binary_array_to_hex(arr):
+    WORD_BITS = 64
+    # Shift of each bit of a word, most significant bit first
+    WORD_SHIFTS = np.arange(WORD_BITS - 1, -1, -1, dtype=np.uint64)
+
+    def __init__(self, words, num_bits):
+        self.words    = words
+        self.num_bits = num_bits
+
+    @staticmethod
+    def NumWords(num_bits):
+        return (num_bits + ImageHash.WORD_BITS - 1) // ImageHash.WORD_BITS
+
+    @staticmethod
+    def PackBits(bits):
         """
-        internal function to make a hex string out of a binary array.
+        Pack the last axis of a bool array into uint64 words, shape (..., num_words).
         """
-        bit_string = ''.join(str(b) for b in 1 * arr.flatten())
-        width = int(np.ceil(len(bit_string) / 4))
-        return '{:0>{width}x}'.format(int(bit_string, 2), width=width)
-
-    def __init__(self, binary_array):
-        self.hash = binary_array
+        num_bits  = bits.shape[-1]
+        num_words = ImageHash.NumWords(num_bits)
+        pad = num_words * ImageHash.WORD_BITS - num_bits
+        if pad > 0:
+            bits = np.concatenate((np.zeros(bits.shape[:-1] + (pad,), dtype=bool), bits), axis=-1)
+        packed = np.packbits(bits, axis=-1)
+        return packed.view(">u8").astype(np.uint64)
+
+    @staticmethod
+    def PackBitsInto(bits, shifted, words):
+        """
+        Same as PackBits without allocating, for bits already padded to whole words.
+        bits: bool, shape (..., num_words * WORD_BITS)
+        shifted: preallocated uint64, shape (..., num_words, WORD_BITS)
+        words: preallocated uint64 output, shape (..., num_words)
+        """
+        np.copyto(shifted, bits.reshape(shifted.shape))
+        np.left_shift(shifted, ImageHash.WORD_SHIFTS, out=shifted)
+        np.bitwise_or.reduce(shifted, axis=-1, out=words)
+
+    @staticmethod
+    def FromBits(binary_array):
+        binary_array = np.asarray(binary_array, dtype=bool).ravel()
+        return ImageHash(ImageHash.PackBits(binary_array), binary_array.size)
+
+    @staticmethod
+    def FromHex(hash_str, num_bits=None):
+        if num_bits is None:
+            num_bits = len(hash_str) * 4
+        value     = int(hash_str, 16)
+        num_words = ImageHash.NumWords(num_bits)
+        mask      = (1 << ImageHash.WORD_BITS) - 1
+        words     = [(value >> (ImageHash.WORD_BITS * (num_words - 1 - i))) & mask for i in range(num_words)]
+        return ImageHash(np.array(words, dtype=np.uint64), num_bits)
+
+    def Copy(self):
+        return ImageHash(self.words.copy(), self.num_bits)
+
+    def ToBits(self):
+        bits = np.unpackbits(self.words.astype(">u8").view(np.uint8))
+        return bits[bits.size - self.num_bits:].astype(bool)
 
     def __str__(self):
-        return ImageHash._binary_array_to_hex(self.hash.flatten())
+        value = 0
+        for word in self.words:
+            value = (value << ImageHash.WORD_BITS) | int(word)
+        width = (self.num_bits + 3) // 4
+        return '{:0>{width}x}'.format(value, width=width)
 
     def __repr__(self):
-        return repr(self.hash)
+        return f"ImageHash({self}, num_bits={self.num_bits})"
 
     def __sub__(self, other):
         # type: (ImageHash) -> int
         if other is None:
             raise TypeError('Other hash must not be None.')
-        if self.hash.size != other.hash.size:
-            raise TypeError('ImageHashes must be of the same shape.', self.hash.shape, other.hash.shape)
-        return np.count_nonzero(self.hash.flatten() != other.hash.flatten())
+        if self.num_bits != other.num_bits:
+            raise TypeError('ImageHashes must be of the same length.', self.num_bits, other.num_bits)
+        return int(_POPCOUNT_TABLE[np.bitwise_xor(self.words, other.words).view(np.uint8)].sum())
 
     def __eq__(self, other):
         # type: (object) -> bool
-        if other is None:
+        if not isinstance(other, ImageHash):
             return False
-        return np.array_equal(self.hash.flatten(), other.hash.flatten())  # type: ignore
+        return self.num_bits == other.num_bits and bool(np.array_equal(self.words, other.words))
 
     def __ne__(self, other):
         # type: (object) -> bool
-        if other is None:
-            return False
-        return not np.array_equal(self.hash.flatten(), other.hash.flatten())  # type: ignore
+        return not self.__eq__(other)
 
     def __hash__(self):
-        # this returns a 8 bit integer, intentionally shortening the information
-        return sum([2**(i % 8) for i, v in enumerate(self.hash.flatten()) if v])
+        return hash((self.num_bits, self.words.tobytes()))
 
     def __len__(self):
         # Returns the bit length of the hash
-        return self.hash.size
+        return self.num_bits
+
+def HammingDistances(feature, matrix):
+    """
+    Hamming distances between a hash and each row of a packed matrix (N, num_words).
+    """
+    xor = np.bitwise_xor(matrix, feature.words)
+    return PopcountWords(xor).sum(axis=-1, dtype=np.int32)
+
+def HammingDistancesBatch(features, matrix):
+    """
+    Hamming distances between each row of packed features (N, num_words) and each row of matrix (M, num_words).
+    Return shape: (N, M)
+    """
+    xor = np.bitwise_xor(features[:, None, :], matrix[None, :, :])
+    return PopcountWords(xor).sum(axis=-1, dtype=np.int32)
+
+def PairwiseDistances(matrix, block_size=256):
+    """
+    Hamming distances between all rows of a packed matrix (N, num_words), shape (N, N).
+    Rows are compared in blocks, which bounds the (block_size, N, num_words) intermediate.
+    """
+    n = matrix.shape[0]
+    dists = np.empty((n, n), dtype=np.int32)
+    for begin in range(0, n, block_size):
+        dists[begin : begin + block_size] = HammingDistancesBatch(matrix[begin : begin + block_size], matrix)
+    return dists
+
+COARSE_SIZE = 8
+COARSE_BITS = COARSE_SIZE * COARSE_SIZE
+
+def CoarseWords(words, num_bits):
+    """
+    Top-left 8x8 low-frequency corner of square hashes, packed into one uint64 word.
+    words: packed hashes, shape (..., num_words). Return shape: (..., 1)
+
+    The coarse bits are a subset of the full bits, so the coarse Hamming distance
+    is a lower bound of the full one, and can be used to prefilter without misses.
+    """
+    hash_size = int(round(num_bits ** 0.5))
+    bits = np.unpackbits(np.ascontiguousarray(words.astype(">u8")).view(np.uint8), axis=-1)[..., -num_bits:]
+    bits = bits.reshape(bits.shape[:-1] + (hash_size, hash_size))[..., :COARSE_SIZE, :COARSE_SIZE]
+    return ImageHash.PackBits(bits.reshape(bits.shape[:-2] + (COARSE_BITS,)).astype(bool))
+
+def CoarseHash(feature):
+    """
+    Same as CoarseWords for a single hash, with integer shifts instead of unpacking every bit.
+    """
+    value = 0
+    for word in feature.words:
+        value = (value << ImageHash.WORD_BITS) | int(word)
+    hash_size = int(round(feature.num_bits ** 0.5))
+    row_mask  = (1 << COARSE_SIZE) - 1
+    coarse    = 0
+    for row in range(COARSE_SIZE):
+        shift  = feature.num_bits - row * hash_size - COARSE_SIZE
+        coarse = (coarse << COARSE_SIZE) | ((value >> shift) & row_mask)
+    return ImageHash(np.array([coarse], dtype=np.uint64), COARSE_BITS)
+
+def CoarseDistances(coarse, coarse_words):
+    """
+    Hamming distances between a coarse hash and a column of coarse words (N,).
+    """
+    return PopcountWords(np.bitwise_xor(coarse_words, coarse.words[0]))
 
 def AHash(gray_image, hash_size=8, mean=np.median):
     """
@@ -143,7 +274,7 @@ def AHash(gray_image, hash_size=8, mean=np.median):
 
     avg = mean(gray_image)
     diff = gray_image > avg
-    return ImageHash(diff)
+    return ImageHash.FromBits(diff)
 
 def DHash(gray_image, hash_size=8):
     """
@@ -160,7 +291,7 @@ def DHash(gray_image, hash_size=8):
     # compute differences between columns
     diff = gray_image[:, 1:] > gray_image[:, :-1]
 
-    return ImageHash(diff)
+    return ImageHash.FromBits(diff)
 
 
 def DHashVertical(gray_image, hash_size=8):
@@ -178,7 +309,92 @@ def DHashVertical(gray_image, hash_size=8):
     # compute differences between rows
     diff = gray_image[1:, :] > gray_image[:-1, :]
 
-    return ImageHash(diff)
+    return ImageHash.FromBits(diff)
+
+@functools.lru_cache(maxsize=None)
+def DCTBasis(size, num_coeffs):
+    """
+    First num_coeffs rows of the orthonormal DCT-II matrix, same scaling as cv2.dct.
+    Shape: (num_coeffs, size), cached per input size.
+    """
+    n = np.arange(size, dtype=np.float64)
+    k = np.arange(num_coeffs, dtype=np.float64)[:, None]
+    basis = np.cos(np.pi * (2.0 * n + 1.0) * k / (2.0 * size)) * np.sqrt(2.0 / size)
+    basis[0] *= np.sqrt(0.5)
+    basis.setflags(write=False)
+    return basis
+
+def LowFreqDCT(gray_image, num_rows, num_cols, scratch=None):
+    """
+    Compute only dct[:num_rows, :num_cols] as two small matrix products,
+    instead of running a full cv2.dct and discarding most of it.
+    """
+    height, width = gray_image.shape[:2]
+    if scratch is None:
+        return DCTBasis(height, num_rows) @ gray_image @ DCTBasis(width, num_cols).T
+
+    np.copyto(scratch.resized64, gray_image)
+    np.matmul(DCTBasis(height, num_rows), scratch.resized64, out=scratch.row_dct)
+    np.matmul(scratch.row_dct, DCTBasis(width, num_cols).T, out=scratch.dct)
+    return scratch.dct
+
+class FeatureScratch:
+    """
+    Preallocated buffers for ExtractFeature_ActionCard_Grayed, 
+    so that a card handler does not allocate image buffers every frame.
+    """
+    def __init__(self, height, width):
+        hash_size = GetHashSize(EAnnType.ACTIONS_A)
+        w, h = cfg.feature_image_size
+
+        self.equalized  = np.zeros((height, width), dtype=np.uint8)
+        self.normalized = np.zeros((height, width), dtype=np.float32)
+        self.resized    = np.zeros((h, w), dtype=np.float32)
+        self.resized64  = np.zeros((h, w), dtype=np.float64)
+        self.row_dct    = np.zeros((hash_size + 1, w), dtype=np.float64)
+        self.dct        = np.zeros((hash_size + 1, hash_size), dtype=np.float64)
+        self.median     = np.zeros((hash_size * hash_size,), dtype=np.float64)
+        self.threshold  = np.zeros((1, 1), dtype=np.float64)
+
+        # The hashes are packed into these words, which are overwritten by the next extraction
+        num_bits  = hash_size * hash_size
+        num_words = ImageHash.NumWords(num_bits)
+        self.bits       = np.zeros((2, num_words * ImageHash.WORD_BITS), dtype=bool)
+        self.ahash_bits = self.bits[0, -num_bits:].reshape(hash_size, hash_size)
+        self.dhash_bits = self.bits[1, -num_bits:].reshape(hash_size, hash_size)
+        self.shifted    = np.zeros((2, num_words, ImageHash.WORD_BITS), dtype=np.uint64)
+        self.words      = np.zeros((2, num_words), dtype=np.uint64)
+        self.ahash      = ImageHash(self.words[0], num_bits)
+        self.dhash      = ImageHash(self.words[1], num_bits)
+
+class FeatureBatchScratch:
+    """
+    Preallocated buffers for CardHandler.ExtractCardFeaturesBatch, stacked along the first axis.
+    """
+    def __init__(self, num_cards, height, width):
+        hash_size = GetHashSize(EAnnType.ACTIONS_A)
+        w, h = cfg.feature_image_size
+
+        self.num_cards  = num_cards
+        self.gray       = np.zeros((num_cards, height, width), dtype=np.uint8)
+        self.equalized  = np.zeros((num_cards, height, width), dtype=np.uint8)
+        self.normalized = np.zeros((num_cards, height, width), dtype=np.float32)
+        self.resized    = np.zeros((num_cards, h, w), dtype=np.float32)
+        self.resized64  = np.zeros((num_cards, h, w), dtype=np.float64)
+        self.row_dct    = np.zeros((num_cards, hash_size + 1, w), dtype=np.float64)
+        self.dct        = np.zeros((num_cards, hash_size + 1, hash_size), dtype=np.float64)
+
+def ScratchMedian(values, buffer):
+    """
+    Same result as np.median(values), but partitions in a preallocated flat buffer.
+    """
+    np.copyto(buffer.reshape(values.shape), values)
+    k = buffer.size // 2
+    buffer.partition(k)
+    if buffer.size % 2 == 1:
+        return buffer[k]
+    # after partition, the lower middle value is the max of the left part
+    return (buffer[:k].max() + buffer[k]) / 2.0
 
 def PHash_A(gray_image, hash_size=8):
     """
@@ -203,9 +419,9 @@ def PHash_A(gray_image, hash_size=8):
     med = np.median(dctlowfreq)
     diff = dctlowfreq > med
     
-    return ImageHash(diff)
+    return ImageHash.FromBits(diff)
 
-def PHash_D(gray_image, hash_size=8):
+def PHash_D(gray_image, hash_size=8, full_dct=False):
     """
     Perceptual Hash computation.
 
@@ -222,15 +438,18 @@ def PHash_D(gray_image, hash_size=8):
     # resize
     gray_image = cv2.resize(gray_image, (hash_size, hash_size + 1), interpolation=cv2.INTER_AREA)
     
-    dct = cv2.dct(gray_image)
+    if full_dct:
+        dct = cv2.dct(gray_image)
+    else:
+        dct = LowFreqDCT(gray_image, hash_size + 1, hash_size)
 
     # dhash vertical
     dctlowfreq = dct[:hash_size + 1, :hash_size]
     diff = dctlowfreq[1:, :] > dctlowfreq[:-1, :]
     
-    return ImageHash(diff)
+    return ImageHash.FromBits(diff)
 
-def MultiPHash(gray_image, target_size, hash_size=8):
+def MultiPHash(gray_image, target_size, hash_size=8, full_dct=False, scratch=None):
     """
     Perceptual Hash computation.
 
@@ -247,23 +466,64 @@ def MultiPHash(gray_image, target_size, hash_size=8):
     # resize
     w, h = target_size
     interpolation = cv2.INTER_LINEAR if gray_image.shape[0] < h else cv2.INTER_AREA
-    gray_image = cv2.resize(gray_image, (w, h), interpolation=interpolation)
+    if scratch is None:
+        gray_image = cv2.resize(gray_image, (w, h), interpolation=interpolation)
+    else:
+        gray_image = cv2.resize(gray_image, (w, h), dst=scratch.resized, interpolation=interpolation)
     
-    dct = cv2.dct(gray_image)
+    # Only the top-left (hash_size + 1) x hash_size coefficients are used
+    if full_dct:
+        dct = cv2.dct(gray_image)
+    else:
+        dct = LowFreqDCT(gray_image, hash_size + 1, hash_size, scratch=scratch)
+
+    if scratch is not None:
+        # ahash
+        scratch.threshold[...] = ScratchMedian(dct[:hash_size, :hash_size], scratch.median)
+        np.greater(dct[:hash_size, :hash_size], scratch.threshold, out=scratch.ahash_bits)
+        # dhash vertical
+        np.greater(dct[1:hash_size + 1, :hash_size], dct[:hash_size, :hash_size], out=scratch.dhash_bits)
+
+        ImageHash.PackBitsInto(scratch.bits, scratch.shifted, scratch.words)
+        return scratch.ahash, scratch.dhash
 
     # ahash
     dctlowfreq = dct[:hash_size, :hash_size]
     med = np.median(dctlowfreq)
     diff = dctlowfreq > med
-    ahash = ImageHash(diff)
+    ahash = ImageHash.FromBits(diff)
 
     # dhash vertical
     dctlowfreq = dct[:hash_size + 1, :hash_size]
     diff = dctlowfreq[1:, :] > dctlowfreq[:-1, :]
-    dhash = ImageHash(diff)
+    dhash = ImageHash.FromBits(diff)
     
     return ahash, dhash
 
+def MultiPHashBatch(gray_images, hash_size, scratch):
+    """
+    MultiPHash for a stack of already resized gray images (N, h, w), dtype == float32.
+    Return packed ahash and dhash words, shape (N, num_words) each.
+    """
+    n, h, w = gray_images.shape
+    resized64 = scratch.resized64[:n]
+    row_dct   = scratch.row_dct[:n]
+    dct       = scratch.dct[:n]
+    np.copyto(resized64, gray_images)
+    np.matmul(DCTBasis(h, hash_size + 1), resized64, out=row_dct)
+    np.matmul(row_dct, DCTBasis(w, hash_size).T, out=dct)
+
+    # ahash
+    dctlowfreq = dct[:, :hash_size, :hash_size].reshape(n, -1)
+    med = np.median(dctlowfreq, axis=1)
+    ahash = ImageHash.PackBits(dctlowfreq > med[:, None])
+
+    # dhash vertical
+    diff = dct[:, 1:, :] > dct[:, :-1, :]
+    dhash = ImageHash.PackBits(diff.reshape(n, -1))
+
+    return ahash, dhash
+
 class CropBox:
     def __init__(self, left, top, right, bottom):
         self.left   = left
@@ -300,7 +560,7 @@ class CropBox:
         """ Check whether this box is inside the other box. """
         return self.left >= other.left and self.top >= other.top and self.right <= other.right and self.bottom <= other.bottom
 
-def ExtractFeature_Control_Grayed(gray_image):
+def ExtractFeature_Control_Grayed(gray_image, full_dct=False):
     # binalize
     _, gray_image = cv2.threshold(gray_image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
     # cv2.imshow("image", gray_image)
@@ -310,9 +570,7 @@ def ExtractFeature_Control_Grayed(gray_image):
     gray_image = gray_image.astype(np.float32) / 255.0
 
     hash_size = GetHashSize(EAnnType.CTRLS)
-    feature = PHash_D(gray_image, hash_size=hash_size)
-    feature = feature.hash.flatten()
-
+    feature = PHash_D(gray_image, hash_size=hash_size, full_dct=full_dct)
     return feature
 
 def ExtractFeature_Control(image):
@@ -336,8 +594,6 @@ def ExtractFeature_Digit_Binalized(binary):
 
     hash_size = GetHashSize(EAnnType.DIGITS)
     feature = AHash(binary, hash_size=hash_size, mean=np.mean)
-    feature = feature.hash.flatten()
-
     return feature
 
 def ExtractFeature_Digit(image):
@@ -350,37 +606,41 @@ def ExtractFeature_Digit(image):
 
     return ExtractFeature_Digit_Binalized(binary)
 
-def ExtractFeature_ActionCard(image):
-    # preprocess
-    # to gray image
-    gray_image = cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
+def ExtractFeature_ActionCard_Grayed(gray_image, scratch=None, full_dct=False):
+    if scratch is None:
+        scratch = FeatureScratch(gray_image.shape[0], gray_image.shape[1])
 
     # histogram equalization
-    gray_image = cv2.equalizeHist(gray_image)
+    cv2.equalizeHist(gray_image, dst=scratch.equalized)
 
     # to float buffer
-    gray_image = gray_image.astype(np.float32) / 255.0
+    np.copyto(scratch.normalized, scratch.equalized)
+    scratch.normalized /= 255.0
 
     hash_size = GetHashSize(EAnnType.ACTIONS_A)
-    ahash, dhash = MultiPHash(gray_image, target_size=cfg.feature_image_size, hash_size=hash_size)
-    ahash = ahash.hash.flatten()
-    dhash = dhash.hash.flatten()
-
+    ahash, dhash = MultiPHash(scratch.normalized, target_size=cfg.feature_image_size, 
+                              hash_size=hash_size, full_dct=full_dct, scratch=scratch)
     return ahash, dhash
 
-def ExtractFeature_CharacterCard(image):
-    return ExtractFeature_ActionCard(image)
+def ExtractFeature_ActionCard(image, full_dct=False):
+    # preprocess
+    # to gray image
+    gray_image = cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
+
+    return ExtractFeature_ActionCard_Grayed(gray_image, full_dct=full_dct)
+
+def ExtractFeature_CharacterCard(image, full_dct=False):
+    return ExtractFeature_ActionCard(image, full_dct=full_dct)
+
+def ExtractFeature_CharacterCard_Grayed(gray_image, scratch=None, full_dct=False):
+    return ExtractFeature_ActionCard_Grayed(gray_image, scratch=scratch, full_dct=full_dct)
 
 def FeatureDistance(feature1, feature2):
-    return ImageHash(feature1) - ImageHash(feature2)
-
-def HashToFeature(hash_str):
-    binary_string = bin(int(hash_str, 16))[2:]
-    expected_length = len(hash_str) * 4
-    binary_string = binary_string.zfill(expected_length)
-    bool_list = [bit == '1' for bit in binary_string]
-    feature = np.array(bool_list, dtype=bool)
-    return feature
+    return feature1 - feature2
+
+def HashToFeature(hash_str, ann_type=EAnnType.CTRLS):
+    hash_size = GetHashSize(ann_type)
+    return ImageHash.FromHex(hash_str, num_bits=hash_size * hash_size)
 
 def CardName(card_id, db, lang="zh-HANS"):
     if card_id < 0:
@@ -401,9 +661,64 @@ def ChracterName(card_id, db, lang="zh-HANS", is_short=False):
     key = (lang + "_short") if is_short else lang
     return db["characters"][card_id][key]
 
+class CandidateMask:
+    """
+    Ids of an index a search is allowed to return, precomputed once and reused for every query.
+    Engines only score the allowed items, and cache what they derive from a mask in subsets.
+    """
+    _keys = itertools.count()
+
+    def __init__(self, mask):
+        self.mask    = np.asarray(mask, dtype=bool)
+        self.ids     = np.flatnonzero(self.mask)
+        self.key     = next(CandidateMask._keys)  # identifies the mask in QueryMemo keys
+        self.subsets = weakref.WeakKeyDictionary()
+        self.intersections = {}  # key of the other mask -> CandidateMask
+        self.isolations    = weakref.WeakKeyDictionary()  # engine -> {key of the outside mask: distances}
+
+    @staticmethod
+    def FromIds(ids, num_items):
+        mask = np.zeros((num_items,), dtype=bool)
+        mask[np.asarray(ids, dtype=np.int64)] = True
+        return CandidateMask(mask)
+
+    def NumExcluded(self):
+        return self.mask.size - self.ids.size
+
+    def Intersect(self, other):
+        """
+        CandidateMask of the items allowed by both, cached in this mask.
+        """
+        mask = self.intersections.get(other.key)
+        if mask is None:
+            mask = CandidateMask(self.mask & other.mask)
+            self.intersections[other.key] = mask
+        return mask
+
+    def Isolation(self, engine, outside=None):
+        """
+        Distance from each allowed item to the nearest item of outside which this mask excludes,
+        of all the items if outside is None. Indexed by item id, cached per engine.
+        A query nearer to an allowed item than half of its isolation has no nearer excluded item.
+        """
+        by_outside = self.isolations.setdefault(engine, {})
+        key = None if outside is None else outside.key
+        isolation = by_outside.get(key)
+        if isolation is None:
+            excluded = ~self.mask if outside is None else outside.mask & ~self.mask
+            isolation = np.full((self.mask.size,), np.iinfo(np.int32).max, dtype=np.int32)
+            if excluded.any() and self.ids.size > 0:
+                matrix = engine.GetMatrix()
+                isolation[self.ids] = HammingDistancesBatch(matrix[self.ids], matrix[excluded]).min(axis=1)
+            by_outside[key] = isolation
+        return isolation
+
+
 class CardHandler(ABC):
     def __init__(self):
-        self.feature_buffer = None
+        self.feature_buffer = None  # gray, single channel
+        self.scratch        = None
+        self.batch_scratch  = None
         self.crop_cfgs      = (cfg.feature_crop_box0, cfg.feature_crop_box1, cfg.feature_crop_box2)
         self.feature_crops  = []
 
@@ -431,7 +746,28 @@ class CardHandler(ABC):
     def AllowEarlyReturn(self, card_id):
         raise NotImplementedError()
 
+    def GetCandidateMask(self):
+        """
+        CandidateMask of the ids this handler can accept, None to search all of them.
+        """
+        return None
+
+    # Decide rejects a card if the next nearest distance is within this margin
+    NEXT_DIST_MARGIN = 5
+
+    def CascadeBound(self, threshold, strict_threshold):
+        """
+        Decide never accepts a card farther than this bound,
+        so the search only needs to refine the candidates within it.
+        cfg.cascade_margin < 0 trades exactness for fewer candidates.
+        """
+        return max(threshold, strict_threshold) + cfg.cascade_margin
+
     def ExtractCardFeatures(self):
+        """
+        Return ahash and dhash of the card in frame_buffer. Their words belong to the handler
+        and are overwritten by its next extraction, Copy them to keep them.
+        """
         # Get card region
         region_buffer = self.frame_buffer[
             self.crop_box.top  : self.crop_box.bottom, 
@@ -439,38 +775,221 @@ class CardHandler(ABC):
         ]
         self.region_buffer = region_buffer
 
-        # Crop card and get feature buffer
-        self.feature_buffer[:self.feature_crops[0].height, :self.feature_crops[0].width] = region_buffer[
-            self.feature_crops[0].top  : self.feature_crops[0].bottom, 
-            self.feature_crops[0].left : self.feature_crops[0].right
-        ]
-
-        self.feature_buffer[:self.feature_crops[1].height, self.feature_crops[0].width:] = region_buffer[
-            self.feature_crops[1].top  : self.feature_crops[1].bottom, 
-            self.feature_crops[1].left : self.feature_crops[1].right
-        ]
-
-        self.feature_buffer[self.feature_crops[1].height:, self.feature_crops[0].width:] = region_buffer[
-            self.feature_crops[2].top  : self.feature_crops[2].bottom, 
-            self.feature_crops[2].left : self.feature_crops[2].right
-        ]
+        self._AssembleFeatureBuffer(region_buffer, self.feature_buffer)
 
         # Extract feature
         features = self.ExtractFeatures(self.feature_buffer)
         return features
 
+    def _AssembleFeatureBuffer(self, region_buffer, feature_buffer):
+        """
+        Crop card and convert to gray directly into the feature buffer
+        """
+        crop0, crop1, crop2 = self.feature_crops
+        cv2.cvtColor(
+            region_buffer[crop0.top : crop0.bottom, crop0.left : crop0.right], 
+            cv2.COLOR_BGRA2GRAY, 
+            dst=feature_buffer[:crop0.height, :crop0.width]
+        )
+        cv2.cvtColor(
+            region_buffer[crop1.top : crop1.bottom, crop1.left : crop1.right], 
+            cv2.COLOR_BGRA2GRAY, 
+            dst=feature_buffer[:crop1.height, crop0.width:]
+        )
+        cv2.cvtColor(
+            region_buffer[crop2.top : crop2.bottom, crop2.left : crop2.right], 
+            cv2.COLOR_BGRA2GRAY, 
+            dst=feature_buffer[crop1.height:, crop0.width:]
+        )
+
+    def ExtractCardFeaturesBatch(self, bboxes):
+        """
+        Extract features of cards with the same size as this handler, located at bboxes.
+        Return packed ahash and dhash words, shape (N, num_words) each.
+        """
+        num_cards = len(bboxes)
+        height, width = self.feature_buffer.shape
+        if self.batch_scratch is None or self.batch_scratch.num_cards < num_cards:
+            self.batch_scratch = FeatureBatchScratch(num_cards, height, width)
+        scratch = self.batch_scratch
+
+        for i, bbox in enumerate(bboxes):
+            region_buffer = self.frame_buffer[bbox.top : bbox.bottom, bbox.left : bbox.right]
+            self._AssembleFeatureBuffer(region_buffer, scratch.gray[i])
+            # histogram equalization
+            cv2.equalizeHist(scratch.gray[i], dst=scratch.equalized[i])
+
+        # to float buffer
+        normalized = scratch.normalized[:num_cards]
+        np.copyto(normalized, scratch.equalized[:num_cards])
+        normalized /= 255.0
+
+        # resize
+        w, h = cfg.feature_image_size
+        interpolation = cv2.INTER_LINEAR if height < h else cv2.INTER_AREA
+        for i in range(num_cards):
+            cv2.resize(normalized[i], (w, h), dst=scratch.resized[i], interpolation=interpolation)
+
+        hash_size = GetHashSize(self.ann_type_a)
+        return MultiPHashBatch(scratch.resized[:num_cards], hash_size, scratch)
+
     def Update(self, frame_buffer, db, check_next_dist=True,
-                    threshold=cfg.threshold, strict_threshold=cfg.strict_threshold, _debug=False):
+                    threshold=cfg.threshold, strict_threshold=cfg.strict_threshold, restricted_mask=None, _debug=False):
+        """
+        restricted_mask: CandidateMask of the likely cards, e.g. my deck. 
+            The candidate mask of the handler is only searched if the restricted search may differ from it,
+            see TrustRestricted.
+        """
         self.frame_buffer = frame_buffer
 
         ahash, dhash = self.ExtractCardFeatures()
-        card_ids_a, dists_a = db.SearchByFeature(ahash, self.ann_type_a)
-        card_ids_d, dists_d = db.SearchByFeature(dhash, self.ann_type_d)
+        return self.Recognize(db, ahash, dhash, check_next_dist, threshold, strict_threshold, restricted_mask)
 
-        card_id_a = card_ids_a[0]
-        card_id_d = card_ids_d[0]
-        dist_a    = dists_a[0]
-        dist_d    = dists_d[0]
+    def Recognize(self, db, ahash, dhash, check_next_dist, threshold, strict_threshold, restricted_mask=None):
+        """
+        Search and decide the card of extracted hashes, see Update.
+        """
+        bound = self.CascadeBound(threshold, strict_threshold)
+        if restricted_mask is not None:
+            restricted_mask = self.RestrictCandidateMask(restricted_mask)
+            result_a = db.SearchByFeature(ahash, self.ann_type_a, bound=bound, mask=restricted_mask)
+            result_d = db.SearchByFeature(dhash, self.ann_type_d, bound=bound, mask=restricted_mask)
+            if self.TrustRestricted(db, restricted_mask, result_a, result_d, bound):
+                result = self.DecideCascaded(db, ahash, dhash, result_a, result_d, bound, 
+                                             check_next_dist, threshold, strict_threshold, restricted_mask)
+                if result[0] >= 0:
+                    return result
+
+        return self._SearchAndDecide(db, ahash, dhash, bound, self.GetCandidateMask(), 
+                                     check_next_dist, threshold, strict_threshold)
+
+    def _SearchAndDecide(self, db, ahash, dhash, bound, mask, check_next_dist, threshold, strict_threshold):
+        result_a = db.SearchByFeature(ahash, self.ann_type_a, bound=bound, mask=mask)
+        result_d = db.SearchByFeature(dhash, self.ann_type_d, bound=bound, mask=mask)
+        return self.DecideCascaded(db, ahash, dhash, result_a, result_d, bound, 
+                                   check_next_dist, threshold, strict_threshold, mask)
+
+    def RestrictCandidateMask(self, restricted_mask):
+        """
+        restricted_mask may allow ids the handler rejects, such as the arcane legends of the other side.
+        """
+        mask = self.GetCandidateMask()
+        return restricted_mask if mask is None else restricted_mask.Intersect(mask)
+
+    def TrustRestricted(self, db, restricted_mask, result_a, result_d, bound):
+        """
+        Whether the nearest items of a restricted search are also the nearest ones of the full search,
+        then Decide takes the same card from both, unless the full search rejects it for a close excluded item.
+        A card which is not allowed can be near one which is, e.g. a card created during the game near a card
+        of my deck, so both hashes must be nearer than half of the isolation of their items.
+        """
+        outside = self.GetCandidateMask()
+        for ann_type, result in ((self.ann_type_a, result_a), (self.ann_type_d, result_d)):
+            # The nearest items are not known beyond bound, or when more of them tie than ids has
+            if result.dist > bound or result.next_dist == result.dist:
+                return False
+            isolation = restricted_mask.Isolation(db.GetEngine(ann_type), outside)
+            if any(2 * result.dist >= isolation[item_id] for item_id in result.ids):
+                return False
+        return True
+
+    def UpdateBatch(self, frame_buffer, bboxes, db, check_next_dist=True,
+                    threshold=cfg.threshold, strict_threshold=cfg.strict_threshold, restricted_mask=None):
+        """
+        Same results as calling Update for each bbox, but the hashing and the search run once for the whole stack.
+        All bboxes must have the same size, the handler is resized to it if needed.
+        Return a list of (card_id, dist, dists).
+        """
+        if not bboxes:
+            return []
+        self.Rebind(bboxes[0])
+        for bbox in bboxes:
+            if bbox.width != self.crop_box.width or bbox.height != self.crop_box.height:
+                raise ValueError(f"UpdateBatch: bboxes must have the same size, {bbox} != {self.crop_box}")
+        self.frame_buffer = frame_buffer
+
+        ahashs, dhashs = self.ExtractCardFeaturesBatch(bboxes)
+        bound = self.CascadeBound(threshold, strict_threshold)
+        if restricted_mask is None:
+            return self._SearchAndDecideBatch(db, ahashs, dhashs, bound, self.GetCandidateMask(), 
+                                              check_next_dist, threshold, strict_threshold)
+
+        restricted_mask = self.RestrictCandidateMask(restricted_mask)
+        results_a = db.SearchByFeatureBatch(ahashs, self.ann_type_a, bound=bound, mask=restricted_mask)
+        results_d = db.SearchByFeatureBatch(dhashs, self.ann_type_d, bound=bound, mask=restricted_mask)
+        results = self._DecideBatch(db, ahashs, dhashs, results_a, results_d, bound, restricted_mask, 
+                                    check_next_dist, threshold, strict_threshold)
+        fallbacks = [i for i, result in enumerate(results) if result[0] < 0 
+                     or not self.TrustRestricted(db, restricted_mask, results_a[i], results_d[i], bound)]
+        if fallbacks:
+            fallback_results = self._SearchAndDecideBatch(db, ahashs[fallbacks], dhashs[fallbacks], bound, 
+                self.GetCandidateMask(), check_next_dist, threshold, strict_threshold)
+            for i, result in zip(fallbacks, fallback_results):
+                results[i] = result
+        return results
+
+    def _SearchAndDecideBatch(self, db, ahashs, dhashs, bound, mask, check_next_dist, threshold, strict_threshold):
+        results_a = db.SearchByFeatureBatch(ahashs, self.ann_type_a, bound=bound, mask=mask)
+        results_d = db.SearchByFeatureBatch(dhashs, self.ann_type_d, bound=bound, mask=mask)
+        return self._DecideBatch(db, ahashs, dhashs, results_a, results_d, bound, mask, 
+                                 check_next_dist, threshold, strict_threshold)
+
+    def _DecideBatch(self, db, ahashs, dhashs, results_a, results_d, bound, mask, check_next_dist, threshold, strict_threshold):
+        num_bits = GetHashSize(self.ann_type_a) ** 2
+        results = []
+        for i in range(ahashs.shape[0]):
+            ahash = ImageHash(ahashs[i], num_bits)
+            dhash = ImageHash(dhashs[i], num_bits)
+            results.append(self.DecideCascaded(db, ahash, dhash, results_a[i], results_d[i], bound, 
+                                               check_next_dist, threshold, strict_threshold, mask))
+        return results
+
+    def DecideCascaded(self, db, ahash, dhash, result_a, result_d, bound, check_next_dist, threshold, strict_threshold, mask=None):
+        """
+        Decide from search results which are only exact within bound.
+        Skip it when no card survived the coarse prefilter in either hash,
+        then the distances are bound + 1, a lower bound of the real ones.
+        mask: CandidateMask the results were searched with, the candidate mask of the handler if None
+        """
+        if result_a.dist > bound and result_d.dist > bound:
+            db.cascade_stats.Add(rejected=True, card_id=-1)
+            # The searches only pad the distances beyond bound, they are not the real ones
+            lower_bound = bound + 1
+            return -1, lower_bound, ([lower_bound] * len(result_a.dists), [lower_bound] * len(result_d.dists))
+
+        # The next nearest distance is checked up to NEXT_DIST_MARGIN beyond the nearest one.
+        # It only matters when both hashes are within threshold, so widen the bound just for these
+        if check_next_dist and result_a.dist <= threshold and result_d.dist <= threshold:
+            wider_bound = bound + self.NEXT_DIST_MARGIN
+            if mask is None:
+                mask = self.GetCandidateMask()
+            result_a = db.SearchByFeature(ahash, self.ann_type_a, bound=wider_bound, mask=mask)
+            result_d = db.SearchByFeature(dhash, self.ann_type_d, bound=wider_bound, mask=mask)
+
+        result = self.Decide(db, result_a, result_d, check_next_dist, threshold, strict_threshold)
+        db.cascade_stats.Add(rejected=False, card_id=result[0])
+        return result
+
+    def _RemapTies(self, result, db, threshold, strict_threshold):
+        """
+        Cards of the ids tied at the best distance, or None if any of them is not allowed.
+        """
+        cards = set()
+        for card_id in result.ids:
+            remapped = self.RemapCardId(card_id, db, result.dist, threshold, strict_threshold)
+            if remapped < 0:
+                return None
+            cards.add(remapped)
+        return cards
+
+    def Decide(self, db, result_a, result_d, check_next_dist, threshold, strict_threshold):
+        """
+        Decide the card from the SearchResult of ahash and dhash.
+        """
+        card_id_a = result_a.ids[0]
+        card_id_d = result_d.ids[0]
+        dist_a    = result_a.dist
+        dist_d    = result_d.dist
 
         card_id = -1
         dist    = max(dist_a, dist_d)
@@ -481,8 +1000,8 @@ class CardHandler(ABC):
             #     LogDebug(
             #         card_a=NameFunc(card_id_a, db),
             #         card_d=NameFunc(card_id_d, db),
-            #         dists=(dists_a[:3], dists_d[:3]))
-            return card_id, dist, (dists_a[:3], dists_d[:3])
+            #         dists=(result_a.dists, result_d.dists))
+            return card_id, dist, (result_a.dists, result_d.dists)
 
         # Early return if the distance is below the strict threshold.
         # extra cards should be ignored here
@@ -498,27 +1017,12 @@ class CardHandler(ABC):
         
         # Check whether two hash gives the same result
         # The smallest dist may contain multiple cards due to brightness change
-        dist_a_next = dists_a[3]
-        set_a = set()
-        for i in range(3):
-            if dists_a[i] != dist_a:
-                dist_a_next = dists_a[i]
-                break
-            remapped_a = self.RemapCardId(card_ids_a[i], db, dist_a, threshold, strict_threshold)
-            if remapped_a < 0:
-                return PackedResult()
-            set_a.add(remapped_a)
-
-        dist_d_next = dists_d[3]
-        set_d = set()
-        for i in range(3):
-            if dists_d[i] != dist_d:
-                dist_d_next = dists_d[i]
-                break
-            remapped_d = self.RemapCardId(card_ids_d[i], db, dist_d, threshold, strict_threshold)
-            if remapped_d < 0:
-                return PackedResult()
-            set_d.add(remapped_d)
+        set_a = self._RemapTies(result_a, db, threshold, strict_threshold)
+        if set_a is None:
+            return PackedResult()
+        set_d = self._RemapTies(result_d, db, threshold, strict_threshold)
+        if set_d is None:
+            return PackedResult()
 
         intersection = set_a & set_d
 
@@ -530,7 +1034,8 @@ class CardHandler(ABC):
         if dist_a > threshold or dist_d > threshold:
             return PackedResult()
         # Invalid if 1st nearest Hash differs not much from 2nd nearest Hash
-        if (check_next_dist) and (dist_a_next - dist_a <= 5 or dist_d_next - dist_d <= 5):
+        margin = self.NEXT_DIST_MARGIN
+        if (check_next_dist) and (result_a.margin <= margin or result_d.margin <= margin):
             return PackedResult()
 
         card_id = intersection.pop()
@@ -545,7 +1050,17 @@ class CardHandler(ABC):
         feature_buffer_width  = self.feature_crops[0].width + self.feature_crops[1].width
         feature_buffer_height = self.feature_crops[0].height
         self.feature_buffer = np.zeros(
-            (feature_buffer_height, feature_buffer_width, 4), dtype=np.uint8)
+            (feature_buffer_height, feature_buffer_width), dtype=np.uint8)
+        self.scratch = FeatureScratch(feature_buffer_height, feature_buffer_width)
+
+    def Rebind(self, crop_box):
+        """
+        Move the handler to a new crop box. Buffers are only reallocated if the size changes.
+        """
+        if self.crop_box is None or self.crop_box.width != crop_box.width or self.crop_box.height != crop_box.height:
+            self.OnResize(crop_box)
+        else:
+            self.crop_box = crop_box
 
     def _ResizeFeatureCrops(self, width, height):
         # ////////////////////////////////
@@ -602,10 +1117,34 @@ class CardHandler(ABC):
 
 
 class ActionCardHandler(CardHandler):
+    # game_event -> CandidateMask, shared by all handlers
+    _candidate_masks = {}
+
     def __init__(self, game_event=EGameEvent.Invalid):
         super().__init__()
         self.event = game_event
 
+    @staticmethod
+    def CandidateMaskOf(game_event):
+        """
+        Base actions and goldens are always allowed, the arcane legends only for the side that played them.
+        """
+        mask = ActionCardHandler._candidate_masks.get(game_event)
+        if mask is None:
+            num_actions = EActionCard.NumActions.value
+            num_goldens = EActionCard.NumExtraGoldens.value
+            num_arcanes = EActionCard.NumArcaneLegends.value
+            allowed = np.zeros((num_actions + num_goldens + 2 * num_arcanes,), dtype=bool)
+            allowed[:num_actions + num_goldens] = True
+            my_arcanes = num_actions + num_goldens
+            if game_event == EGameEvent.MyPlayed:
+                allowed[my_arcanes:my_arcanes + num_arcanes] = True
+            elif game_event == EGameEvent.OpPlayed:
+                allowed[my_arcanes + num_arcanes:] = True
+            mask = CandidateMask(allowed)
+            ActionCardHandler._candidate_masks[game_event] = mask
+        return mask
+
     @override
     def GetAnnTypes(self):
         return EAnnType.ACTIONS_A, EAnnType.ACTIONS_D
@@ -620,26 +1159,21 @@ class ActionCardHandler(CardHandler):
 
         # Now it must be an Extra ArcaneLegend
 
-        # Extra ArcaneLegend should use strict threshold
+        # Extra ArcaneLegend should use strict threshold.
+        # The side of the game event is already matched by GetCandidateMask
         if dist > strict_threshold:
             return -1
 
-        # Check whether the game event is matched
-        if EActionCard.IsExtraMyArcaneLegend(card_id):
-            target_event = EGameEvent.MyPlayed
-        elif EActionCard.IsExtraOpArcaneLegend(card_id):
-            target_event = EGameEvent.OpPlayed
-        else:
-            target_event = EGameEvent.Invalid
-        if self.event != target_event:
-            return -1
-
         # Remap extra cards
         return db["extras"][card_id - EActionCard.NumActions.value]
 
     @override
     def ExtractFeatures(self, feature_buffer):
-        return ExtractFeature_ActionCard(feature_buffer)
+        return ExtractFeature_ActionCard_Grayed(feature_buffer, self.scratch)
+
+    @override
+    def GetCandidateMask(self):
+        return ActionCardHandler.CandidateMaskOf(self.event)
 
     @override
     def AllowEarlyReturn(self, card_id):
@@ -660,8 +1194,60 @@ class CharacterCardHandler(CardHandler):
 
     @override
     def ExtractFeatures(self, feature_buffer):
-        return ExtractFeature_CharacterCard(feature_buffer)
+        return ExtractFeature_CharacterCard_Grayed(feature_buffer, self.scratch)
 
     @override
     def AllowEarlyReturn(self, card_id):
-        return True
\ No newline at end of file
+        return True
+
+class CardHandlerPool:
+    """
+    Reuse action card handlers between frames, keyed by (width, height, event type),
+    so that tasks detecting cards every frame do not reallocate feature buffers.
+    """
+    def __init__(self, max_size=16):
+        self.max_size = max_size
+        self.handlers = OrderedDict()
+        self.hits     = 0
+        self.misses   = 0
+
+    def Get(self, crop_box, game_event=EGameEvent.Invalid):
+        key = (crop_box.width, crop_box.height, game_event)
+        handler = self.handlers.get(key)
+        if handler is None:
+            self.misses += 1
+            handler = ActionCardHandler(game_event)
+            handler.OnResize(crop_box)
+            self.handlers[key] = handler
+            if len(self.handlers) > self.max_size:
+                self.handlers.popitem(last=False)
+        else:
+            self.hits += 1
+            self.handlers.move_to_end(key)
+            handler.Rebind(crop_box)
+        return handler
+
+    def UpdateBatch(self, frame_buffer, bboxes, db, game_event=EGameEvent.Invalid, restricted_masks=None, **kwargs):
+        """
+        Detected bboxes can differ by a few pixels, so batch them per size with one handler each.
+        restricted_masks: restricted_mask of CardHandler.UpdateBatch for each bbox, bboxes are also batched per mask
+        Return a list of (card_id, dist, dists) in the order of bboxes.
+        """
+        if restricted_masks is None:
+            restricted_masks = [None] * len(bboxes)
+        groups = OrderedDict()
+        for i, (bbox, mask) in enumerate(zip(bboxes, restricted_masks)):
+            groups.setdefault((bbox.width, bbox.height, None if mask is None else mask.key), []).append(i)
+
+        results = [None] * len(bboxes)
+        for indices in groups.values():
+            group_bboxes = [bboxes[i] for i in indices]
+            handler = self.Get(group_bboxes[0], game_event)
+            group_results = handler.UpdateBatch(frame_buffer, group_bboxes, db, 
+                                                restricted_mask=restricted_masks[indices[0]], **kwargs)
+            for i, result in zip(indices, group_results):
+                results[i] = result
+        return results
+
+    def Clear(self):
+        self.handlers.clear()
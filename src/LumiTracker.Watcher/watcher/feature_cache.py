@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from .config import cfg, LogWarning
+from .feature import ImageHash
+from . import feature
+
+# Bump when feature extraction changes in a way neither the config values below
+# nor the source of feature.py and database.py capture, e.g. with another OpenCV
+FEATURE_CACHE_VERSION = 1
+
+def FeatureParams():
+    """
+    Config values and source the card, control and digit hashes depend on.
+    The extraction tasks of the build live in database.py, e.g. the crop and resize of the arcane legends.
+    Any change of either file is a miss, even one which does not change the hashes.
+    """
+    # database imports this module
+    from . import database
+    return {
+        "version"            : FEATURE_CACHE_VERSION,
+        "feature_source"     : _SourceDigest(feature),
+        "database_source"    : _SourceDigest(database),
+        "hash_size"          : cfg.hash_size,
+        "feature_crop_box0"  : cfg.feature_crop_box0,
+        "feature_crop_box1"  : cfg.feature_crop_box1,
+        "feature_crop_box2"  : cfg.feature_crop_box2,
+        "feature_image_size" : cfg.feature_image_size,
+    }
+
+def _Digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+def _SourceDigest(module):
+    with open(module.__file__, "rb") as f:
+        return _Digest(f.read())
+
+def _EncodeHash(feature):
+    return f"{feature.num_bits}:{feature}"
+
+def _DecodeHash(value):
+    num_bits, hash_str = value.split(":")
+    return ImageHash.FromHex(hash_str, num_bits=int(num_bits))
+
+class FeatureCache:
+    """
+    Features of database images, persisted across builds.
+    An entry is keyed by the extraction parameters, the task which computed it and the image content,
+    so a changed image or config value is a miss, and renaming an image is still a hit.
+    Entries not used by the current build are dropped on Save.
+    """
+    def __init__(self, path):
+        self.path         = path
+        self.params       = _Digest(json.dumps(FeatureParams(), sort_keys=True).encode("utf-8"))
+        self.entries      = {}
+        self.used         = {}
+        self.num_reused   = 0
+        self.num_computed = 0
+
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                LogWarning(info=f"Failed to load feature cache {path}, rebuild all features", error=str(e))
+
+    def Key(self, tag, image_path):
+        """
+        Return None if the image can not be read, the task reports it.
+        """
+        try:
+            with open(image_path, "rb") as f:
+                content = _Digest(f.read())
+        except OSError:
+            return None
+        return _Digest(f"{self.params}|{tag}|{content}".encode("utf-8"))
+
+    def Get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            return None
+        self.used[key] = value
+        self.num_reused += 1
+        if isinstance(value, list):
+            return tuple(_DecodeHash(v) for v in value)
+        return _DecodeHash(value)
+
+    def Put(self, key, features):
+        if isinstance(features, (tuple, list)):
+            value = [_EncodeHash(feature) for feature in features]
+        else:
+            value = _EncodeHash(features)
+        self.used[key] = value
+        self.num_computed += 1
+
+    def Save(self):
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.used, f, indent=None, sort_keys=True)
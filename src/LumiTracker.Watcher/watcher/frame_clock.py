@@ -0,0 +1,38 @@
+import time
+from datetime import datetime, timedelta
+
+class FrameClock:
+    """
+    Time of the frame being processed, advanced once per frame by FrameManager.
+    Tasks and states read it instead of the wall clock, so a recording replayed at any speed
+    sees the same times as a live capture of it.
+    """
+    def __init__(self):
+        self.time            = time.perf_counter()
+        self.origin          = None     # timestamp of the first frame
+        self.origin_datetime = datetime.now()
+
+    def Advance(self, timestamp=None):
+        """
+        timestamp: capture time of the frame in seconds, from any origin. The wall clock if None.
+        """
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        if self.origin is None:
+            self.origin          = timestamp
+            self.origin_datetime = datetime.now()
+        self.time = timestamp
+
+    def Now(self):
+        """
+        Seconds, only differences between two calls are meaningful, like time.perf_counter.
+        """
+        return self.time
+
+    def DateTime(self):
+        """
+        Local date and time of the frame, the wall clock at the first frame plus the time since then.
+        """
+        if self.origin is None:
+            return datetime.now()
+        return self.origin_datetime + timedelta(seconds=self.time - self.origin)
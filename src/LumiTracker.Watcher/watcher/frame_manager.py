@@ -1,13 +1,19 @@
 import time
+import queue
 import logging
 import cv2
 import numpy as np
 from datetime import datetime
 import os
 
-from .config import cfg, LogDebug, LogInfo, LogWarning, LogError
-from .enums import EGameEvent, EClientType, ERegionType, ETurn
+from .config import cfg, LogDebug, LogInfo, LogWarning, LogError, ApplyDeferred
+from .enums import EGameEvent, EClientType, ERegionType, ETurn, EAnnType
 from .database import Database, SaveImage
+from .database_reloader import DatabaseReloader
+from .image_writer import AsyncImageWriter
+from .frame_clock import FrameClock
+from .task_runner import TaskRunner
+from .deck import DeckCandidateMask
 from .regions import REGIONS, GetRatioType
 
 from .states import *
@@ -17,10 +23,23 @@ class FrameManager:
         # database
         db = Database()
         db.Load()
+        # Only CTRLS is needed before a game starts, so card indexes are loaded in background
+        db.Prefetch(
+            ann_types=[EAnnType.ACTIONS_A, EAnnType.ACTIONS_D, EAnnType.CHARACTERS_A, EAnnType.CHARACTERS_D],
+            keys=["actions", "extras", "characters"],
+            )
         self.db = db
+        self.db_reloader = DatabaseReloader()
+        self.image_writer = AsyncImageWriter()
+        self.frame_pipeline = None  # set by FramePipeline when frames are processed in its thread
+        self.posted = queue.Queue()  # (func, args) posted by the input, applied before the next frame
+        # Time of the current frame, tasks and states must not read the wall clock
+        self.clock = FrameClock()
 
         # tasks
         GTasks.Init(self)
+        self.task_runner = TaskRunner()
+        self.frame_index = 0  # frames processed, the tasks tick on the frames due in their TickSchedule
 
         # game states for state machine
         self.states = [
@@ -34,7 +53,7 @@ class FrameManager:
 
         # control signals
         self.game_started    = False
-        self.game_start_time = datetime.now()
+        self.game_start_time = self.clock.DateTime()
         self.round           = 0
         self.my_card_back    = np.zeros((0,))
         self.op_card_back    = np.zeros((0,))
@@ -43,10 +62,14 @@ class FrameManager:
         self.first_turn      = ETurn.Null
         self.starting_hand   = []
 
+        # my deck pushed by the backend, restricts the searches of my cards
+        self.my_deck         = []
+        self.my_deck_masks   = {}  # game_event -> CandidateMask
+
         # logs
-        self.prev_log_time   = time.perf_counter()
-        self.prev_frame_time = self.prev_log_time
+        self.prev_log_time   = None  # frame clock of the first frame
         self.frame_count     = 0
+        self.frame_time_avg  = 0.0
         self.fps_interval    = cfg.LOG_INTERVAL / 10
         self.test_on_resize  = test_on_resize
         self.need_capture    = False
@@ -59,7 +82,7 @@ class FrameManager:
         self.content_not_found_warned = False
 
     def StartNewGame(self):
-        self.game_start_time = datetime.now()
+        self.game_start_time = self.clock.DateTime()
         self.round           = 0
         self.my_card_back    = np.zeros((0,))
         self.op_card_back    = np.zeros((0,))
@@ -68,6 +91,54 @@ class FrameManager:
         self.first_turn      = ETurn.Null
         self.starting_hand   = []
 
+    def Post(self, func, *args):
+        """
+        Call func in the thread processing the frames, before the next frame.
+        The input is read in the capture thread, which runs concurrently with the frames when frame_pipeline is on,
+        so it must not change the states of FrameManager itself.
+        """
+        self.posted.put((func, args))
+
+    def ApplyPosted(self):
+        effects = []
+        while True:
+            try:
+                effects.append(self.posted.get_nowait())
+            except queue.Empty:
+                break
+        ApplyDeferred(effects)
+
+    def RequestCaptureTest(self):
+        self.need_capture = True
+
+    def SwapDatabase(self, db):
+        """
+        Must be called between frames, db must be fully loaded.
+        """
+        self.db = db
+        self.my_deck_masks = {}
+        GTasks.ForEach(lambda task: task.SetDatabase(db))
+
+    def SetMyDeck(self, action_ids):
+        """
+        action_ids: internal ids of the actions in my deck, empty to search all cards again
+        """
+        self.my_deck       = list(action_ids)
+        self.my_deck_masks = {}
+        LogInfo(info="[MyDeck]", num_actions=len(self.my_deck))
+
+    def GetMyDeckMask(self, game_event):
+        """
+        CandidateMask of the cards of my deck, or None if the deck is unknown.
+        """
+        if not self.my_deck:
+            return None
+        mask = self.my_deck_masks.get(game_event)
+        if mask is None:
+            mask = DeckCandidateMask(self.my_deck, self.db, game_event)
+            self.my_deck_masks[game_event] = mask
+        return mask
+
     def SetTurn(self, turn):
         if turn == ETurn.Null or turn == self.turn:
             return
@@ -105,6 +176,8 @@ class FrameManager:
         filename = datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + ".png"
         path = os.path.join(self.log_dir, filename)
 
+        # Written before the event, the backend opens the file as soon as it gets it.
+        # Requested by the user, so it never goes through the sampled and bounded image_writer.
         SaveImage(image, path, remove_alpha=True)
         LogInfo(
             type=f"{EGameEvent.CaptureTest.name}",
@@ -113,10 +186,27 @@ class FrameManager:
             height=image.shape[0],
             )
 
-    def OnFrameArrived(self, frame_buffer):
+    def OnFrameArrived(self, frame_buffer, timestamp=None):
+        """
+        timestamp: capture time of the frame in seconds, see FrameClock.Advance
+        """
         # skip invalid frames
         if frame_buffer.size == 0:
             return
+        frame_begin_time = time.perf_counter()
+        self.clock.Advance(timestamp)
+        if self.prev_log_time is None:
+            self.prev_log_time = self.clock.Now()
+
+        # Swap in a reloaded database before any task reads it in this frame
+        reload = self.db_reloader.Poll()
+        if reload is not None:
+            new_db, build_time, latency = reload
+            self.SwapDatabase(new_db)
+            swap_time = time.perf_counter() - frame_begin_time
+
+        # The posted input applies to this frame, a deck is decoded with the swapped database
+        self.ApplyPosted()
 
         # Crop margins for WeMeet
         if self.client_type == EClientType.WeMeet.name:
@@ -140,9 +230,10 @@ class FrameManager:
         ####################
         # Main tasks
         # Note: No PreTick & PostTick is needed right now. 
-        for task in self.tasks:
+        due_tasks = [task for task in self.tasks if task.schedule.Due(self.frame_index)]
+        for task in due_tasks:
             task.SetFrameBuffer(frame_buffer)
-            task.Tick()
+        self.task_runner.Run(due_tasks)
 
         # State transfer
         old_state = self.state.GetState()
@@ -162,15 +253,39 @@ class FrameManager:
         self.tasks = self.state.CollectTasks()
 
         # Logs
+        self.frame_index += 1
         self.frame_count += 1
-        cur_time = time.perf_counter()
+        frame_time = time.perf_counter() - frame_begin_time
+        if reload is not None:
+            LogInfo(
+                info="[DatabaseReload] Database swapped.",
+                latency=latency,
+                build_time=build_time,
+                swap_time=swap_time,
+                frame_time=frame_time,
+                hiccup=frame_time - self.frame_time_avg,
+                )
+        else:
+            self.frame_time_avg += 0.05 * (frame_time - self.frame_time_avg)
 
+        # Frames per second of the frame clock, which is the capture rate
+        cur_time = self.clock.Now()
         if cur_time - self.prev_log_time >= self.fps_interval:
             fps = self.frame_count / (cur_time - self.prev_log_time)
             LogInfo(
                 type=f"{EGameEvent.LogFps.name}",
                 fps=f"{fps}"
                 )
+            cascade_stats = self.db.cascade_stats
+            if cascade_stats.rejected + cascade_stats.refined > 0:
+                LogDebug(info="[Cascade]", **cascade_stats.AsDict())
+            query_memo = self.db.query_memo
+            if query_memo.hits + query_memo.misses > 0:
+                LogDebug(info="[QueryMemo]", **query_memo.AsDict())
+            if self.image_writer.queued + self.image_writer.dropped > 0:
+                LogDebug(info="[AsyncImageWriter]", **self.image_writer.AsDict())
+            if self.frame_pipeline is not None:
+                LogDebug(info="[FramePipeline]", **self.frame_pipeline.AsDict())
 
             self.frame_count   = 0
             self.prev_log_time = cur_time
@@ -0,0 +1,168 @@
+import threading
+import time
+import traceback
+from collections import deque
+
+import numpy as np
+
+from .config import cfg, LogError
+from .enums import EFrameQueuePolicy
+
+class FrameSlot:
+    def __init__(self):
+        self.buffer       = np.zeros((0, 0, 4), dtype=np.uint8)
+        self.timestamp = 0.0  # perf_counter when the frame was captured
+
+    def Store(self, frame_buffer, timestamp):
+        # Only reallocated when the window size changes
+        if self.buffer.shape != frame_buffer.shape:
+            self.buffer = np.empty(frame_buffer.shape, dtype=frame_buffer.dtype)
+        np.copyto(self.buffer, frame_buffer)
+        self.timestamp = timestamp
+
+
+class FramePipeline:
+    """
+    Run FrameManager in a consumer thread, so that a slow frame does not delay the next capture.
+    The capture thread copies each frame into a free slot of a bounded queue, the captured buffer
+    can be reused right after Push. When every slot is taken, policy decides:
+        DropOldest: replace the oldest queued frame, the consumer always gets the latest ones
+        DropNewest: drop the captured frame
+        Block:      wait for the consumer, which throttles the capture like the serial loop
+    """
+    def __init__(self, frame_manager, max_queued=cfg.frame_queue_size, policy=cfg.frame_queue_policy):
+        self.frame_manager = frame_manager
+        self.frame_manager.frame_pipeline = self  # logs the stats with the fps
+        self.max_queued    = max_queued
+        self.policy        = EFrameQueuePolicy[policy] if isinstance(policy, str) else policy
+
+        # At most max_queued ready slots, the consumer also holds the frame in process
+        # and the previous one, tasks may keep views of it
+        self.slots         = [FrameSlot() for _ in range(max_queued + 2)]
+        self.free          = deque(self.slots)
+        self.ready         = deque()
+        self.cond          = threading.Condition()
+        self.closed        = False
+        self.error         = None   # exception of the consumer, raised again in the capture thread
+        self.thread        = None
+        self.width         = 0
+        self.height        = 0
+
+        self.pushed        = 0
+        self.processed     = 0
+        self.dropped       = 0      # frames lost because the queue was full
+        self.blocked_time  = 0.0    # seconds the capture thread waited, with Block
+        self.max_depth     = 0
+        self.latency_sum   = 0.0    # seconds from capture to the start of processing
+        self.latency_max   = 0.0
+
+    def Start(self):
+        self.thread = threading.Thread(target=self._Run, daemon=True)
+        self.thread.start()
+
+    def Close(self):
+        """
+        Process the queued frames and stop the consumer.
+        """
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def Push(self, frame_buffer, timestamp=None):
+        """
+        Called by the capture thread. Return whether the frame is queued.
+        """
+        if self.error is not None:
+            raise self.error
+        if timestamp is None:
+            timestamp = time.perf_counter()
+
+        with self.cond:
+            if len(self.ready) >= self.max_queued:
+                if self.policy == EFrameQueuePolicy.DropNewest:
+                    self.dropped += 1
+                    return False
+                elif self.policy == EFrameQueuePolicy.DropOldest:
+                    self.free.append(self.ready.popleft())
+                    self.dropped += 1
+                elif self.policy == EFrameQueuePolicy.Block:
+                    wait_begin = time.perf_counter()
+                    while len(self.ready) >= self.max_queued and self.error is None:
+                        self.cond.wait()
+                    self.blocked_time += time.perf_counter() - wait_begin
+                    if self.error is not None:
+                        raise self.error
+                else:
+                    raise NotImplementedError()
+            slot = self.free.popleft()
+
+        # Copy outside of the lock, the consumer never touches a slot that is not ready
+        slot.Store(frame_buffer, timestamp)
+
+        with self.cond:
+            self.ready.append(slot)
+            self.pushed   += 1
+            self.max_depth = max(self.max_depth, len(self.ready))
+            self.cond.notify_all()
+        return True
+
+    def _Pop(self):
+        with self.cond:
+            while not self.ready and not self.closed:
+                self.cond.wait()
+            if not self.ready:
+                return None
+            return self.ready.popleft()
+
+    def _Release(self, slot):
+        with self.cond:
+            self.free.append(slot)
+            self.cond.notify_all()
+
+    def _Run(self):
+        prev_slot = None
+        try:
+            while True:
+                slot = self._Pop()
+                if slot is None:
+                    break
+
+                latency = time.perf_counter() - slot.timestamp
+                self.latency_sum += latency
+                self.latency_max  = max(self.latency_max, latency)
+
+                # Resize in the consumer thread, in order with the frames
+                height, width = slot.buffer.shape[:2]
+                if width != self.width or height != self.height:
+                    self.width, self.height = width, height
+                    self.frame_manager.Resize(width, height)
+
+                self.frame_manager.OnFrameArrived(slot.buffer, slot.timestamp)
+                self.processed += 1
+
+                if prev_slot is not None:
+                    self._Release(prev_slot)
+                prev_slot = slot
+        except Exception as e:
+            LogError(info=f"[FramePipeline] Frame processing failed: {e}", traceback=traceback.format_exc())
+            with self.cond:
+                self.error = e
+                self.cond.notify_all()
+
+    def AsDict(self):
+        with self.cond:
+            depth = len(self.ready)
+        return {
+            "policy"       : self.policy.name,
+            "pushed"       : self.pushed,
+            "processed"    : self.processed,
+            "dropped"      : self.dropped,
+            "depth"        : depth,
+            "max_depth"    : self.max_depth,
+            "blocked_time" : self.blocked_time,
+            "latency_avg"  : self.latency_sum / self.processed if self.processed > 0 else 0.0,
+            "latency_max"  : self.latency_max,
+        }
@@ -0,0 +1,116 @@
+import numpy as np
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+from .config import cfg
+from .enums import EAnnType, ECtrlType
+from .database import Database
+from .feature import PairwiseDistances
+
+def ItemCards(db, ann_type):
+    """
+    Return (card_ids, names) of the index items. Extra items of actions map to the card they show,
+    items of the same card are variants rather than collisions.
+    """
+    if ann_type in (EAnnType.ACTIONS_A, EAnnType.ACTIONS_D):
+        actions = db["actions"]
+        card_ids = list(range(len(actions))) + list(db["extras"])
+        names = [actions[card_id]["zh-HANS"] for card_id in card_ids]
+    elif ann_type in (EAnnType.CHARACTERS_A, EAnnType.CHARACTERS_D):
+        names = [character["zh-HANS"] for character in db["characters"]]
+        card_ids = list(range(len(names)))
+    elif ann_type == EAnnType.CTRLS:
+        names = [ECtrlType(i).name for i in range(ECtrlType.NUM_CTRLS_ANN.value)]
+        card_ids = list(range(len(names)))
+    else:
+        names = [""] * db.GetEngine(ann_type).GetNumItems()
+        card_ids = list(range(len(names)))
+    return np.array(card_ids, dtype=np.int32), names
+
+def AnalyzeCollisions(matrix, card_ids, names, threshold, strict_threshold):
+    """
+    matrix: packed hashes of an index, shape (N, num_words)
+    Pairs of items within a threshold are only reported across different cards, nearest first.
+    """
+    n = matrix.shape[0]
+    num_bits = matrix.shape[1] * 64
+    dists = PairwiseDistances(matrix)
+
+    # Nearest item of another card
+    other = np.where(card_ids[:, None] != card_ids[None, :], dists, num_bits + 1)
+    nn_ids   = other.argmin(axis=1) if n > 1 else np.zeros((n,), dtype=np.int64)
+    nn_dists = other[np.arange(n), nn_ids]
+
+    rows, cols = np.triu_indices(n, k=1)
+    pair_dists = dists[rows, cols]
+    different  = card_ids[rows] != card_ids[cols]
+    close = np.flatnonzero(different & (pair_dists <= threshold))
+    close = close[np.argsort(pair_dists[close], kind="stable")]
+
+    def Pair(k):
+        i, j = int(rows[k]), int(cols[k])
+        return {"dist": int(pair_dists[k]), "ids": [i, j], "card_ids": [int(card_ids[i]), int(card_ids[j])], "names": [names[i], names[j]]}
+
+    items = [{
+        "id"      : i,
+        "card_id" : int(card_ids[i]),
+        "name"    : names[i],
+        "nn_id"   : int(nn_ids[i]),
+        "nn_name" : names[int(nn_ids[i])],
+        "nn_dist" : int(nn_dists[i]),
+    } for i in range(n)]
+
+    return {
+        "num_items"             : n,
+        "min_dist"              : int(nn_dists.min()) if n > 1 else None,
+        "pairs_threshold"       : [Pair(k) for k in close],
+        "pairs_strict_threshold": [Pair(k) for k in close if pair_dists[k] <= strict_threshold],
+        "items"                 : sorted(items, key=lambda item: (item["nn_dist"], item["id"])),
+    }
+
+def main():
+    """
+    All-pairs Hamming distances of every index in the database, to check new cards for ambiguity.
+    items: nearest item of another card for each item, closest first
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", default=os.path.join(cfg.debug_dir, "hash_collisions.json"),
+                        help="path of the JSON report")
+    parser.add_argument("--top", type=int, default=5,
+                        help="number of closest items printed for each index")
+    args = parser.parse_args()
+
+    db = Database()
+    db.Load()
+
+    report = {
+        "threshold"        : cfg.threshold,
+        "strict_threshold" : cfg.strict_threshold,
+        "anns"             : {},
+    }
+    begin_time = time.perf_counter()
+    for i in range(EAnnType.ANN_COUNT.value):
+        ann_type = EAnnType(i)
+        matrix = np.ascontiguousarray(db.GetEngine(ann_type).GetMatrix(), dtype=np.uint64)
+        card_ids, names = ItemCards(db, ann_type)
+        result = AnalyzeCollisions(matrix, card_ids, names, cfg.threshold, cfg.strict_threshold)
+        report["anns"][ann_type.name.lower()] = result
+
+        print(f"{ann_type.name}: {result['num_items']} items, min_dist = {result['min_dist']}, "
+              f"{len(result['pairs_threshold'])} pairs <= threshold, "
+              f"{len(result['pairs_strict_threshold'])} pairs <= strict_threshold")
+        for item in result["items"][:args.top]:
+            print(f"    {item['nn_dist']:3d}  {item['id']}{item['name']} <-----> {item['nn_id']}{item['nn_name']}")
+    dt = time.perf_counter() - begin_time
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Done in {dt:.2f}s, report saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import queue
+import threading
+import time
+
+from .config import cfg, LogError
+from .database import SaveImage
+
+class AsyncImageWriter:
+    """
+    Encode and write images in a background thread, so that debug saves do not stall the frame loop.
+    Images are copied when queued, the caller can reuse its buffers right after Save.
+    Each source is sampled at most once per min_interval, and images are dropped when the queue is full.
+    """
+    def __init__(self, max_queued=cfg.image_writer_queue_size, min_interval=cfg.image_writer_interval):
+        self.queue        = queue.Queue(maxsize=max_queued)
+        self.min_interval = min_interval
+        self.last_times   = {}  # source -> time of the last queued image
+        self.lock         = threading.Lock()
+        self.thread       = None
+
+        self.queued       = 0
+        self.written      = 0
+        self.sampled_out  = 0   # skipped by the rate limit of their source
+        self.dropped      = 0   # skipped because the queue was full
+        self.failed       = 0
+
+    def Save(self, image, path, remove_alpha=False, source=None, min_interval=None):
+        """
+        source: name of the rate limit, path by default
+        min_interval: seconds between two images of source, the min_interval of the writer if None
+        Return whether the image is queued.
+        """
+        source       = path if source is None else source
+        min_interval = self.min_interval if min_interval is None else min_interval
+
+        # Parallel tasks may save at the same time
+        with self.lock:
+            cur_time = time.perf_counter()
+            if cur_time - self.last_times.get(source, -min_interval) < min_interval:
+                self.sampled_out += 1
+                return False
+
+            try:
+                self.queue.put_nowait((image.copy(), path, remove_alpha))
+            except queue.Full:
+                self.dropped += 1
+                return False
+
+            self.last_times[source] = cur_time
+            self.queued += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._Run, daemon=True)
+                self.thread.start()
+        return True
+
+    def _Run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+
+            image, path, remove_alpha = item
+            try:
+                SaveImage(image, path, remove_alpha=remove_alpha)
+                with self.lock:
+                    self.written += 1
+            except Exception as e:
+                with self.lock:
+                    self.failed += 1
+                LogError(info=f"[AsyncImageWriter] Failed to save image: {e}", path=path)
+            self.queue.task_done()
+
+    def Flush(self):
+        """
+        Wait until every queued image is written.
+        """
+        if self.thread is not None:
+            self.queue.join()
+
+    def Close(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def AsDict(self):
+        with self.lock:
+            written, failed = self.written, self.failed
+        return {
+            "queued"      : self.queued,
+            "written"     : written,
+            "sampled_out" : self.sampled_out,
+            "dropped"     : self.dropped,
+            "failed"      : failed,
+            "depth"       : self.queue.qsize(),
+        }
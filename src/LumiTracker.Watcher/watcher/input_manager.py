@@ -3,8 +3,9 @@ import queue
 import socket
 import json
 
-from .config import LogDebug, LogInfo, LogError
+from .config import LogDebug, LogInfo, LogError, LogWarning
 from .enums import EInputType
+from .deck import DecodeShareCode
 
 class AsyncInput:
     def __init__(self, port):
@@ -76,8 +77,29 @@ class InputManager:
             return
         LogInfo(message_data)
 
+        # Tick runs in the capture thread, the frame manager is changed in the thread processing the frames
         input_type = message_data["input_type"]
         if input_type == EInputType.CaptureTest.name:
-            self.frame_manager.need_capture = True
+            self.frame_manager.Post(self.frame_manager.RequestCaptureTest)
+        elif input_type == EInputType.ReloadDatabase.name:
+            self.frame_manager.Post(self.frame_manager.db_reloader.Request)
+        elif input_type == EInputType.MyDeck.name:
+            self.frame_manager.Post(self.SetMyDeck, message_data)
         else:
             LogError(info="[InputManager.Tick] Unknown input type.")
+
+    def SetMyDeck(self, message_data):
+        """
+        The deck is given by "sharecode", or by "cards" as internal action ids. Sending neither clears it.
+        Posted to the frame manager, see Tick.
+        """
+        sharecode = message_data.get("sharecode", "")
+        if sharecode:
+            decoded = DecodeShareCode(sharecode, self.frame_manager.db)
+            if decoded is None:
+                LogWarning(info="[InputManager.SetMyDeck] Invalid share code.", sharecode=sharecode)
+                return
+            _, action_ids = decoded
+        else:
+            action_ids = message_data.get("cards", [])
+        self.frame_manager.SetMyDeck([card_id for card_id in action_ids if card_id >= 0])
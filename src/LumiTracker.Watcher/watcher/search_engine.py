@@ -0,0 +1,370 @@
+from annoy import AnnoyIndex
+import numpy as np
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import threading
+
+from .config import cfg
+from .enums import ESearchEngine
+from .feature import GetHashSize, ImageHash, HammingDistances, HammingDistancesBatch
+from .feature import CoarseWords, CoarseHash, CoarseDistances, CandidateMask
+
+def _ClearAnnoyUnusedBytes(path, num_bits, num_items):
+    """
+    Annoy copies its tree nodes from uninitialized memory, so the bytes a node does not use differ
+    from build to build even with a fixed seed. Zero them, the same items and seed give the same file.
+    Layout of a Hamming node: n_descendants <i4 | children <i4[2] | padding | v <u8[num_words]
+        item : v is the hash
+        leaf : n_descendants <= K, the item ids fill children and run into v
+        split: children are the two subtrees, v[0] is the split bit
+    """
+    num_words = (num_bits + 63) // 64
+    node_size = 16 + 8 * num_words
+    max_leaf  = (node_size - 4) // 4
+    nodes = np.fromfile(path, dtype=np.uint8).reshape(-1, node_size)
+    n_descendants = nodes[:, :4].copy().view("<i4")[:, 0]
+    for i in range(num_items, nodes.shape[0]):
+        n = int(n_descendants[i])
+        if n <= max_leaf:
+            nodes[i, 4 + 4 * n:] = 0
+        else:
+            nodes[i, 12:16] = 0
+            nodes[i, 24:]   = 0
+    nodes.tofile(path)
+
+
+class SearchResult:
+    """
+    Nearest items of a query, in the form CardHandler.Decide reads them.
+        dist      : best distance
+        ids       : ids at the best distance in id order, at most MAX_TIES of them
+        next_dist : distance of the first item after ids, it equals dist when more than MAX_TIES items tie
+        margin    : next_dist - dist
+        dists     : first MAX_TIES distances, for logging
+    Items beyond a search bound are padded as id -1 with a distance larger than the bound.
+    """
+    __slots__ = ("dist", "ids", "next_dist", "margin", "dists")
+
+    MAX_TIES = 3
+
+    def __init__(self, ids, dists, num_bits):
+        """
+        ids, dists: nearest items sorted by (dist, id), at least MAX_TIES + 1 of them if the index has
+        """
+        dist = dists[0]
+        num_ties = 1
+        while num_ties < min(len(dists), SearchResult.MAX_TIES) and dists[num_ties] == dist:
+            num_ties += 1
+
+        self.dist      = dist
+        self.ids       = ids[:num_ties]
+        self.next_dist = dists[num_ties] if num_ties < len(dists) else num_bits + 1
+        self.margin    = self.next_dist - dist
+        self.dists     = dists[:SearchResult.MAX_TIES]
+
+    def __repr__(self):
+        return f"SearchResult(dist={self.dist}, ids={self.ids}, next_dist={self.next_dist})"
+
+
+class SearchEngine(ABC):
+    # Number of items Search needs to return for a SearchResult
+    NEAREST_N = SearchResult.MAX_TIES + 1
+
+    def __init__(self, ann_type):
+        self.ann_type  = ann_type
+        hash_size      = GetHashSize(ann_type)
+        self.num_bits  = hash_size * hash_size
+
+    @abstractmethod
+    def Build(self, features):
+        raise NotImplementedError()
+
+    @abstractmethod
+    def Load(self, path):
+        raise NotImplementedError()
+
+    @abstractmethod
+    def Search(self, feature, n, bound=None, mask=None):
+        """
+        Return (ids, dists) of the n nearest items, sorted by distance.
+        If bound is given, only items within it are guaranteed to be exact,
+        the rest may be padded with id -1 and a distance larger than bound.
+        If mask (CandidateMask) is given, only its items are returned.
+        """
+        raise NotImplementedError()
+
+    def SearchBatch(self, features, n, bound=None, mask=None):
+        """
+        features: packed hashes, shape (N, num_words)
+        Return a list of (ids, dists) for each row.
+        """
+        return [self.Search(ImageHash(words, self.num_bits), n, bound, mask) for words in features]
+
+    def SearchNearest(self, feature, bound=None, mask=None):
+        ids, dists = self.Search(feature, self.NEAREST_N, bound, mask)
+        return SearchResult(ids, dists, self.num_bits)
+
+    def SearchNearestBatch(self, features, bound=None, mask=None):
+        """
+        features: packed hashes, shape (N, num_words)
+        Return a SearchResult for each row.
+        """
+        return [SearchResult(ids, dists, self.num_bits) for ids, dists in self.SearchBatch(features, self.NEAREST_N, bound, mask)]
+
+    @abstractmethod
+    def GetFeatureById(self, target_id):
+        raise NotImplementedError()
+
+    @abstractmethod
+    def GetNumItems(self):
+        raise NotImplementedError()
+
+    def GetMatrix(self):
+        """
+        Packed hashes of all items, shape (num_items, num_words)
+        """
+        return np.stack([self.GetFeatureById(i).words for i in range(self.GetNumItems())])
+
+
+class AnnoySearchEngine(SearchEngine):
+    # !!!!! Must use a large n for Annoy, or it may not find the optimal result !!!!!
+    # Measure with ann_tuner before lowering it or cfg.ann_search_k
+    NEAREST_N = cfg.ann_search_n
+
+    def __init__(self, ann_type):
+        super().__init__(ann_type)
+        self.ann = AnnoyIndex(self.num_bits, cfg.ann_metric)
+
+    def Build(self, features):
+        # Fixed seed, so the same features always give the same trees and .ann file
+        self.ann.set_seed(cfg.ann_seed)
+        for i in range(len(features)):
+            self.ann.add_item(i, features[i].ToBits())
+        self.ann.build(cfg.ann_n_trees)
+        return self
+
+    def Save(self, path):
+        self.ann.save(path)
+        if cfg.ann_metric == "hamming":
+            # The saved file is mapped again, release it to rewrite it
+            num_items = self.ann.get_n_items()
+            self.ann.unload()
+            _ClearAnnoyUnusedBytes(path, self.num_bits, num_items)
+            self.ann.load(path)
+
+    def Load(self, path):
+        self.ann.load(path)
+        return self
+
+    def Search(self, feature, n, bound=None, mask=None):
+        # No prefilter here, the bound only allows it
+        if mask is None:
+            return self.ann.get_nns_by_vector(feature.ToBits(), n=n, search_k=cfg.ann_search_k, include_distances=True)
+
+        # Annoy can not skip items, so ask for enough neighbors to keep n allowed ones
+        ids, dists = self.ann.get_nns_by_vector(
+            feature.ToBits(), n=n + mask.NumExcluded(), search_k=cfg.ann_search_k, include_distances=True)
+        allowed = [(i, d) for i, d in zip(ids, dists) if mask.mask[i]][:n]
+        num_pads = min(n, mask.ids.size) - len(allowed)
+        return [i for i, _ in allowed] + [-1] * num_pads, [d for _, d in allowed] + [self.num_bits + 1] * num_pads
+
+    def GetFeatureById(self, target_id):
+        return ImageHash.FromBits(np.array(self.ann.get_item_vector(target_id)) > 0.5)
+
+    def GetNumItems(self):
+        return self.ann.get_n_items()
+
+
+class ExactSearchEngine(SearchEngine):
+    """
+    Brute force Hamming search over a contiguous packed matrix (N, num_words).
+    Ties are broken by item id, so the result order is deterministic.
+
+    With a bound, a 64-bit coarse hash of each item is compared first,
+    and the full hashes are only compared for the items within the bound.
+    """
+    def __init__(self, ann_type):
+        super().__init__(ann_type)
+        self.SetMatrix(np.zeros((0, ImageHash.NumWords(self.num_bits)), dtype=np.uint64))
+
+    def SetMatrix(self, matrix):
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.uint64)
+        self.coarse = np.ascontiguousarray(CoarseWords(self.matrix, self.num_bits)[:, 0])
+
+    def Build(self, features):
+        if features:
+            self.SetMatrix(np.stack([feature.words for feature in features]))
+        return self
+
+    def Load(self, path):
+        # The shipped index files are Annoy files, so read the items back from them once
+        ann = AnnoyIndex(self.num_bits, cfg.ann_metric)
+        ann.load(path)
+        bits = np.array([ann.get_item_vector(i) for i in range(ann.get_n_items())]) > 0.5
+        ann.unload()
+        self.SetMatrix(ImageHash.PackBits(bits))
+        return self
+
+    def _Subset(self, mask):
+        """
+        (item_ids, matrix, coarse) of the items allowed by mask, item_ids is None for all items.
+        """
+        if mask is None:
+            return None, self.matrix, self.coarse
+        subset = mask.subsets.get(self)
+        if subset is None:
+            if mask.mask.size != self.matrix.shape[0]:
+                raise ValueError(f"CandidateMask of {mask.mask.size} items used on {self.ann_type.name} of {self.matrix.shape[0]} items")
+            subset = (mask.ids, np.ascontiguousarray(self.matrix[mask.ids]), np.ascontiguousarray(self.coarse[mask.ids]))
+            mask.subsets[self] = subset
+        return subset
+
+    def Search(self, feature, n, bound=None, mask=None):
+        item_ids, matrix, coarse = self._Subset(mask)
+        if bound is None:
+            dists = HammingDistances(feature, matrix)
+            return self._ToItemIds(item_ids, *self._TopN(dists, n))
+
+        candidates = np.flatnonzero(CoarseDistances(CoarseHash(feature), coarse) <= bound)
+        return self._ToItemIds(item_ids, *self._Refine(feature.words, matrix, candidates, n))
+
+    def SearchBatch(self, features, n, bound=None, mask=None):
+        item_ids, matrix, coarse = self._Subset(mask)
+        if bound is None:
+            dists = HammingDistancesBatch(features, matrix)
+            return [self._ToItemIds(item_ids, *self._TopN(row, n)) for row in dists]
+
+        coarse_dists = HammingDistancesBatch(CoarseWords(features, self.num_bits), coarse[:, None])
+        return [self._ToItemIds(item_ids, *self._Refine(words, matrix, np.flatnonzero(row <= bound), n))
+                for words, row in zip(features, coarse_dists)]
+
+    def _Refine(self, words, matrix, candidates, n):
+        """
+        Full distances for the candidates only, padded to n items with id -1.
+        The items left out are farther than the bound, so num_bits + 1 is a valid stand-in.
+        """
+        ids, dists = [], []
+        if candidates.size > 0:
+            ids, dists = self._TopN(HammingDistances(ImageHash(words, self.num_bits), matrix[candidates]), n)
+            ids = candidates[ids].tolist()
+        num_pads = min(n, matrix.shape[0]) - len(ids)
+        return ids + [-1] * num_pads, dists + [self.num_bits + 1] * num_pads
+
+    @staticmethod
+    def _ToItemIds(item_ids, ids, dists):
+        # item_ids is sorted, so the (dist, id) order of a subset is kept
+        if item_ids is None:
+            return ids, dists
+        return [int(item_ids[i]) if i >= 0 else -1 for i in ids], dists
+
+    @staticmethod
+    def _TopN(dists, n):
+        n = min(n, dists.size)
+        # Partition only pays off when there are many more items than n
+        if 4 * n < dists.size:
+            # Keep every item tied with the n-th distance, then sort stably by (dist, id)
+            kth  = np.partition(dists, n - 1)[n - 1]
+            ids  = np.flatnonzero(dists <= kth)
+            ids  = ids[np.argsort(dists[ids], kind="stable")][:n]
+        else:
+            ids  = np.argsort(dists, kind="stable")[:n]
+        return ids.tolist(), dists[ids].tolist()
+
+    def GetFeatureById(self, target_id):
+        return ImageHash(self.matrix[target_id].copy(), self.num_bits)
+
+    def GetNumItems(self):
+        return self.matrix.shape[0]
+
+    def GetMatrix(self):
+        return self.matrix
+
+
+class CascadeStats:
+    """
+    Outcome of card queries searched with a coarse prefilter bound.
+        rejected : no card within the bound in either hash, decided without refinement
+        refined  : the candidates within the bound are compared with the full hashes
+        final    : refined queries which end up with a card
+    """
+    def __init__(self):
+        self.lock = threading.Lock()  # parallel tasks search concurrently
+        self.Reset()
+
+    def Reset(self):
+        self.rejected = 0
+        self.refined  = 0
+        self.final    = 0
+
+    def Add(self, rejected, card_id):
+        with self.lock:
+            if rejected:
+                self.rejected += 1
+                return
+            self.refined += 1
+            if card_id >= 0:
+                self.final += 1
+
+    def AsDict(self):
+        return {"rejected": self.rejected, "refined": self.refined, "final": self.final}
+
+
+class QueryMemo:
+    """
+    Bounded LRU of search results, keyed by (ann_type, bound, candidate mask, packed hash).
+    Static frames give the same hash frame after frame, so their searches are answered here.
+    A reloaded database comes with a new, empty memo.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.results  = OrderedDict()
+        self.lock     = threading.Lock()
+        self.hits     = 0
+        self.misses   = 0
+
+    @staticmethod
+    def Key(ann_type, words, bound, mask=None):
+        return (ann_type.value, bound, None if mask is None else mask.key, words.tobytes())
+
+    def Get(self, key):
+        with self.lock:
+            result = self.results.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self.results.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def Put(self, key, result):
+        if self.capacity <= 0:
+            return
+        with self.lock:
+            self.results[key] = result
+            self.results.move_to_end(key)
+            if len(self.results) > self.capacity:
+                self.results.popitem(last=False)
+
+    def Clear(self):
+        with self.lock:
+            self.results.clear()
+
+    def AsDict(self):
+        num_queries = self.hits + self.misses
+        return {
+            "hits"     : self.hits,
+            "misses"   : self.misses,
+            "hit_rate" : self.hits / num_queries if num_queries > 0 else 0.0,
+        }
+
+
+def CreateSearchEngine(ann_type, engine_type=None):
+    if engine_type is None:
+        engine_type = ESearchEngine[cfg.search_engine]
+
+    if engine_type == ESearchEngine.Annoy:
+        return AnnoySearchEngine(ann_type)
+    elif engine_type == ESearchEngine.Exact:
+        return ExactSearchEngine(ann_type)
+    else:
+        raise NotImplementedError()
@@ -4,7 +4,6 @@ from ..enums import EGamePhase
 from ..feature import CardName
 
 import enum
-import time
 
 class GameStateNatureAndWisdom(GameState):
     class EStage(enum.Enum):
@@ -88,16 +87,16 @@ class GameStateNatureAndWisdom(GameState):
             if card_id != -1:
                 task.Flush(need_reset=False)
                 self.drawn_card = card_id
-                self.drawn_end_t = time.perf_counter()
+                self.drawn_end_t = self.fm.clock.Now()
             return
 
         # wait until previous signal has left
         if not task.filters[0].PrevSignalHasLeft():
-            self.drawn_end_t = time.perf_counter()
+            self.drawn_end_t = self.fm.clock.Now()
             return
         # wait for the drawn card to leave the center region
         WAIT_TIME = 1.2 # seconds
-        if time.perf_counter() - self.drawn_end_t < WAIT_TIME:
+        if self.fm.clock.Now() - self.drawn_end_t < WAIT_TIME:
             return
 
         # To next stage
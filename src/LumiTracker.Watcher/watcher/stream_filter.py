@@ -1,5 +1,6 @@
 from collections import deque, defaultdict
 from .config import cfg
+import math
 import time
 
 class SlidingWindow:
@@ -11,10 +12,12 @@ class SlidingWindow:
             # self.t_first   = time.perf_counter()
             # self.t_last    = self.t_first
 
-    def __init__(self, null_val, window_size, min_count):
-        self.NULL_VAL    = null_val
-        self.WINDOW_SIZE = window_size
-        self.MIN_COUNT   = min_count
+    def __init__(self, null_val, window_size, min_count, strict_min_count=None):
+        self.NULL_VAL         = null_val
+        self.WINDOW_SIZE      = window_size
+        self.MIN_COUNT        = min_count
+        # count needed by a value with a strict match
+        self.STRICT_MIN_COUNT = min_count // 2 if strict_min_count is None else strict_min_count
 
         self.window      = deque(maxlen=window_size)
         self.records     = defaultdict(lambda: SlidingWindow.Record())
@@ -45,7 +48,7 @@ class SlidingWindow:
         record = self.records[majority]
         if record.count >= self.MIN_COUNT:
             return majority
-        if (record.is_strict) and (record.count >= (self.MIN_COUNT // 2)): # maybe tune this threshold
+        if (record.is_strict) and (record.count >= self.STRICT_MIN_COUNT): # maybe tune this threshold
             return majority
 
         return self.NULL_VAL
@@ -56,12 +59,31 @@ class SlidingWindow:
 
 
 class StreamFilter:
-    def __init__(self, null_val, window_size=40, valid_count=15, cooldown=10, window_min_count=10):
+    def __init__(self, null_val, window_size=40, valid_count=15, cooldown=10, window_min_count=10, period=1):
+        """
+        Sizes are in frames of the full frame rate.
+        period: frames between two calls of Filter. The sizes are divided by it, so that a value is signaled
+                after about the same time as at the full rate, plus a window.
+        """
+        def Scaled(count):
+            return max(1, math.ceil(count / period))
+
+        window_size      = Scaled(window_size)
+        min_count        = Scaled(window_min_count)
+        strict_min_count = None
+        if period > 1:
+            # With a few samples per window, a single sample would be a majority and a burst of noise
+            # could stay one for valid_count reads. Need two samples, strict or not, for a majority,
+            # and a majority lasting a whole window.
+            min_count        = max(2, min_count)
+            strict_min_count = max(2, min_count // 2)
+            valid_count      = max(valid_count, window_size * period)
+
         self.NULL_VAL    = null_val
-        self.VALID_COUNT = valid_count
-        self.COOLDOWN    = cooldown
+        self.VALID_COUNT = Scaled(valid_count)
+        self.COOLDOWN    = Scaled(cooldown)
 
-        self.window      = SlidingWindow(null_val, window_size, window_min_count)
+        self.window      = SlidingWindow(null_val, window_size, min_count, strict_min_count)
         self.value       = null_val
         self.count       = 0
         self.signaled    = False
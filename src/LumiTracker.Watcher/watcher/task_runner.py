@@ -0,0 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .config import cfg, BeginDeferred, EndDeferred, ApplyDeferred
+
+def _TickDeferred(task):
+    BeginDeferred()
+    try:
+        task.Tick()
+    finally:
+        effects = EndDeferred()
+    return effects
+
+
+class TaskRunner:
+    """
+    Tick the tasks of a frame. Consecutive PARALLEL_SAFE tasks run concurrently in a persistent thread pool,
+    most of their work is in OpenCV and numpy which release the GIL. The other tasks run alone, in order.
+    Logs and Deferred side effects of the parallel tasks are applied in the task order after the join,
+    so the events and the frame manager state are the same as in the serial run.
+    num_threads: threads ticking the tasks including the calling one, 1 or less to tick them serially
+    """
+    def __init__(self, num_threads=cfg.task_threads):
+        self.num_threads = num_threads
+        self.pool        = None
+        if num_threads > 1:
+            self.pool = ThreadPoolExecutor(max_workers=num_threads - 1, thread_name_prefix="TaskRunner")
+
+    def Close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+
+    def Run(self, tasks):
+        if self.pool is None:
+            for task in tasks:
+                task.Tick()
+            return
+
+        batch = []
+        for task in tasks:
+            if task.PARALLEL_SAFE:
+                batch.append(task)
+                continue
+            self._RunBatch(batch)
+            batch = []
+            task.Tick()
+        self._RunBatch(batch)
+
+    def _RunBatch(self, batch):
+        if len(batch) <= 1:
+            for task in batch:
+                task.Tick()
+            return
+
+        # The calling thread ticks the first task instead of waiting idle
+        futures = [self.pool.submit(_TickDeferred, task) for task in batch[1:]]
+        try:
+            effects = _TickDeferred(batch[0])
+        finally:
+            # No task may still be running when this returns, even on errors
+            wait(futures)
+
+        ApplyDeferred(effects)
+        for future in futures:
+            ApplyDeferred(future.result())
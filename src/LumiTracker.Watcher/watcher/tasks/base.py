@@ -1,14 +1,59 @@
 from abc import ABC, abstractmethod
 
+from ..config import cfg, Deferred
+
+class TickSchedule:
+    """
+    Frames on which something sampled rate times per second ticks: every period frames of the nominal
+    cfg.frame_limit, from phase. Schedules are given consecutive phases, so that the ones of the same period
+    tick on different frames and the per-frame cost stays even.
+    rate: None for every frame
+    """
+    _num_staggered = 0
+
+    def __init__(self, rate=None):
+        self.period = 1 if rate is None else max(1, round(cfg.frame_limit / rate))
+        self.phase  = TickSchedule._num_staggered % self.period
+        if self.period > 1:
+            TickSchedule._num_staggered += 1
+
+    def Due(self, frame_index):
+        return frame_index % self.period == self.phase
+
+
 class TaskBase(ABC):
+    # Tick only reads its own region of the frame and its own state, and changes the frame manager
+    # through UpdateFrameManager or Deferred, so it may run concurrently with the other parallel safe tasks.
+    PARALLEL_SAFE = False
+    # Ticks per second, None for every frame. StreamFilters of the task should be given period=self.schedule.period.
+    TICK_RATE     = None
+
     def __init__(self, frame_manager):
         self.fm = frame_manager
-        self.db = frame_manager.db
+        self.schedule = TickSchedule(self.TICK_RATE)
+        self.db = None
         self.frame_buffer = None
+        self.SetDatabase(frame_manager.db)
+
+    def SetDatabase(self, db):
+        """
+        Called again when the database is reloaded. Override it to refresh values derived from db.
+        """
+        self.db = db
 
     def SetFrameBuffer(self, frame_buffer):
         self.frame_buffer = frame_buffer
 
+    def UpdateFrameManager(self, **attrs):
+        """
+        Set attributes of the frame manager, after the join when the task runs in parallel.
+        """
+        Deferred(self._SetFrameManagerAttrs, attrs)
+
+    def _SetFrameManagerAttrs(self, attrs):
+        for name, value in attrs.items():
+            setattr(self.fm, name, value)
+
     def PreTick(self):
         pass
 
@@ -3,8 +3,7 @@ from .base import TaskBase
 from ..enums import EGameEvent, ERegionType, ECtrlType
 from ..config import cfg, override, LogDebug, LogInfo
 from ..regions import REGIONS
-from ..feature import CropBox, ExtractFeature_Control_Single, HashToFeature, FeatureDistance, ImageHash
-from ..database import SaveImage
+from ..feature import CropBox, ExtractFeature_Control_Single, HashToFeature, FeatureDistance
 from ..stream_filter import StreamFilter
 
 import numpy as np
@@ -14,11 +13,14 @@ import cv2
 class CardBackTask(TaskBase):
     def __init__(self, frame_manager):
         super().__init__(frame_manager)
+        self.Reset()
+
+    @override
+    def SetDatabase(self, db):
+        super().SetDatabase(db)
         idx = ECtrlType.HISTORY.value - ECtrlType.CTRL_SINGLE_FIRST.value
         self.history_feature = HashToFeature(self.db["ctrls"][idx])
 
-        self.Reset()
-
     @override
     def Reset(self):
         self.filter = StreamFilter(null_val=False)
@@ -73,10 +75,10 @@ class CardBackTask(TaskBase):
 
             LogDebug(
                 info=f"History button detected and card backs have been stored.",
-                feature=f"{ImageHash(feature)}", 
+                feature=f"{feature}", 
                 last_dist=dist,
                 )
 
             if cfg.DEBUG_SAVE:
-                SaveImage(my_card_back, os.path.join(cfg.debug_dir, "save", f"my_card_back.png"), remove_alpha=True)
-                SaveImage(op_card_back, os.path.join(cfg.debug_dir, "save", f"op_card_back.png"), remove_alpha=True)
\ No newline at end of file
+                self.fm.image_writer.Save(my_card_back, os.path.join(cfg.debug_dir, "save", f"my_card_back.png"), remove_alpha=True)
+                self.fm.image_writer.Save(op_card_back, os.path.join(cfg.debug_dir, "save", f"op_card_back.png"), remove_alpha=True)
\ No newline at end of file
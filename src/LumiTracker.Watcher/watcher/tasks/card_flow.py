@@ -3,13 +3,12 @@ from .base import TaskBase
 from ..enums import EGameEvent, ERegionType, EAnnType
 from ..config import cfg, override, LogDebug, LogInfo, LogError
 from ..regions import REGIONS
-from ..feature import CropBox, ActionCardHandler, CardName
+from ..feature import CropBox, CardHandlerPool, CardName
 from ..feature import ExtractFeature_Digit_Binalized
 from ..stream_filter import StreamFilter
 
 from collections import deque, defaultdict
 import cv2
-import time
 import numpy as np
 
 class CenterCropTask(TaskBase):
@@ -31,6 +30,7 @@ class CenterCropTask(TaskBase):
         self.center_crop   = None
         self.flow_anchor   = None
         self.KERNEL        = None
+        self.handler_pool  = CardHandlerPool()
 
     @override
     def OnResize(self, client_width, client_height, ratio_type):
@@ -51,6 +51,11 @@ class CenterCropTask(TaskBase):
         size = (5, 3) if client_height < 800 else (7, 5)
         self.KERNEL = np.ones(size, np.uint8)
 
+        # Card sizes change with the client size, cached handlers are useless now
+        if self.handler_pool.misses > 0:
+            LogDebug(info="[CardHandlerPool]", hits=self.handler_pool.hits, misses=self.handler_pool.misses)
+        self.handler_pool.Clear()
+
     def DetectCenterCards(self):
         center_buffer = self.frame_buffer[
             self.center_crop.top  : self.center_crop.bottom, 
@@ -141,14 +146,14 @@ class CenterCropTask(TaskBase):
 
             # Extract feature
             feature = ExtractFeature_Digit_Binalized(binary)
-            results, dists = self.db.SearchByFeature(feature, EAnnType.DIGITS)
+            result = self.db.SearchByFeature(feature, EAnnType.DIGITS)
             # 10 ~ 19 is for card cost's digit, which is outlined
-            digit = results[0]
-            if digit < 10 or digit > 19 or dists[0] > cfg.strict_threshold:
+            digit = result.ids[0]
+            if digit < 10 or digit > 19 or result.dist > cfg.strict_threshold:
                 digit = -1
             else:
                 digit -= 10
-                # LogDebug(digit=digit, results=results[:3], dists=dists[:3])
+                # LogDebug(digit=digit, results=result.ids, dists=result.dists)
 
             # Note: Currently, no card costs larger than 5
             # Maybe there will be debuffs that add costs to cards in the future
@@ -232,6 +237,7 @@ class CenterCropTask(TaskBase):
         return True
 
 class CardFlowTask(CenterCropTask):
+    PARALLEL_SAFE    = True
     WAIT_TIME        = 1.2  # seconds
     QUEUE_TIME_RANGE = 8.0  # seconds
 
@@ -327,10 +333,11 @@ class CardFlowTask(CenterCropTask):
             self.card_recorder[num_bboxes] = recorder
 
         invalid_count = 0
-        for i, bbox in enumerate(bboxes):
-            card_handler = ActionCardHandler()
-            card_handler.OnResize(bbox)
-            card_id, dist, dists = card_handler.Update(self.frame_buffer, self.db, threshold=40, check_next_dist=False)
+        # Cards are searched among the ones with the detected cost first
+        restricted_masks = [self.db.GetCostMask(cost) for cost in costs]
+        results = self.handler_pool.UpdateBatch(self.frame_buffer, bboxes, self.db, threshold=40, check_next_dist=False, 
+                                                restricted_masks=restricted_masks)
+        for i, (bbox, (card_id, dist, dists)) in enumerate(zip(bboxes, results)):
 
             if card_id >= 0:
                 recorder[i][card_id] += 1
@@ -353,7 +360,7 @@ class CardFlowTask(CenterCropTask):
         # LogDebug(num_cards=num_cards)
         if num_cards > 0:
             self.signaled_num_cards = num_cards
-            self.signaled_timestamp = time.perf_counter()
+            self.signaled_timestamp = self.fm.clock.Now()
             LogDebug(info="[CardFlow]", t_start=self.signaled_timestamp)
 
         if (self.signaled_num_cards != 0) and self.filter.PrevSignalHasLeft():
@@ -362,7 +369,7 @@ class CardFlowTask(CenterCropTask):
             info = CardFlowTask.SignalInfo(
                 num_cards=num_cards, 
                 t_begin=self.signaled_timestamp, 
-                t_end=time.perf_counter(),
+                t_end=self.fm.clock.Now(),
                 cards=cards,
                 valid=valid,
                 )
@@ -424,7 +431,7 @@ class CardFlowTask(CenterCropTask):
         if found:
             dst_queue = self.op_deck_queue if is_op else self.my_deck_queue
             LogDebug(drawn_detected=True, is_op=is_op)
-            timestamp = time.perf_counter()
+            timestamp = self.fm.clock.Now()
             while len(dst_queue) > 0 and (timestamp - dst_queue[0] > self.QUEUE_TIME_RANGE):
                 dst_queue.popleft()
             dst_queue.append(timestamp)
@@ -464,7 +471,7 @@ class CardFlowTask(CenterCropTask):
             return True
 
         # op deck can be easily mis-detected, so we need to wait until time up
-        if (time.perf_counter() - info.t_end < self.WAIT_TIME):
+        if (self.fm.clock.Now() - info.t_end < self.WAIT_TIME):
             return False
 
         idx = 0
@@ -13,6 +13,8 @@ import logging
 import os
 
 class CardPlayedTask(TaskBase):
+    PARALLEL_SAFE = True
+
     def __init__(self, frame_manager, is_op):
         super().__init__(frame_manager)
         self.event_type   = EGameEvent.OpPlayed if is_op else EGameEvent.MyPlayed
@@ -39,7 +41,9 @@ class CardPlayedTask(TaskBase):
         if (self.event_type == EGameEvent.MyPlayed) and (self.fm.turn != ETurn.My):
             return -1, 100
 
-        card_id, dist, dists = self.card_handler.Update(self.frame_buffer, self.db)
+        # Op's deck is unknown, and my played cards are searched in my deck first
+        restricted_mask = self.fm.GetMyDeckMask(self.event_type) if self.event_type == EGameEvent.MyPlayed else None
+        card_id, dist, dists = self.card_handler.Update(self.frame_buffer, self.db, restricted_mask=restricted_mask)
         if cfg.DEBUG and False:
             # if (self.event_type == EGameEvent.MyPlayed) and True: #(card_id != -1):
                 # SaveImage(self.card_handler.region_buffer, os.path.join(cfg.debug_dir, "save", f"{self.event_type.name}{self.fm.frame_count}.png"))
@@ -62,4 +66,6 @@ class CardPlayedTask(TaskBase):
 
         if cfg.DEBUG_SAVE:
             image = self.card_handler.region_buffer
-            SaveImage(image, os.path.join(cfg.debug_dir, "save", f"{self.event_type.name}{self.fm.frame_count}.png"))
\ No newline at end of file
+            # Each frame has its own file, so they are sampled per event type
+            self.fm.image_writer.Save(image, os.path.join(cfg.debug_dir, "save", f"{self.event_type.name}{self.fm.frame_count}.png"), 
+                                      source=self.event_type.name)
\ No newline at end of file
@@ -2,7 +2,7 @@ from .card_flow import CenterCropTask
 
 from ..enums import EGameEvent
 from ..config import cfg, override, LogDebug, LogInfo, LogError
-from ..feature import ActionCardHandler, CardName, Counter
+from ..feature import CardName, Counter
 from ..stream_filter import StreamFilter
 
 class CardSelectTask(CenterCropTask):
@@ -31,13 +31,19 @@ class CardSelectTask(CenterCropTask):
     def Tick(self):
         bboxes, costs = self.DetectCenterCards()
         valid = (len(bboxes) == self.n_cards)
+        if valid:
+            # Cards are searched among the ones with the detected cost first,
+            # and the starting hand is always drawn from my deck
+            restricted_masks = [self.db.GetCostMask(cost) for cost in costs]
+            deck_mask = self.fm.GetMyDeckMask(EGameEvent.Invalid) if self.is_starting_hand else None
+            if deck_mask is not None:
+                restricted_masks = [deck_mask.Intersect(mask) for mask in restricted_masks]
+            results = self.handler_pool.UpdateBatch(self.frame_buffer, bboxes, self.db, threshold=40, check_next_dist=False, 
+                                                    restricted_masks=restricted_masks)
 
         for i in range(self.n_cards):
             if valid:
-                bbox = bboxes[i]
-                card_handler = ActionCardHandler()
-                card_handler.OnResize(bbox)
-                card_id, dist, dists = card_handler.Update(self.frame_buffer, self.db, threshold=40, check_next_dist=False)
+                card_id, dist, dists = results[i]
             else:
                 card_id = -1
                 dist = 0
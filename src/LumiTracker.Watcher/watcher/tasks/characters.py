@@ -17,7 +17,6 @@ class SingleCharacterTask(TaskBase):
         super().__init__(frame_manager)
         self.parent        = parent
         self.index         = index
-        self.handler       = CharacterCardHandler()
         # init when parent resize
         self.crop_box      = None   
         self.border_box    = None
@@ -40,12 +39,8 @@ class SingleCharacterTask(TaskBase):
         # Should Tick by parent
         raise NotImplementedError()
 
-    def TickVS(self):
-        buffer = self.frame_buffer[
-            self.crop_box.top  : self.crop_box.bottom, 
-            self.crop_box.left : self.crop_box.right
-        ]
-        card_id, dist, dists = self.handler.Update(buffer, self.db)
+    def TickVS(self, card_id, dist):
+        # Cards of all characters are detected in one batch by parent
         card_id = self.filter.Filter(card_id, dist=dist)
         if card_id >= 0:
             self.card_id = card_id
@@ -76,9 +71,12 @@ class SingleCharacterTask(TaskBase):
 
 
 class AllCharactersTask(TaskBase):
+    PARALLEL_SAFE = True
+
     def __init__(self, frame_manager):
         super().__init__(frame_manager)
         self.tasks = [SingleCharacterTask(frame_manager, self, i) for i in range(6)]
+        self.handler = CharacterCardHandler()
         self.Reset()
 
     @override
@@ -117,9 +115,9 @@ class AllCharactersTask(TaskBase):
         marginVS     = round(client_width  * box[0])
         marginInGame = round(client_width  * box[1])
         deltaY       = round(client_height * box[2])
+        # All character cards have the same size
+        self.handler.OnResize(CropBox(0, 0, width, height))
         for i in range(6):
-            self.tasks[i].handler.OnResize(CropBox(0, 0, width, height))
-
             offsetX = 0
             offsetY = 0
             border_offsetY = 0
@@ -176,14 +174,21 @@ class AllCharactersTask(TaskBase):
     def TickVS(self):
         my_ctx = [0, 0] # prev, cur
         op_ctx = [0, 0]
+        pending = []
         for i in range(6):
             task = self.tasks[i]
             ctx = my_ctx if i < 3 else op_ctx
             if task.card_id >= 0:
                 ctx[0] += 1
-                continue
+            else:
+                pending.append(i)
 
-            task.TickVS()
+        bboxes  = [self.tasks[i].crop_box for i in pending]
+        results = self.handler.UpdateBatch(self.frame_buffer, bboxes, self.db)
+        for i, (card_id, dist, dists) in zip(pending, results):
+            task = self.tasks[i]
+            ctx = my_ctx if i < 3 else op_ctx
+            task.TickVS(card_id, dist)
 
             if task.card_id >= 0:
                 ctx[1] += 1
@@ -204,7 +209,7 @@ class AllCharactersTask(TaskBase):
                 cards=cards,
                 names=[ChracterName(card_id, self.db) for card_id in cards[3:]],
                 )
-            self.fm.op_characters = cards[3:]
+            self.UpdateFrameManager(op_characters=cards[3:])
 
     def TickInGameForPlayer(self, active_filter : StreamFilter):
         is_op = (active_filter == self.op_active_filter)
@@ -4,7 +4,6 @@ from ..enums import EAnnType, ECtrlType, EGameEvent, ERegionType, ETurn
 from ..config import cfg, override, LogDebug, LogInfo
 from ..regions import REGIONS
 from ..feature import CropBox, ExtractFeature_Control
-from ..database import SaveImage
 from ..stream_filter import StreamFilter
 
 import numpy as np
@@ -12,7 +11,6 @@ import logging
 import os
 import cv2
 import enum
-from datetime import datetime
 
 class EGameResult(enum.Enum):
     Null = 0
@@ -20,6 +18,9 @@ class EGameResult(enum.Enum):
     Lose = enum.auto()
 
 class GameOverTask(TaskBase):
+    PARALLEL_SAFE = True
+    TICK_RATE     = 5  # the result screen stays for seconds
+
     def __init__(self, frame_manager):
         super().__init__(frame_manager)
         self.event_type = EGameEvent.GameOver
@@ -28,7 +29,7 @@ class GameOverTask(TaskBase):
 
     @override
     def Reset(self):
-        self.filter = StreamFilter(null_val=EGameResult.Null)
+        self.filter = StreamFilter(null_val=EGameResult.Null, period=self.schedule.period)
     
     @override
     def OnResize(self, client_width, client_height, ratio_type):
@@ -46,9 +47,9 @@ class GameOverTask(TaskBase):
         res = self.filter.Filter(res, dist)
 
         if res != EGameResult.Null:
-            self.fm.game_started = False
+            self.UpdateFrameManager(game_started=False)
 
-            game_end_time = datetime.now()
+            game_end_time = self.fm.clock.DateTime()
             duration = (game_end_time - self.fm.game_start_time).total_seconds()
             starts_first = (self.fm.first_turn == ETurn.My) if self.fm.first_turn != ETurn.Null else None
             LogInfo(
@@ -76,8 +77,8 @@ class GameOverTask(TaskBase):
             return EGameResult.Null, 100
 
         feature = ExtractFeature_Control(main_content)
-        ctrl_ids, dists = self.db.SearchByFeature(feature, EAnnType.CTRLS)
-        ctrl_id, dist = ctrl_ids[0], dists[0]
+        result = self.db.SearchByFeature(feature, EAnnType.CTRLS)
+        ctrl_id, dist = result.ids[0], result.dist
         if dist > cfg.strict_threshold:
             res = EGameResult.Null
         elif ECtrlType.IsGameWin(ctrl_id):
@@ -87,10 +88,10 @@ class GameOverTask(TaskBase):
         else:
             res = EGameResult.Null
 
-        # LogDebug(res=f"{res}", dists=dists[:3])
+        # LogDebug(res=f"{res}", dists=result.dists)
 
         if cfg.DEBUG_SAVE:
-            SaveImage(main_content, os.path.join(cfg.debug_dir, "save", f"{self.event_type.name}.png"))
+            self.fm.image_writer.Save(main_content, os.path.join(cfg.debug_dir, "save", f"{self.event_type.name}.png"))
         return res, dist
 
     @staticmethod
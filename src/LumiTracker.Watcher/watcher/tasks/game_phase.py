@@ -4,7 +4,6 @@ from ..enums import EAnnType, ECtrlType, EGamePhase, ERegionType
 from ..config import cfg, override, LogDebug, LogInfo
 from ..regions import REGIONS
 from ..feature import CropBox, ExtractFeature_Control_Grayed
-from ..database import SaveImage
 from ..stream_filter import StreamFilter
 
 import numpy as np
@@ -66,8 +65,8 @@ class GamePhaseTask(TaskBase):
         content = gray[top:bottom, left:right]
 
         feature = ExtractFeature_Control_Grayed(content)
-        ctrl_ids, dists = self.db.SearchByFeature(feature, EAnnType.CTRLS)
-        ctrl_id, dist = ctrl_ids[0], dists[0]
+        result = self.db.SearchByFeature(feature, EAnnType.CTRLS)
+        ctrl_id, dist = result.ids[0], result.dist
         if dist > cfg.strict_threshold:
             res = EGamePhase.Null
         elif ECtrlType.IsPhaseAction(ctrl_id):
@@ -75,9 +74,9 @@ class GamePhaseTask(TaskBase):
         else:
             res = EGamePhase.Null
 
-        # LogDebug(res=f"{res}", dists=dists[:3])
+        # LogDebug(res=f"{res}", dists=result.dists)
 
         if cfg.DEBUG_SAVE:
-            SaveImage(buffer[top:bottom, left:right], os.path.join(cfg.debug_dir, "save", f"{res.name}.png"))
+            self.fm.image_writer.Save(buffer[top:bottom, left:right], os.path.join(cfg.debug_dir, "save", f"{res.name}.png"))
         return res, dist
 
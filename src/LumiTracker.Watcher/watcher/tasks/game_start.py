@@ -4,7 +4,6 @@ from ..enums import EAnnType, ECtrlType, EGameEvent, ERegionType
 from ..config import cfg, override, LogDebug, LogInfo
 from ..regions import REGIONS
 from ..feature import CropBox, ExtractFeature_Control
-from ..database import SaveImage
 from ..stream_filter import StreamFilter
 
 import numpy as np
@@ -12,6 +11,8 @@ import logging
 import os
 
 class GameStartTask(TaskBase):
+    PARALLEL_SAFE = True
+
     def __init__(self, frame_manager):
         super().__init__(frame_manager)
         self.event_type = EGameEvent.GameStart
@@ -43,22 +44,22 @@ class GameStartTask(TaskBase):
         ]
 
         feature = ExtractFeature_Control(buffer)
-        ctrl_ids, dists = self.db.SearchByFeature(feature, EAnnType.CTRLS)
-        start = (dists[0] <= cfg.strict_threshold) and (ctrl_ids[0] == ECtrlType.GAME_START.value)
-        # LogDebug(start=start, dists=dists[0])
-        start = self.filter.Filter(start, dists[0])
+        result = self.db.SearchByFeature(feature, EAnnType.CTRLS)
+        start = (result.dist <= cfg.strict_threshold) and (result.ids[0] == ECtrlType.GAME_START.value)
+        # LogDebug(start=start, dists=result.dist)
+        start = self.filter.Filter(start, result.dist)
 
         self.detected = start
 
         if start:
-            self.fm.game_started = True
+            self.UpdateFrameManager(game_started=True)
 
             LogInfo(
-                info=f"Game Started, last dist in window = {dists[0]}",
+                info=f"Game Started, last dist in window = {result.dist}",
                 type=self.event_type.name,
                 )
             if cfg.DEBUG_SAVE:
-                SaveImage(buffer, os.path.join(cfg.debug_dir, "save", f"{self.event_type.name}.png"))
+                self.fm.image_writer.Save(buffer, os.path.join(cfg.debug_dir, "save", f"{self.event_type.name}.png"))
 
             if self.filter.PrevSignalHasLeft():
                 self.Reset()
\ No newline at end of file
@@ -1,11 +1,10 @@
 from .base import TaskBase
 
 from ..enums import EAnnType, ECtrlType, EGameEvent, ERegionType, ETurn
-from ..config import cfg, override, LogDebug, LogInfo
+from ..config import cfg, override, LogDebug, LogInfo, Deferred
 from ..regions import REGIONS
 from ..feature import CropBox, ExtractFeature_Control, ExtractFeature_Digit_Binalized
 from ..feature import ExtractFeature_Control_Single, HashToFeature, FeatureDistance
-from ..database import SaveImage
 from ..stream_filter import StreamFilter
 
 import numpy as np
@@ -14,20 +13,26 @@ import os
 import cv2
 
 class RoundTask(TaskBase):
+    PARALLEL_SAFE = True
+
     def __init__(self, frame_manager):
         super().__init__(frame_manager)
         self.event_type = EGameEvent.Round
         self.crop_box   = None  # init when resize
 
+        self.Reset()
+
+    @override
+    def SetDatabase(self, db):
+        super().SetDatabase(db)
         idx = ECtrlType.MY_TURN.value - ECtrlType.CTRL_SINGLE_FIRST.value
         self.my_turn_feature = HashToFeature(self.db["ctrls"][idx])
         idx = ECtrlType.OP_TURN.value - ECtrlType.CTRL_SINGLE_FIRST.value
         self.op_turn_feature = HashToFeature(self.db["ctrls"][idx])
 
-        self.Reset()
-
     @override
     def Reset(self):
+        # Full rate: the banner is short, a lower rate would not reject glitches of the digits
         self.filter = StreamFilter(null_val=-1, cooldown=30)
         self.turn_filter = StreamFilter(null_val=ETurn.Null)
 
@@ -77,7 +82,7 @@ class RoundTask(TaskBase):
         detected = self.turn_filter.Filter(detected, dist)
         if detected != ETurn.Null:
             LogDebug(turn=f"{detected}", dist=dist)
-            self.fm.SetTurn(detected)
+            Deferred(self.fm.SetTurn, detected)
 
     def TickRound(self):
         buffer = self.frame_buffer[
@@ -92,11 +97,11 @@ class RoundTask(TaskBase):
         # LogDebug(before=before, after=after)
 
         if (cur_round != -1) and (self.fm.round != cur_round):
-            self.fm.round = cur_round
+            self.UpdateFrameManager(round=cur_round)
             LogInfo(
                 info=f"Found Round Text",
                 type=self.event_type.name, 
-                round=self.fm.round,
+                round=cur_round,
                 )
 
     def DetectCurrentRound(self, buffer):
@@ -117,15 +122,15 @@ class RoundTask(TaskBase):
             # digit should crop from binary image
             content = binary[bbox.top:bbox.bottom, bbox.left:bbox.right]
             feature = ExtractFeature_Digit_Binalized(content)
-            results, dists = self.db.SearchByFeature(feature, EAnnType.DIGITS)
+            result = self.db.SearchByFeature(feature, EAnnType.DIGITS)
             # 0 ~ 9 is for round's digit, which is solid
-            digit = results[0]
-            if digit < 0 or digit > 9 or dists[0] > cfg.strict_threshold:
+            digit = result.ids[0]
+            if digit < 0 or digit > 9 or result.dist > cfg.strict_threshold:
                 digit = -1
 
             # accumulate
             if digit >= 0:
-                # LogDebug(digit=digit, dists=dists[:3])
+                # LogDebug(digit=digit, dists=result.dists)
                 cur_round += digit * base
                 base *= 10
                 index -= 1
@@ -150,13 +155,13 @@ class RoundTask(TaskBase):
         # round text should crop from colored buffer
         content = buffer[remain_bbox.top:remain_bbox.bottom, remain_bbox.left:remain_bbox.right]
         feature = ExtractFeature_Control(content)
-        ctrl_ids, dists = self.db.SearchByFeature(feature, EAnnType.CTRLS)
-        found = (dists[0] <= cfg.strict_threshold) and ECtrlType.IsRound(ctrl_ids[0])
+        result = self.db.SearchByFeature(feature, EAnnType.CTRLS)
+        found = (result.dist <= cfg.strict_threshold) and ECtrlType.IsRound(result.ids[0])
 
-        # LogDebug(found=found, dists=dists[:3], cur_round=cur_round)
+        # LogDebug(found=found, dists=result.dists, cur_round=cur_round)
 
         if cfg.DEBUG_SAVE:
-            SaveImage(content, os.path.join(cfg.debug_dir, "save", f"{self.event_type.name}.png"))
+            self.fm.image_writer.Save(content, os.path.join(cfg.debug_dir, "save", f"{self.event_type.name}.png"))
 
         return cur_round if found else -1
 
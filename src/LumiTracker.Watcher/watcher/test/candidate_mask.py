@@ -0,0 +1,131 @@
+from ..config import cfg
+from ..database import Database
+from ..enums import EActionCard, EGameEvent
+from ..feature import ActionCardHandler, CandidateMask, HammingDistances, ImageHash
+from .cascade_search import PerturbedHash
+from .search_result import LegacyDecide
+
+import numpy as np
+import sys
+
+EVENTS = (EGameEvent.Invalid, EGameEvent.MyPlayed, EGameEvent.OpPlayed)
+EVENT_NAMES = {EGameEvent.Invalid: "Invalid", EGameEvent.MyPlayed: "MyPlayed", EGameEvent.OpPlayed: "OpPlayed"}
+
+class EventCheckedHandler:
+    """
+    ActionCardHandler as it was before candidate masks, rejecting the arcane legends of the other side after the search.
+    """
+    def __init__(self, handler):
+        self.handler = handler
+        self.NEXT_DIST_MARGIN = handler.NEXT_DIST_MARGIN
+
+    def AllowEarlyReturn(self, card_id):
+        return self.handler.AllowEarlyReturn(card_id)
+
+    def RemapCardId(self, card_id, db, dist, threshold, strict_threshold):
+        if EActionCard.IsExtraMyArcaneLegend(card_id) and self.handler.event != EGameEvent.MyPlayed:
+            return -1
+        if EActionCard.IsExtraOpArcaneLegend(card_id) and self.handler.event != EGameEvent.OpPlayed:
+            return -1
+        return self.handler.RemapCardId(card_id, db, dist, threshold, strict_threshold)
+
+def BruteForce(engine, feature, n, mask):
+    """
+    Top n of the allowed items by (dist, id), from the distances to all items.
+    """
+    dists = HammingDistances(feature, engine.matrix)
+    ids   = [i for i in np.argsort(dists, kind="stable") if mask.mask[i]][:n]
+    return [int(i) for i in ids], dists[ids].tolist()
+
+def RandomQuery(engine, rng, extras_ratio=0.3):
+    # Bias the queries to the extras, where the masks matter
+    if rng.random() < extras_ratio:
+        card_id = int(rng.integers(EActionCard.NumActions.value, engine.GetNumItems()))
+    else:
+        card_id = int(rng.integers(engine.GetNumItems()))
+    return PerturbedHash(engine.GetFeatureById(card_id), int(rng.integers(0, 30)), rng)
+
+def CheckSearch(db, rng, num_queries=1000):
+    """
+    Masked search must return exactly the allowed items of a brute-force search, with and without the bound.
+    """
+    handler = ActionCardHandler()
+    engine  = db.GetEngine(handler.ann_type_a)
+    bound   = handler.CascadeBound(cfg.threshold, cfg.strict_threshold)
+
+    mismatches = []
+    for _ in range(num_queries):
+        feature = RandomQuery(engine, rng)
+        for event in EVENTS:
+            mask = ActionCardHandler.CandidateMaskOf(event)
+            n    = engine.NEAREST_N
+            expected = BruteForce(engine, feature, n, mask)
+            if engine.Search(feature, n, mask=mask) != expected:
+                mismatches.append((event, expected, engine.Search(feature, n, mask=mask)))
+
+            # the bounded search is only exact within bound
+            ids, dists = engine.Search(feature, n, bound=bound, mask=mask)
+            exact = [(i, d) for i, d in zip(*expected) if d <= bound]
+            if list(zip(ids, dists))[:len(exact)] != exact:
+                mismatches.append((event, bound, expected, (ids, dists)))
+
+    try:
+        engine.Search(feature, 1, mask=CandidateMask(np.ones((3,), dtype=bool)))
+        mismatches.append("mask of the wrong size is accepted")
+    except ValueError:
+        pass
+    return mismatches
+
+def CompareDecisions(db, rng, num_queries=2000):
+    """
+    Decisions of masked searches against the event check after an unmasked search.
+    Return {event: (changed, rescued)}, rescued ones were rejected before.
+    """
+    stats = {}
+    for event in EVENTS:
+        handler = ActionCardHandler(event)
+        legacy  = EventCheckedHandler(handler)
+        mask    = handler.GetCandidateMask()
+        engine_a = db.GetEngine(handler.ann_type_a)
+        engine_d = db.GetEngine(handler.ann_type_d)
+        num_changed, num_rescued = 0, 0
+        for _ in range(num_queries):
+            card_id = int(rng.integers(EActionCard.NumActions.value, engine_a.GetNumItems()))
+            num_flips = int(rng.integers(0, 30))
+            ahash = PerturbedHash(engine_a.GetFeatureById(card_id), num_flips, rng)
+            dhash = PerturbedHash(engine_d.GetFeatureById(card_id), num_flips, rng)
+
+            before = LegacyDecide(legacy, db, *engine_a.Search(ahash, n=20), *engine_d.Search(dhash, n=20),
+                True, cfg.threshold, cfg.strict_threshold)
+            after  = handler.Decide(db,
+                db.SearchByFeature(ahash, handler.ann_type_a, mask=mask),
+                db.SearchByFeature(dhash, handler.ann_type_d, mask=mask),
+                True, cfg.threshold, cfg.strict_threshold)
+            if before[0] != after[0]:
+                num_changed += 1
+                num_rescued += (before[0] < 0)
+        stats[event] = (num_changed, num_rescued)
+    return stats
+
+def main():
+    """
+    Candidate masks of ActionCardHandler must search only the allowed ids, exactly.
+    Also report how many decisions on extras change from the masks, for the record.
+    """
+    db = Database()
+    db.Load()
+    rng = np.random.default_rng(2)
+
+    mismatches = CheckSearch(db, rng)
+    print(f"masked search: {len(mismatches)} mismatches")
+    for mismatch in mismatches[:10]:
+        print("    ", mismatch)
+
+    for event, (num_changed, num_rescued) in CompareDecisions(db, rng).items():
+        print(f"{EVENT_NAMES[event]}: {num_changed} decisions changed, {num_rescued} of them rescued from rejection")
+
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
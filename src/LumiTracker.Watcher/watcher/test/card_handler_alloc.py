@@ -0,0 +1,83 @@
+from ..config import cfg
+from ..database import Database
+from ..feature import ActionCardHandler, CharacterCardHandler, CropBox
+from ..search_engine import QueryMemo
+
+import numpy as np
+import sys
+import tracemalloc
+
+# Only the iterators of a few NumPy reductions and broadcasts are allocated,
+# any image sized buffer is far above this (the resized float image alone is 240KB)
+MAX_PEAK_BYTES = 8 * 1024
+# The search also allocates the distances to every item, about 30KB for the action cards
+MAX_UPDATE_PEAK_BYTES = 64 * 1024
+
+def MeasurePeak(func, n_warmup=5, n_iters=100):
+    tracemalloc.start()
+    for _ in range(n_warmup):
+        func()
+
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    for _ in range(n_iters):
+        func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak - base
+
+def MeasureGrowth(func, n_warmup=5, n_iters=100):
+    """
+    Number and bytes of the NumPy arrays allocated by n_iters calls which are still alive,
+    keeping every result like a caller could.
+    """
+    domain_filter = [tracemalloc.DomainFilter(True, np.lib.tracemalloc_domain)]
+    tracemalloc.start()
+    for _ in range(n_warmup):
+        func()
+
+    before  = tracemalloc.take_snapshot().filter_traces(domain_filter)
+    results = [func() for _ in range(n_iters)]
+    after   = tracemalloc.take_snapshot().filter_traces(domain_filter)
+    tracemalloc.stop()
+    stats = after.compare_to(before, "lineno")
+    return sum(stat.count_diff for stat in stats), sum(stat.size_diff for stat in stats)
+
+def main():
+    """
+    In steady state, CardHandler must not allocate image buffers per frame, and no NumPy array at all:
+    the hashes are written into words owned by the handler, and a static frame is answered by the query memo.
+    The search of Update is measured with the query memo disabled, since the same frame is hashed again and again.
+    """
+    db = Database()
+    db.Load()
+
+    rng = np.random.default_rng(0)
+    frame_buffer = rng.integers(0, 256, size=(1080, 1920, 4), dtype=np.uint8)
+
+    num_failed = 0
+    for handler in (ActionCardHandler(), CharacterCardHandler()):
+        handler.OnResize(CropBox(800, 300, 1010, 660))
+        handler.frame_buffer = frame_buffer
+
+        db.query_memo = QueryMemo(0)
+        extract_peak = MeasurePeak(handler.ExtractCardFeatures)
+        update_peak  = MeasurePeak(lambda: handler.Update(frame_buffer, db))
+        print(f"{type(handler).__name__}: ExtractCardFeatures peak = {extract_peak} bytes, Update peak = {update_peak} bytes")
+
+        db.query_memo = QueryMemo(cfg.query_memo_size)
+        extract_growth = MeasureGrowth(handler.ExtractCardFeatures)
+        update_growth  = MeasureGrowth(lambda: handler.Update(frame_buffer, db))
+        print(f"    NumPy arrays kept (count, bytes): ExtractCardFeatures = {extract_growth}, "
+              f"Update with memo hits = {update_growth}, hit rate = {db.query_memo.AsDict()['hit_rate']:.2f}")
+
+        if extract_peak > MAX_PEAK_BYTES or update_peak > MAX_UPDATE_PEAK_BYTES:
+            num_failed += 1
+        if extract_growth != (0, 0) or update_growth != (0, 0):
+            num_failed += 1
+
+    if num_failed > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+from ..config import cfg
+from ..database import Database
+from ..feature import ActionCardHandler, CharacterCardHandler, ImageHash
+
+import numpy as np
+import sys
+
+def PerturbedHash(feature, num_flips, rng):
+    bits = feature.ToBits().copy()
+    bits[rng.choice(bits.size, num_flips, replace=False)] ^= True
+    return ImageHash.FromBits(bits)
+
+def main():
+    """
+    Searching with the coarse prefilter bound must not change any decision of Update.
+    Queries are database hashes with random bit flips, plus some pure noise like frames without cards.
+    """
+    db = Database()
+    db.Load()
+    rng = np.random.default_rng(0)
+
+    num_queries = 0
+    mismatches = []
+    for handler in (ActionCardHandler(), CharacterCardHandler()):
+        engine_a = db.GetEngine(handler.ann_type_a)
+        engine_d = db.GetEngine(handler.ann_type_d)
+        for _ in range(2000):
+            card_id = int(rng.integers(engine_a.GetNumItems()))
+            if rng.random() < 0.2:
+                ahash = ImageHash.FromBits(rng.random(engine_a.num_bits) < 0.5)
+                dhash = ImageHash.FromBits(rng.random(engine_d.num_bits) < 0.5)
+            else:
+                num_flips = int(rng.integers(0, 40))
+                ahash = PerturbedHash(engine_a.GetFeatureById(card_id), num_flips, rng)
+                dhash = PerturbedHash(engine_d.GetFeatureById(card_id), num_flips, rng)
+
+            mask = handler.GetCandidateMask()
+            for check_next_dist, threshold in ((True, cfg.threshold), (False, 40), (True, 40)):
+                exact_a  = db.SearchByFeature(ahash, handler.ann_type_a, mask=mask)
+                exact_d  = db.SearchByFeature(dhash, handler.ann_type_d, mask=mask)
+                expected = handler.Decide(db, exact_a, exact_d, check_next_dist, threshold, cfg.strict_threshold)
+
+                bound = handler.CascadeBound(threshold, cfg.strict_threshold)
+                result_a = db.SearchByFeature(ahash, handler.ann_type_a, bound=bound, mask=mask)
+                result_d = db.SearchByFeature(dhash, handler.ann_type_d, bound=bound, mask=mask)
+                result = handler.DecideCascaded(db, ahash, dhash, result_a, result_d, bound, 
+                    check_next_dist, threshold, cfg.strict_threshold)
+
+                num_queries += 1
+                # the distance of a rejected query is only a lower bound, beyond the bound
+                rejected = result_a.dist > bound and result_d.dist > bound
+                if rejected:
+                    ok = bound < result[1] <= min(exact_a.dist, exact_d.dist)
+                else:
+                    ok = expected[0] < 0 or result[1] == expected[1]
+                if result[0] != expected[0] or not ok:
+                    mismatches.append((expected, result))
+
+    print(f"{num_queries} queries, {len(mismatches)} mismatches, {db.cascade_stats.AsDict()}")
+    for mismatch in mismatches[:10]:
+        print("    ", mismatch)
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+from ..database import Database
+from ..enums import EActionCard
+from ..feature import ActionCardHandler
+from ..search_engine import QueryMemo
+from .cascade_search import PerturbedHash
+
+import numpy as np
+import sys
+import time
+
+def Replay(handler, db, queries, costs):
+    """
+    Recognize like CardFlowTask, with the cost partition of each query if costs is given.
+    Return the card ids, the number of candidates scored and the time.
+    """
+    masks = [None] * len(queries) if costs is None else [db.GetCostMask(cost) for cost in costs]
+    card_ids   = []
+    begin_time = time.perf_counter()
+    for (ahash, dhash), mask in zip(queries, masks):
+        card_id, _, _ = handler.Recognize(db, ahash, dhash, False, 40, 40, mask)
+        card_ids.append(card_id)
+    total_time = time.perf_counter() - begin_time
+
+    num_items  = handler.GetCandidateMask().ids.size
+    candidates = 0
+    for (ahash, dhash), mask in zip(queries, masks):
+        if mask is None:
+            candidates += num_items
+            continue
+        # The fallback searches all cards again
+        mask = handler.RestrictCandidateMask(mask)
+        bound = handler.CascadeBound(40, 40)
+        result_a = db.SearchByFeature(ahash, handler.ann_type_a, bound=bound, mask=mask)
+        result_d = db.SearchByFeature(dhash, handler.ann_type_d, bound=bound, mask=mask)
+        result = handler.DecideCascaded(db, ahash, dhash, result_a, result_d, bound, False, 40, 40, mask)
+        trusted = result[0] >= 0 and handler.TrustRestricted(db, mask, result_a, result_d, bound)
+        candidates += mask.ids.size + (0 if trusted else num_items)
+    return card_ids, candidates / len(queries), total_time
+
+def main():
+    """
+    Center cards are searched in the partition of their cost digit first.
+    Compare the candidates per query, the recognition and the time with the full search,
+    for cards showing their cost and for cards with a modified cost, which fall back to the full search.
+    Both must recognize the same cards as the full search, since the partition is only trusted
+    when no card outside of it can be nearer, see TrustRestricted.
+    """
+    db = Database()
+    db.query_memo = QueryMemo(0)
+    db.Load()
+    rng = np.random.default_rng(4)
+
+    handler  = ActionCardHandler()
+    engine_a = db.GetEngine(handler.ann_type_a)
+    engine_d = db.GetEngine(handler.ann_type_d)
+    costs, cost_modified = db._ActionCostDigits()
+    print("partition sizes:", {cost: db.GetCostMask(cost).ids.size for cost in range(7)},
+          f"cost-modified: {int(cost_modified.sum())}")
+
+    num_failed = 0
+    card_ids = [card_id for card_id in range(EActionCard.NumActions.value) if not cost_modified[card_id]]
+    for name, cost_offset in (("shown cost", 0), ("modified cost", 1)):
+        truths, queries, query_costs = [], [], []
+        for _ in range(3000):
+            card_id = int(rng.choice(card_ids))
+            num_flips = int(rng.integers(0, 30))
+            truths.append(card_id)
+            queries.append((PerturbedHash(engine_a.GetFeatureById(card_id), num_flips, rng),
+                            PerturbedHash(engine_d.GetFeatureById(card_id), num_flips, rng)))
+            query_costs.append((int(costs[card_id]) + cost_offset) % 7)
+
+        full, full_candidates, full_time = Replay(handler, db, queries, None)
+        partitioned, partitioned_candidates, partitioned_time = Replay(handler, db, queries, query_costs)
+
+        wrong_full        = sum(c >= 0 and c != t for c, t in zip(full, truths))
+        wrong_partitioned = sum(c >= 0 and c != t for c, t in zip(partitioned, truths))
+        print(f"{name}: candidates per query full={full_candidates:.1f} partitioned={partitioned_candidates:.1f}, "
+              f"recognized full={sum(c == t for c, t in zip(full, truths))} partitioned={sum(c == t for c, t in zip(partitioned, truths))}, "
+              f"misrecognized full={wrong_full} partitioned={wrong_partitioned}, "
+              f"time full={full_time * 1000:.1f}ms partitioned={partitioned_time * 1000:.1f}ms")
+        if partitioned != full:
+            print(f"    {name}: failed")
+            num_failed += 1
+
+    if num_failed > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+from ..config import cfg
+from ..database import Database
+from ..frame_manager import FrameManager
+from ..states import GTasks
+
+import numpy as np
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+def RunUntilSwapped(fm, frame, timeout=10.0):
+    old_db = fm.db
+    begin_time = time.perf_counter()
+    num_frames = 0
+    while fm.db is old_db and time.perf_counter() - begin_time < timeout:
+        fm.OnFrameArrived(frame)
+        num_frames += 1
+        time.sleep(0.01)
+    return fm.db is not old_db, num_frames
+
+def CheckTasks(fm):
+    stale = []
+    GTasks.ForEach(lambda task: stale.append(type(task).__name__) if task.db is not fm.db else None)
+    return stale
+
+def Rebuild():
+    """
+    What a database build does to the files: a new db.json, then its binary database.
+    """
+    json_path = os.path.join(cfg.database_dir, cfg.db_filename)
+    with open(json_path, "a", encoding="utf-8") as f:
+        f.write(" ")
+    db = Database()
+    db._LoadFiles()
+    db.SaveBinary()
+    return db._BinaryPath()
+
+def main():
+    """
+    A reload requested by input, or by a rebuild of the database files, swaps a fully loaded database into every task.
+    The files are a copy in a temporary directory, the ones of the repository are never touched.
+    """
+    with tempfile.TemporaryDirectory() as database_dir:
+        shutil.copytree(cfg.database_dir, database_dir, dirs_exist_ok=True)
+        cfg.database_dir = database_dir
+        num_failed = Run()
+    if num_failed > 0:
+        sys.exit(1)
+
+def Run():
+    cfg.db_watch_interval = 0.05
+    fm = FrameManager()
+    fm.Resize(1920, 1080)
+    frame = np.zeros((1080, 1920, 4), dtype=np.uint8)
+    for _ in range(5):
+        fm.OnFrameArrived(frame)
+
+    num_failed = 0
+
+    fm.db_reloader.Request()
+    swapped, num_frames = RunUntilSwapped(fm, frame)
+    stale = CheckTasks(fm)
+    print(f"Request: swapped={swapped} after {num_frames} frames, stale tasks: {stale}")
+    num_failed += (not swapped) + len(stale)
+
+    binary_path = Rebuild()
+    swapped, num_frames = RunUntilSwapped(fm, frame)
+    stale = CheckTasks(fm)
+    mapped = fm.db.binary.path if fm.db.binary is not None else None
+    print(f"File change: swapped={swapped} after {num_frames} frames, stale tasks: {stale}, "
+          f"mapped {os.path.basename(str(mapped))}, rebuilt {os.path.basename(binary_path)}")
+    num_failed += (not swapped) + len(stale) + (mapped != binary_path)
+
+    # A fully loaded database never loads lazily in a frame
+    print(f"Unresolved indexes after swap: {sum(engine is None for engine in fm.db.anns)}")
+    num_failed += sum(engine is None for engine in fm.db.anns)
+    return num_failed
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+from ..database import Database
+from ..enums import EAnnType
+
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+LOADERS = ["lazy", "binary", "files"]
+
+def ResidentBytes():
+    # Only available on Linux, the number is left out elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def RunLoader(loader):
+    rss_before = ResidentBytes()
+    tracemalloc.start()
+    begin_time = time.perf_counter()
+
+    db = Database()
+    if loader == "files":
+        db._LoadFiles()
+    else:
+        db.Load()
+        if db.binary is None:
+            raise RuntimeError("binary database is not available")
+    if loader == "binary":
+        # Resolve every section, the same work as _LoadFiles
+        for i in range(EAnnType.ANN_COUNT.value):
+            db.GetEngine(EAnnType(i))
+        for name, _ in db.binary.directory:
+            if db.binary.HasData(name):
+                db[name]
+
+    load_time = time.perf_counter() - begin_time
+    heap, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = ResidentBytes()
+    return {
+        "load_ms"  : load_time * 1000,
+        "heap_kb"  : heap / 1024,
+        "rss_kb"   : (rss_after - rss_before) / 1024 if rss_before is not None else None,
+    }
+
+def Median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+def main(num_runs=7):
+    """
+    Cold start of Database.Load with the binary database, opened only (lazy) or fully resolved,
+    and with db.json + .ann files.
+    Each run is a fresh process, numpy and the watcher modules are imported before measuring.
+    """
+    if len(sys.argv) > 1:
+        print(json.dumps(RunLoader(sys.argv[1])))
+        return
+
+    for loader in LOADERS:
+        runs = []
+        for _ in range(num_runs):
+            output = subprocess.check_output([sys.executable, "-m", "watcher.test.db_load_bench", loader])
+            runs.append(json.loads(output.decode("utf-8").strip().splitlines()[-1]))
+        summary = {key: Median([run[key] for run in runs]) if runs[0][key] is not None else None for key in runs[0]}
+        print(f"{loader:>6}: " + ", ".join(f"{key}={value:.1f}" if value is not None else f"{key}=n/a" for key, value in summary.items()))
+
+if __name__ == "__main__":
+    main()
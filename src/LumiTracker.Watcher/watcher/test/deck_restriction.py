@@ -0,0 +1,119 @@
+from ..config import cfg
+from ..database import Database
+from ..deck import DecodeShareCode, DeckCandidateMask, NUM_DECK_CARDS
+from ..enums import EActionCard, ECharacterCard, EGameEvent
+from ..feature import ActionCardHandler
+from ..search_engine import QueryMemo
+from .cascade_search import PerturbedHash
+
+import numpy as np
+import base64
+import sys
+import time
+
+def EncodeShareCode(character_ids, action_ids, db, key=0):
+    """
+    Inverse of DecodeShareCode, for internal ids which all have share ids.
+    """
+    internal_to_share = {}
+    for share_id, internal_id in enumerate(db["share_to_internal"]):
+        if share_id > 0:
+            internal_to_share[internal_id] = share_id
+    share_ids  = [internal_to_share[-(card_id + 1)] for card_id in character_ids]
+    share_ids += [internal_to_share[card_id + 1] for card_id in action_ids]
+
+    bits = "".join(f"{share_id:012b}" for share_id in share_ids).ljust(400, "0")
+    code = [int(bits[i:i + 8], 2) for i in range(0, 400, 8)]
+    unswapped = [code[i // 2 + (25 if (i & 0x1) else 0)] for i in range(50)]
+    return base64.b64encode(bytes([(b + key) & 0xff for b in unswapped] + [key])).decode("ascii")
+
+def CheckShareCode(db, rng, num_decks=50):
+    num_failed = 0
+    for _ in range(num_decks):
+        character_ids = rng.choice(ECharacterCard.NumCharacters.value, 3, replace=False).tolist()
+        action_ids    = rng.choice(EActionCard.NumSharables.value, NUM_DECK_CARDS - 3).tolist()
+        sharecode = EncodeShareCode(character_ids, action_ids, db, key=int(rng.integers(256)))
+        if DecodeShareCode(sharecode, db) != (character_ids, action_ids):
+            num_failed += 1
+    if DecodeShareCode("not a share code", db) is not None:
+        num_failed += 1
+    return num_failed
+
+def Replay(handler, db, queries, restricted_mask, num_repeats=3):
+    """
+    Return the recognized ids and the best time of num_repeats runs.
+    """
+    best_time = None
+    for _ in range(num_repeats):
+        results = []
+        begin_time = time.perf_counter()
+        for ahash, dhash in queries:
+            results.append(handler.Recognize(db, ahash, dhash, True, cfg.threshold, cfg.strict_threshold, restricted_mask))
+        dt = time.perf_counter() - begin_time
+        best_time = dt if best_time is None else min(best_time, dt)
+    return [card_id for card_id, _, _ in results], best_time
+
+def MakeQueries(engine_a, engine_d, card_ids, max_flips, rng, num_queries=2000):
+    truths, queries = [], []
+    for _ in range(num_queries):
+        card_id = int(rng.choice(card_ids))
+        num_flips = int(rng.integers(0, max_flips))
+        truths.append(card_id)
+        queries.append((PerturbedHash(engine_a.GetFeatureById(card_id), num_flips, rng),
+                        PerturbedHash(engine_d.GetFeatureById(card_id), num_flips, rng)))
+    return truths, queries
+
+def main():
+    """
+    My played cards are searched in my deck first, and in all cards unless the nearest cards in the deck are
+    nearer than half of their distance to any other card, see TrustRestricted.
+    Compare the recognized cards and the search time with the full search, for cards in the deck and not in it.
+
+    The restricted search must recognize the same cards as the full search, for every play.
+    It pays off on clean captures of the cards in my deck, which are most of my plays: they must be faster.
+    Noisy captures and cards which are not in my deck, e.g. created during the game, cost one more, cheaper,
+    search: about 1.2x and 1.4x the time of the full search, at most 1.5x.
+    """
+    db = Database()
+    db.Load()
+    db.query_memo = QueryMemo(0)
+    rng = np.random.default_rng(3)
+
+    num_failed = CheckShareCode(db, rng)
+    print(f"share codes: {num_failed} failed round trips")
+
+    handler  = ActionCardHandler(EGameEvent.MyPlayed)
+    engine_a = db.GetEngine(handler.ann_type_a)
+    engine_d = db.GetEngine(handler.ann_type_d)
+
+    deck = rng.choice(EActionCard.NumSharables.value, 15, replace=False).tolist()
+    off_deck = [card_id for card_id in range(EActionCard.NumSharables.value) if card_id not in deck]
+    mask = DeckCandidateMask(deck, db, EGameEvent.MyPlayed)
+    print(f"deck mask: {mask.ids.size} of {mask.mask.size} items")
+
+    for name, card_ids, max_flips in (("in deck, clean", deck, 15), ("in deck", deck, 40), ("off deck", off_deck, 40)):
+        truths, queries = MakeQueries(engine_a, engine_d, card_ids, max_flips, rng)
+        full, full_time = Replay(handler, db, queries, None)
+        restricted, restricted_time = Replay(handler, db, queries, mask)
+        wrong_full       = sum(card_id >= 0 and card_id != truth for card_id, truth in zip(full, truths))
+        wrong_restricted = sum(card_id >= 0 and card_id != truth for card_id, truth in zip(restricted, truths))
+        right_full       = sum(card_id == truth for card_id, truth in zip(full, truths))
+        right_restricted = sum(card_id == truth for card_id, truth in zip(restricted, truths))
+
+        num_changed      = sum(card_id != full_id for card_id, full_id in zip(restricted, full))
+        print(f"{name}: misrecognized full={wrong_full} restricted={wrong_restricted}, "
+              f"recognized full={right_full} restricted={right_restricted}, changed={num_changed}, "
+              f"time full={full_time * 1000:.1f}ms restricted={restricted_time * 1000:.1f}ms")
+
+        ok = num_changed == 0 and restricted_time <= 1.5 * full_time
+        if max_flips < cfg.strict_threshold:
+            ok = ok and restricted_time < full_time
+        if not ok:
+            print(f"    {name}: failed")
+            num_failed += 1
+
+    if num_failed > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
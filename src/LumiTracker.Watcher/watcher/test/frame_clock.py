@@ -0,0 +1,74 @@
+from ..frame_manager import FrameManager
+from ..tasks import card_flow, game_over
+from ..tasks.card_flow import CardFlowTask
+from ..tasks.game_over import GameOverTask, EGameResult
+from ..enums import EClientType, EGameEvent
+
+import numpy as np
+import sys
+import time
+
+class WinningGameOverTask(GameOverTask):
+    def DetectGameResult(self):
+        return EGameResult.Win, 0
+
+def Capture(module, logged):
+    """
+    Record the LogInfo calls of a task module instead of printing them.
+    """
+    module.LogInfo = lambda **kwargs: logged.append(kwargs)
+
+def CheckCardFlowWait(fm):
+    """
+    An op deck signal is dumped WAIT_TIME after it ended on the frame clock, however fast the frames come.
+    """
+    logged = []
+    Capture(card_flow, logged)
+    task = CardFlowTask(fm)
+    t_end = fm.clock.Now()
+    task.op_deck_queue.append(t_end + 0.1)
+    info = CardFlowTask.SignalInfo(num_cards=1, t_begin=t_end - 0.5, t_end=t_end, cards=[0], valid=True)
+
+    waits = 0
+    while not task._DumpDetected(info):
+        waits += 1
+        fm.clock.Advance(fm.clock.Now() + 0.1)
+    num_expected = round(CardFlowTask.WAIT_TIME / 0.1)
+    print(f"CardFlow: dumped after {waits} frames of 0.1s, {[log['type'] for log in logged]}")
+    return waits == num_expected and [log["type"] for log in logged] == [EGameEvent.OpCreateDeck.name]
+
+def CheckGameDuration(fm):
+    """
+    The duration of a game is the frame clock time between its start and its end.
+    """
+    logged = []
+    Capture(game_over, logged)
+    fm.StartNewGame()
+    fm.game_started = True
+    fm.clock.Advance(fm.clock.Now() + 300.0)
+    task = WinningGameOverTask(fm)
+    while fm.game_started:
+        task.Tick()
+    duration = logged[-1]["duration"]
+    print(f"GameOver: duration={duration}s, endtime={logged[-1]['endtime']}")
+    return abs(duration - 300.0) < 1e-3
+
+def main():
+    """
+    Tasks must time events with the frame clock of FrameManager, so that a replay gives
+    the same events at any speed. The clock is advanced here without sleeping.
+    """
+    fm = FrameManager(EClientType.Video.name, "")
+    fm.clock.Advance(0.0)
+
+    begin_time = time.perf_counter()
+    num_failed = 0
+    num_failed += not CheckCardFlowWait(fm)
+    num_failed += not CheckGameDuration(fm)
+    print(f"wall time: {time.perf_counter() - begin_time:.3f}s")
+
+    if num_failed > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
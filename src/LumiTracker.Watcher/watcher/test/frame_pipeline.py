@@ -0,0 +1,188 @@
+from ..frame_pipeline import FramePipeline
+from ..frame_manager import FrameManager
+from ..deck import DeckCandidateMask
+from ..enums import EFrameQueuePolicy, EGameEvent
+
+import numpy as np
+import threading
+import sys
+import time
+
+class RecordingFrameManager:
+    """
+    Records the frames it gets, spending frame_time on each, and a spike every spike_every frames.
+    """
+    def __init__(self, frame_time=0.0, spike_time=0.0, spike_every=0):
+        self.frame_pipeline = None
+        self.frame_time     = frame_time
+        self.spike_time     = spike_time
+        self.spike_every    = spike_every
+        self.frames         = []  # value of the first pixel, the frame index mod 256
+        self.resizes        = []
+
+    def Resize(self, client_width, client_height):
+        self.resizes.append((len(self.frames), client_width, client_height))
+
+    def OnFrameArrived(self, frame_buffer, timestamp=None):
+        self.frames.append(int(frame_buffer[0, 0, 0]))
+        dt = self.frame_time
+        if self.spike_every > 0 and len(self.frames) % self.spike_every == 0:
+            dt = self.spike_time
+        if dt > 0:
+            time.sleep(dt)
+
+class FailingFrameManager(RecordingFrameManager):
+    def OnFrameArrived(self, frame_buffer, timestamp=None):
+        raise ValueError("failed on purpose")
+
+def CheckPolicies():
+    """
+    With a stalled consumer: DropNewest keeps the first frames, DropOldest the last ones, Block keeps all.
+    The capture buffer is reused for every frame, so the queued frames must be copies.
+    """
+    num_failed = 0
+    buffer = np.zeros((72, 128, 4), dtype=np.uint8)
+    for policy in EFrameQueuePolicy:
+        fm = RecordingFrameManager(frame_time=0.01)
+        pipeline = FramePipeline(fm, max_queued=2, policy=policy)
+        pipeline.Start()
+        for i in range(20):
+            buffer[:] = i
+            pipeline.Push(buffer)
+        pipeline.Close()
+        stats = pipeline.AsDict()
+        print(f"    {policy.name}: frames={fm.frames}, dropped={stats['dropped']}, max_depth={stats['max_depth']}")
+
+        ok = (stats["pushed"] + (stats["dropped"] if policy == EFrameQueuePolicy.DropNewest else 0) == 20
+              and stats["processed"] == len(fm.frames) and len(fm.frames) + stats["dropped"] == 20
+              and fm.frames == sorted(fm.frames) and stats["max_depth"] <= 2)
+        if policy == EFrameQueuePolicy.DropOldest:
+            ok = ok and fm.frames[-1] == 19
+        elif policy == EFrameQueuePolicy.DropNewest:
+            ok = ok and fm.frames[:2] == [0, 1]
+        else:
+            ok = ok and fm.frames == list(range(20))
+        num_failed += not ok
+    return num_failed == 0
+
+def CheckResize():
+    """
+    The consumer resizes FrameManager right before the first frame of a new size.
+    """
+    fm = RecordingFrameManager()
+    pipeline = FramePipeline(fm, max_queued=4, policy=EFrameQueuePolicy.Block)
+    pipeline.Start()
+    for i, (width, height) in enumerate([(128, 72)] * 3 + [(192, 108)] * 3):
+        pipeline.Push(np.full((height, width, 4), i, dtype=np.uint8))
+    pipeline.Close()
+    print(f"    resizes={fm.resizes}")
+    return fm.resizes == [(0, 128, 72), (3, 192, 108)]
+
+def CheckError():
+    """
+    An exception of the consumer is raised again by the next Push, like in the serial loop.
+    """
+    pipeline = FramePipeline(FailingFrameManager(), max_queued=2, policy=EFrameQueuePolicy.Block)
+    pipeline.Start()
+    buffer = np.zeros((72, 128, 4), dtype=np.uint8)
+    try:
+        for _ in range(10):
+            pipeline.Push(buffer)
+            time.sleep(0.01)
+    except ValueError:
+        pipeline.Close()
+        return True
+    pipeline.Close()
+    return False
+
+def CheckPosted():
+    """
+    The input read by the capture thread is applied in the consumer thread before the next frame,
+    so my deck never changes while a task builds its mask.
+    """
+    fm = FrameManager()
+    pipeline = FramePipeline(fm, max_queued=2, policy=EFrameQueuePolicy.Block)
+    pipeline.Start()
+    consumer = pipeline.thread.ident
+
+    threads = set()
+    def SetMyDeck(action_ids):
+        threads.add(threading.get_ident())
+        fm.SetMyDeck(action_ids)
+
+    buffer = np.zeros((720, 1280, 4), dtype=np.uint8)
+    decks = [list(range(i, i + 30)) for i in range(0, 100, 20)]
+    for deck in decks:
+        fm.Post(SetMyDeck, deck)
+        pipeline.Push(buffer)
+    pipeline.Close()
+    fm.task_runner.Close()
+    fm.image_writer.Close()
+
+    mask = fm.GetMyDeckMask(EGameEvent.MyPlayed)
+    expected = DeckCandidateMask(decks[-1], fm.db, EGameEvent.MyPlayed)
+    print(f"    posted from {len(threads)} thread(s), mask of {mask.ids.size} items")
+    return threads == {consumer} and np.array_equal(mask.ids, expected.ids)
+
+def CaptureLoop(process, num_frames, frame_interval, size):
+    """
+    Capture loop of BitBlt: capture, process, sleep the rest of the frame interval.
+    Return the intervals between two captures.
+    """
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, size=(size[1], size[0], 4), dtype=np.uint8)
+    capture_times = []
+    for i in range(num_frames):
+        start_time = time.perf_counter()
+        capture_times.append(start_time)
+        frame[0, 0, 0] = i % 256
+        process(frame)
+        dt = frame_interval - (time.perf_counter() - start_time)
+        if dt > 0:
+            time.sleep(dt)
+    return np.diff(capture_times)
+
+def Bench(num_frames):
+    """
+    Frames taking 5ms with a 100ms spike every 25 frames, like a database search after a card is played,
+    captured at 50 fps.
+    """
+    frame_interval = 0.02
+    size = (1920, 1080)
+
+    fm = RecordingFrameManager(frame_time=0.005, spike_time=0.1, spike_every=25)
+    intervals = CaptureLoop(lambda frame: fm.OnFrameArrived(frame), num_frames, frame_interval, size)
+    print(f"serial: capture interval avg={np.mean(intervals) * 1000:.1f}ms, max={np.max(intervals) * 1000:.1f}ms, "
+          f"late captures={np.sum(intervals > frame_interval * 1.5)}")
+
+    for policy in EFrameQueuePolicy:
+        fm = RecordingFrameManager(frame_time=0.005, spike_time=0.1, spike_every=25)
+        pipeline = FramePipeline(fm, max_queued=2, policy=policy)
+        pipeline.Start()
+        intervals = CaptureLoop(pipeline.Push, num_frames, frame_interval, size)
+        pipeline.Close()
+        stats = pipeline.AsDict()
+        print(f"{policy.name}: capture interval avg={np.mean(intervals) * 1000:.1f}ms, max={np.max(intervals) * 1000:.1f}ms, "
+              f"late captures={np.sum(intervals > frame_interval * 1.5)}, processed={stats['processed']}, "
+              f"dropped={stats['dropped']}, latency avg={stats['latency_avg'] * 1000:.1f}ms max={stats['latency_max'] * 1000:.1f}ms")
+
+def main():
+    """
+    FramePipeline must hand the frames to FrameManager in order, apply its queue policy,
+    resize in order with the frames, report consumer errors and apply the posted input
+    in the consumer thread. Then compare the capture
+    cadence of the serial loop and the pipeline.
+    """
+    num_failed = 0
+    for name, check in (("policies", CheckPolicies), ("resize", CheckResize), ("error", CheckError), ("posted", CheckPosted)):
+        ok = check()
+        print(f"{name}: {ok}")
+        num_failed += not ok
+
+    Bench(num_frames=200)
+
+    if num_failed > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
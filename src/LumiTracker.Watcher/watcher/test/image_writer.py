@@ -0,0 +1,98 @@
+from ..database import LoadImage, SaveImage
+from ..image_writer import AsyncImageWriter
+from ..frame_manager import FrameManager
+from ..enums import EClientType
+
+import numpy as np
+import os
+import sys
+import tempfile
+import time
+
+def CheckCopy(save_dir):
+    """
+    The buffer can be reused right after Save, the queued image must not change.
+    """
+    writer = AsyncImageWriter(max_queued=4, min_interval=0)
+    buffer = np.full((64, 64, 3), 10, dtype=np.uint8)
+    path = os.path.join(save_dir, "copy.png")
+    writer.Save(buffer, path)
+    buffer[:] = 200
+    writer.Close()
+    return np.array_equal(LoadImage(path), np.full((64, 64, 3), 10, dtype=np.uint8))
+
+def CheckAccounting(save_dir):
+    """
+    Images of a source within min_interval are sampled out, the rest beyond the queue size are dropped.
+    """
+    writer = AsyncImageWriter(max_queued=2, min_interval=60)
+    image  = np.zeros((720, 1280, 3), dtype=np.uint8)
+    for i in range(10):
+        writer.Save(image, os.path.join(save_dir, f"sampled{i}.png"), source="sampled")
+    for i in range(100):
+        writer.Save(image, os.path.join(save_dir, f"burst{i}.png"), min_interval=0)
+    writer.Close()
+    stats = writer.AsDict()
+    print("    accounting:", stats)
+    return (stats["sampled_out"] == 9 and stats["queued"] + stats["dropped"] == 101
+            and stats["written"] == stats["queued"] and stats["failed"] == 0)
+
+def CheckCaptureTest(save_dir):
+    """
+    The CaptureTest image exists when its event is logged, even with the writer queue full.
+    """
+    frame_manager = FrameManager(EClientType.YuanShen.name, save_dir)
+    frame_manager.image_writer = AsyncImageWriter(max_queued=1, min_interval=0)
+    frame = np.zeros((720, 1280, 4), dtype=np.uint8)
+    for i in range(10):
+        frame_manager.image_writer.Save(frame, os.path.join(save_dir, f"filler{i}.png"))
+    saved = [name for name in os.listdir(save_dir) if not name.startswith("filler")]
+    frame_manager.CaptureTest(frame)
+    captured = [name for name in os.listdir(save_dir) if not name.startswith("filler") and name not in saved]
+    frame_manager.image_writer.Close()
+    return len(captured) == 1 and LoadImage(os.path.join(save_dir, captured[0])) is not None
+
+def FrameLoop(save_func, save_dir, num_frames):
+    """
+    Frame time of a loop saving a card sized region every frame, like CardPlayedTask with DEBUG_SAVE.
+    """
+    rng = np.random.default_rng(0)
+    region = rng.integers(0, 256, size=(360, 210, 4), dtype=np.uint8)
+    frame_times = []
+    for i in range(num_frames):
+        begin_time = time.perf_counter()
+        region[0, 0] = i % 256
+        save_func(region, os.path.join(save_dir, f"MyPlayed{i}.png"))
+        frame_times.append(time.perf_counter() - begin_time)
+    return np.mean(frame_times) * 1000, np.max(frame_times) * 1000
+
+def main():
+    """
+    AsyncImageWriter must write exactly what was queued, account for every skipped image,
+    and take the encoding out of the frame loop.
+    """
+    num_failed = 0
+    with tempfile.TemporaryDirectory() as save_dir:
+        copied = CheckCopy(save_dir)
+        print(f"copy on queue: {copied}")
+        accounted = CheckAccounting(save_dir)
+        print(f"accounting: {accounted}")
+        captured = CheckCaptureTest(save_dir)
+        print(f"capture test written synchronously: {captured}")
+        num_failed += (not copied) + (not accounted) + (not captured)
+
+        num_frames = 200
+        mean, worst = FrameLoop(SaveImage, save_dir, num_frames)
+        print(f"SaveImage: {mean:.3f}ms per frame, worst {worst:.3f}ms")
+
+        for min_interval in (0, 0.2):
+            writer = AsyncImageWriter(min_interval=min_interval)
+            mean, worst = FrameLoop(lambda image, path: writer.Save(image, path, source="MyPlayed"), save_dir, num_frames)
+            writer.Close()
+            print(f"AsyncImageWriter(min_interval={min_interval}): {mean:.3f}ms per frame, worst {worst:.3f}ms, {writer.AsDict()}")
+
+    if num_failed > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+from ..config import cfg
+from ..database import LoadImage
+from ..feature import ActionCardHandler, CropBox
+from ..feature import ExtractFeature_ActionCard_Grayed, ExtractFeature_Control_Grayed
+
+import cv2
+import numpy as np
+import os
+import sys
+import time
+
+def ListImages(image_dir):
+    files = []
+    for root, _, names in os.walk(image_dir):
+        for name in names:
+            if name.lower().endswith(".png"):
+                files.append(os.path.join(root, name))
+    return sorted(files)
+
+def CheckCards(image_dir):
+    """
+    Card images go through the same feature buffer as Database._Update.
+    Return the number of checked and skipped images, and the mismatches.
+    """
+    handler = ActionCardHandler()
+    handler.OnResize(CropBox(0, 0, 420, 720))
+
+    mismatches = []
+    num_checked, num_skipped = 0, 0
+    for path in ListImages(image_dir):
+        image = LoadImage(path)
+        if image is None or image.shape[:2] != (720, 420):
+            num_skipped += 1
+            continue
+        num_checked += 1
+        mismatch = CompareCard(handler, image)
+        if mismatch is not None:
+            mismatches.append((path,) + mismatch)
+    return num_checked, num_skipped, mismatches
+
+def CompareCard(handler, image):
+    handler.frame_buffer = image
+    handler.ExtractCardFeatures()
+
+    full = ExtractFeature_ActionCard_Grayed(handler.feature_buffer, full_dct=True)
+    low  = ExtractFeature_ActionCard_Grayed(handler.feature_buffer, full_dct=False)
+    if full != low:
+        return [f"{h}" for h in full], [f"{h}" for h in low]
+    return None
+
+def CheckControls(image_dir):
+    mismatches = []
+    num_checked, num_skipped = 0, 0
+    for path in ListImages(image_dir):
+        image = LoadImage(path)
+        if image is None:
+            num_skipped += 1
+            continue
+        if len(image.shape) == 3:
+            code = cv2.COLOR_BGRA2GRAY if image.shape[-1] == 4 else cv2.COLOR_BGR2GRAY
+            image = cv2.cvtColor(image, code)
+        num_checked += 1
+        mismatch = CompareControl(image)
+        if mismatch is not None:
+            mismatches.append((path,) + mismatch)
+    return num_checked, num_skipped, mismatches
+
+def CompareControl(gray_image):
+    full = ExtractFeature_Control_Grayed(gray_image, full_dct=True)
+    low  = ExtractFeature_Control_Grayed(gray_image, full_dct=False)
+    if full != low:
+        return f"{full}", f"{low}"
+    return None
+
+def SmoothNoise(rng, height, width, channels, cell_size):
+    """
+    Random blocks blurred to a card-like image, pure noise would only exercise the high frequencies.
+    """
+    noise = rng.integers(0, 256, size=(height // cell_size + 1, width // cell_size + 1, channels), dtype=np.uint8)
+    image = cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC)
+    return image.reshape(height, width, channels)
+
+def CheckSynthetic(num_images=1000):
+    """
+    Random card frames and control images, when no image of cards_dir could be checked.
+    """
+    rng = np.random.default_rng(0)
+    handler = ActionCardHandler()
+    handler.OnResize(CropBox(0, 0, 420, 720))
+
+    mismatches = []
+    for i in range(num_images):
+        image = SmoothNoise(rng, 720, 420, 4, int(rng.integers(8, 64)))
+        mismatch = CompareCard(handler, image)
+        if mismatch is not None:
+            mismatches.append((f"card {i}",) + mismatch)
+
+        height, width = (int(size) for size in rng.integers(24, 128, size=2))
+        image = SmoothNoise(rng, height, width, 1, int(rng.integers(2, 12)))[:, :, 0]
+        mismatch = CompareControl(image)
+        if mismatch is not None:
+            mismatches.append((f"control {i}",) + mismatch)
+    return 2 * num_images, 0, mismatches
+
+def main():
+    """
+    Hashes from the low-frequency-only DCT must be bit-identical to the full cv2.dct path,
+    or the shipped .ann files become invalid.
+    Without the images of cards_dir, e.g. in a checkout without the game assets, random images are checked instead.
+    """
+    begin_time = time.perf_counter()
+    num_failed = 0
+    total_checked = 0
+    checks = [
+        (CheckCards,    os.path.join(cfg.cards_dir, "actions")),
+        (CheckCards,    os.path.join(cfg.cards_dir, "characters")),
+        (CheckControls, os.path.join(cfg.cards_dir, "controls")),
+    ]
+    if not any(ListImages(image_dir) for _, image_dir in checks):
+        print(f"No image under {cfg.cards_dir}, check random images instead")
+        checks = [(lambda _: CheckSynthetic(), "random images")]
+
+    for check, image_dir in checks:
+        num_checked, num_skipped, mismatches = check(image_dir)
+        print(f"{image_dir}: {num_checked} images checked, {num_skipped} skipped, {len(mismatches)} mismatches")
+        for mismatch in mismatches:
+            print("    ", mismatch)
+        num_failed += len(mismatches)
+        total_checked += num_checked
+        if num_checked == 0 and num_skipped > 0:
+            print(f"    every image of {image_dir} was skipped")
+            num_failed += 1
+
+    if total_checked == 0:
+        print("No image was checked")
+        num_failed += 1
+
+    print(f"Done in {time.perf_counter() - begin_time:.2f}s")
+    if num_failed > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
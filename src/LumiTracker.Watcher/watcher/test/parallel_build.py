@@ -0,0 +1,71 @@
+from ..config import cfg
+from ..database import Database, DatabaseUpdateContext
+from ..enums import EAnnType
+from ..feature import ImageHash
+from ..search_engine import AnnoySearchEngine
+
+import numpy as np
+import os
+import sys
+import tempfile
+
+def ReadFiles(directory):
+    files = {}
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), "rb") as f:
+            files[name] = f.read()
+    return files
+
+def CheckAnnoy(temp_dir, num_items=500):
+    """
+    Two builds of the same features write the same .ann file.
+    """
+    rng = np.random.default_rng(0)
+    engine = AnnoySearchEngine(EAnnType.ACTIONS_A)
+    features = [ImageHash.FromBits(rng.random(engine.num_bits) < 0.5) for _ in range(num_items)]
+    contents = []
+    for i in range(2):
+        path = os.path.join(temp_dir, f"build{i}.ann")
+        AnnoySearchEngine(EAnnType.ACTIONS_A).Build(features).Save(path)
+        with open(path, "rb") as f:
+            contents.append(f.read())
+    return contents[0] == contents[1]
+
+def Build(database_dir, num_jobs):
+    """
+    The database files only, the generated enums and config.json of Database._Update are left out.
+    """
+    cfg.database_dir = database_dir
+    ctx = DatabaseUpdateContext()
+    ctx.num_jobs = num_jobs
+    db = Database()
+    db._Build(ctx)
+    db._SaveDatabase()
+    return ReadFiles(database_dir)
+
+def main():
+    """
+    A build with worker processes must write the same db.json, .ann files and binary database
+    as a serial build, byte for byte. Without the images of cards_dir, only the Annoy index is checked.
+    """
+    num_failed = 0
+    with tempfile.TemporaryDirectory() as temp_dir:
+        ok = CheckAnnoy(temp_dir)
+        print(f"same .ann from the same features: {ok}")
+        num_failed += not ok
+
+        if not os.path.isdir(cfg.cards_dir):
+            print(f"No {cfg.cards_dir}, the serial and parallel builds are not compared")
+        else:
+            num_jobs = max(2, os.cpu_count() or 1)
+            serial   = Build(os.path.join(temp_dir, "serial"), 1)
+            parallel = Build(os.path.join(temp_dir, "parallel"), num_jobs)
+            different = [name for name in sorted(set(serial) | set(parallel)) if serial.get(name) != parallel.get(name)]
+            print(f"--jobs 1 and --jobs {num_jobs}: {len(serial)} files, different: {different}")
+            num_failed += (not serial) + len(different)
+
+    if num_failed > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
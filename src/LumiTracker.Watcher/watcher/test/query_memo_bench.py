@@ -0,0 +1,97 @@
+from ..config import cfg
+from ..frame_manager import FrameManager
+from ..feature import ActionCardHandler, CropBox
+from ..search_engine import QueryMemo
+from ..states import EGameState
+
+import argparse
+import cv2
+import numpy as np
+import sys
+import time
+
+def SyntheticSession(num_scenes, hold, rng):
+    """
+    Smooth noise frames, each held on screen for hold frames like a static scene.
+    """
+    for _ in range(num_scenes):
+        noise = rng.integers(0, 256, size=(27, 48, 4), dtype=np.uint8)
+        frame = cv2.resize(noise, (1920, 1080), interpolation=cv2.INTER_CUBIC)
+        for _ in range(hold):
+            yield frame
+
+def VideoSession(path):
+    cap = cv2.VideoCapture(path)
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA)
+    cap.release()
+
+def Replay(frames, memo_size):
+    """
+    Replay frames in the action phase, where every card task searches each frame.
+    """
+    fm = FrameManager()
+    fm.db.query_memo = QueryMemo(memo_size)
+    fm.game_started = True
+    fm.state = fm.states[EGameState.ActionPhase.value]
+    fm.state.OnEnter(from_state=EGameState.GameNotStarted)
+    fm.tasks = fm.state.CollectTasks()
+
+    num_frames = 0
+    frame_time = 0.0
+    for frame in frames:
+        if num_frames == 0:
+            fm.Resize(frame.shape[1], frame.shape[0])
+        begin_time = time.perf_counter()
+        fm.OnFrameArrived(frame)
+        frame_time += time.perf_counter() - begin_time
+        num_frames += 1
+    return num_frames, frame_time, fm.db.query_memo.AsDict()
+
+def CheckDecisions(rng):
+    """
+    A memoized result must decide exactly like a fresh search.
+    """
+    handler = ActionCardHandler()
+    handler.OnResize(CropBox(800, 300, 1010, 660))
+    fm = FrameManager()
+    memo = QueryMemo(cfg.query_memo_size)
+    num_mismatches = 0
+    for frame in SyntheticSession(50, 3, rng):
+        fm.db.query_memo = QueryMemo(0)
+        expected = handler.Update(frame, fm.db)
+        fm.db.query_memo = memo
+        num_mismatches += (handler.Update(frame, fm.db) != expected)
+    return num_mismatches
+
+def main():
+    """
+    How many searches the query memo avoids when replaying a session, and the frame time with and without it.
+    Without --video, a synthetic session of static scenes is replayed.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--video", default="", help="recorded session to replay")
+    parser.add_argument("--scenes", type=int, default=40)
+    parser.add_argument("--hold", type=int, default=25, help="frames each synthetic scene is held")
+    args = parser.parse_args()
+
+    def Frames():
+        if args.video:
+            return VideoSession(args.video)
+        return SyntheticSession(args.scenes, args.hold, np.random.default_rng(0))
+
+    for memo_size in (0, cfg.query_memo_size):
+        num_frames, frame_time, stats = Replay(Frames(), memo_size)
+        print(f"memo_size={memo_size}: {num_frames} frames, {frame_time / max(num_frames, 1) * 1000:.3f}ms per frame, "
+              f"{stats['hits']} searches avoided of {stats['hits'] + stats['misses']}, hit_rate={stats['hit_rate']:.3f}")
+
+    num_mismatches = CheckDecisions(np.random.default_rng(1))
+    print(f"{num_mismatches} mismatches between memoized and fresh decisions")
+    if num_mismatches > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
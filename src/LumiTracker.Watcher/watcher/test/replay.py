@@ -0,0 +1,96 @@
+from ..capture.replay import ReplayCapture
+from ..database import SaveImage
+
+import argparse
+import cv2
+import numpy as np
+import os
+import sys
+import tempfile
+import time
+
+class RecordingReplayCapture(ReplayCapture):
+    def __init__(self, speed=0.0):
+        super().__init__(speed)
+        self.resizes = []
+
+    def OnResize(self, width, height):
+        self.resizes.append((width, height))
+        super().OnResize(width, height)
+
+def SyntheticFrames(rng, num_frames, size):
+    width, height = size
+    for _ in range(num_frames):
+        noise = rng.integers(0, 256, size=(height // 40, width // 40, 3), dtype=np.uint8)
+        yield cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC)
+
+def WriteImages(image_dir, rng):
+    """
+    Frames of two sizes, like a window resized during the recording.
+    """
+    index = 0
+    for size, num_frames in (((1280, 720), 20), ((1920, 1080), 20)):
+        for frame in SyntheticFrames(rng, num_frames, size):
+            SaveImage(frame, os.path.join(image_dir, f"{index:05d}.png"))
+            index += 1
+    return index, [(1280, 720), (1920, 1080)]
+
+def WriteVideo(path, rng, fps):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (1280, 720))
+    if not writer.isOpened():
+        return 0
+    num_frames = 0
+    for frame in SyntheticFrames(rng, 50, (1280, 720)):
+        writer.write(frame)
+        num_frames += 1
+    writer.release()
+    return num_frames
+
+def Replay(path, speed, fps=50):
+    capture = RecordingReplayCapture(speed)
+    capture.Start(path, fps=fps)
+    return capture
+
+def main():
+    """
+    ReplayCapture must feed every frame of a recording to FrameManager, resize it on size changes,
+    and pace the frames when a speed is given. With a path, only report the throughput of that recording.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", nargs="?", default="", help="recording to measure instead of the synthetic checks")
+    args = parser.parse_args()
+    if args.path:
+        capture = Replay(args.path, speed=0)
+        print(f"{capture.num_frames} frames in {capture.wall_time:.2f}s, {capture.num_frames / capture.wall_time:.1f} fps")
+        return
+
+    rng = np.random.default_rng(0)
+    num_failed = 0
+    with tempfile.TemporaryDirectory() as temp_dir:
+        image_dir = os.path.join(temp_dir, "frames")
+        num_frames, sizes = WriteImages(image_dir, rng)
+        capture = Replay(image_dir, speed=0)
+        print(f"images: {capture.num_frames}/{num_frames} frames, resizes={capture.resizes}, "
+              f"{capture.num_frames / capture.wall_time:.1f} fps")
+        num_failed += (capture.num_frames != num_frames) + (capture.resizes != sizes)
+
+        # The last of 40 frames at 2 fps is at 19.5s of recording, 2.44s at 8x
+        capture = Replay(image_dir, speed=8.0, fps=2)
+        print(f"images at 8x: wall_time={capture.wall_time:.2f}s")
+        num_failed += not (2.4 <= capture.wall_time <= 3.2)
+
+        video_path = os.path.join(temp_dir, "replay.mp4")
+        num_frames = WriteVideo(video_path, rng, fps=25)
+        if num_frames == 0:
+            print("video: mp4v encoder is not available, skipped")
+        else:
+            capture = Replay(video_path, speed=0)
+            print(f"video: {capture.num_frames}/{num_frames} frames, resizes={capture.resizes}, "
+                  f"{capture.num_frames / capture.wall_time:.1f} fps")
+            num_failed += (capture.num_frames != num_frames) + (capture.resizes != [(1280, 720)])
+
+    if num_failed > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+from ..config import cfg
+from ..database import Database
+from ..enums import EGameEvent
+from ..feature import ActionCardHandler, CharacterCardHandler, ImageHash
+from ..search_engine import SearchResult
+from .cascade_search import PerturbedHash
+
+import numpy as np
+import sys
+
+def LegacyDecide(handler, db, card_ids_a, dists_a, card_ids_d, dists_d, check_next_dist, threshold, strict_threshold):
+    """
+    CardHandler.Decide as it was on the (ids, dists) lists of 20 neighbors.
+    """
+    card_id_a, card_id_d = card_ids_a[0], card_ids_d[0]
+    dist_a, dist_d = dists_a[0], dists_d[0]
+    packed = lambda card_id, dist: (card_id, dist, (dists_a[:3], dists_d[:3]))
+
+    if dist_d <= strict_threshold and handler.AllowEarlyReturn(card_id_d):
+        return packed(card_id_d, dist_d)
+    if dist_a <= strict_threshold and handler.AllowEarlyReturn(card_id_a):
+        return packed(card_id_a, dist_a)
+
+    sets, nexts = [], []
+    for card_ids, dists in ((card_ids_a, dists_a), (card_ids_d, dists_d)):
+        dist_next = dists[3]
+        cards = set()
+        for i in range(3):
+            if dists[i] != dists[0]:
+                dist_next = dists[i]
+                break
+            remapped = handler.RemapCardId(card_ids[i], db, dists[0], threshold, strict_threshold)
+            if remapped < 0:
+                return packed(-1, max(dist_a, dist_d))
+            cards.add(remapped)
+        sets.append(cards)
+        nexts.append(dist_next)
+
+    intersection = sets[0] & sets[1]
+    if len(intersection) != 1 or dist_a > threshold or dist_d > threshold:
+        return packed(-1, max(dist_a, dist_d))
+    margin = handler.NEXT_DIST_MARGIN
+    if check_next_dist and (nexts[0] - dist_a <= margin or nexts[1] - dist_d <= margin):
+        return packed(-1, max(dist_a, dist_d))
+    return packed(intersection.pop(), min(dist_a, dist_d))
+
+def CheckTies():
+    result = SearchResult([5, 6, 7, 8, 9], [3, 3, 3, 3, 10], num_bits=100)
+    assert (result.dist, result.ids, result.next_dist, result.margin) == (3, [5, 6, 7], 3, 0), result
+    result = SearchResult([5, 6, 7, 8], [3, 3, 8, 9], num_bits=100)
+    assert (result.dist, result.ids, result.next_dist, result.margin) == (3, [5, 6], 8, 5), result
+    result = SearchResult([5, 6], [3, 3], num_bits=100)
+    assert (result.ids, result.next_dist) == ([5, 6], 101), result
+
+def main():
+    """
+    Decide on SearchResult must make the same decisions as the legacy Decide on 20 neighbors,
+    for queries near database hashes (with ties among card variants) and for noise.
+    """
+    CheckTies()
+
+    db = Database()
+    db.Load()
+    rng = np.random.default_rng(1)
+
+    num_queries = 0
+    mismatches = []
+    for handler in (ActionCardHandler(), CharacterCardHandler()):
+        engine_a = db.GetEngine(handler.ann_type_a)
+        engine_d = db.GetEngine(handler.ann_type_d)
+        for _ in range(2000):
+            card_id = int(rng.integers(engine_a.GetNumItems()))
+            if rng.random() < 0.2:
+                ahash = ImageHash.FromBits(rng.random(engine_a.num_bits) < 0.5)
+                dhash = ImageHash.FromBits(rng.random(engine_d.num_bits) < 0.5)
+            else:
+                num_flips = int(rng.integers(0, 30))
+                ahash = PerturbedHash(engine_a.GetFeatureById(card_id), num_flips, rng)
+                dhash = PerturbedHash(engine_d.GetFeatureById(card_id), num_flips, rng)
+
+            for event in (EGameEvent.Invalid, EGameEvent.MyPlayed, EGameEvent.OpPlayed):
+                handler.event = event
+                mask = handler.GetCandidateMask()
+                lists_a = engine_a.Search(ahash, n=20, mask=mask)
+                lists_d = engine_d.Search(dhash, n=20, mask=mask)
+                for check_next_dist, threshold in ((True, cfg.threshold), (False, 40), (True, 40)):
+                    expected = LegacyDecide(handler, db, *lists_a, *lists_d, 
+                        check_next_dist, threshold, cfg.strict_threshold)
+                    result = handler.Decide(db, 
+                        db.SearchByFeature(ahash, handler.ann_type_a, mask=mask), 
+                        db.SearchByFeature(dhash, handler.ann_type_d, mask=mask), 
+                        check_next_dist, threshold, cfg.strict_threshold)
+
+                    num_queries += 1
+                    if result != expected:
+                        mismatches.append((expected, result))
+
+    print(f"{num_queries} queries, {len(mismatches)} mismatches")
+    for mismatch in mismatches[:10]:
+        print("    ", mismatch)
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+from ..frame_manager import FrameManager
+from ..task_runner import TaskRunner
+from ..tasks import TaskBase
+from ..states import EGameState
+from ..config import LogInfo, Deferred
+from ..enums import EClientType
+
+import logging
+import numpy as np
+import sys
+import time
+
+class RecordingTask(TaskBase):
+    """
+    Logs, then changes the frame manager, after sleeping longer the earlier it is in the list,
+    so the parallel tasks finish in the reverse order.
+    """
+    def __init__(self, frame_manager, index, parallel_safe, sleep_time):
+        super().__init__(frame_manager)
+        self.PARALLEL_SAFE = parallel_safe
+        self.index         = index
+        self.sleep_time    = sleep_time
+        self.seen          = None
+
+    def Tick(self):
+        time.sleep(self.sleep_time)
+        # What the serial run would see: the changes of every earlier task which is not in the same batch
+        self.seen = list(self.fm.applied)
+        LogInfo(task=self.index)
+        Deferred(self.fm.applied.append, self.index)
+
+    def OnResize(self, client_width, client_height, ratio_type):
+        pass
+
+    def Reset(self):
+        pass
+
+class FakeFrameManager:
+    def __init__(self):
+        self.db      = None
+        self.applied = []
+
+class LogCollector(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record.getMessage())
+
+def CheckOrder():
+    """
+    Effects are applied in the task order, and a task which is not parallel safe sees the effects of all the
+    tasks before it.
+    """
+    fm = FakeFrameManager()
+    safe = [True, True, True, False, True, True]
+    tasks = [RecordingTask(fm, i, safe[i], 0.01 * (len(safe) - i)) for i in range(len(safe))]
+
+    collector = LogCollector()
+    logging.getLogger().addHandler(collector)
+    runner = TaskRunner(num_threads=4)
+    runner.Run(tasks)
+    runner.Close()
+    logging.getLogger().removeHandler(collector)
+
+    logged = [int(message.split(":")[1].strip(" }")) for message in collector.records]
+    print(f"    applied={fm.applied}, logged={logged}, seen by task 3={tasks[3].seen}")
+    return fm.applied == list(range(len(safe))) and logged == fm.applied and tasks[3].seen == [0, 1, 2]
+
+def ActionPhaseFrameManager():
+    fm = FrameManager(EClientType.YuanShen.name, "")
+    fm.Resize(1920, 1080)
+    fm.game_started = True
+    fm.state = fm.states[EGameState.ActionPhase.value]
+    fm.tasks = fm.state.CollectTasks()
+    return fm
+
+def Bench(fm, num_threads, frames):
+    runner = fm.task_runner = TaskRunner(num_threads)
+    frame_times = []
+    for frame in frames:
+        for task in fm.tasks:
+            task.SetFrameBuffer(frame)
+        begin_time = time.perf_counter()
+        runner.Run(fm.tasks)
+        frame_times.append(time.perf_counter() - begin_time)
+    runner.Close()
+    return np.array(frame_times[5:]) * 1000
+
+def main():
+    """
+    TaskRunner must apply the effects of parallel tasks in the task order. Then compare the per-frame
+    wall time of the ActionPhase tasks ticked serially and in the thread pool.
+    """
+    num_failed = 0
+    ok = CheckOrder()
+    print(f"order: {ok}")
+    num_failed += not ok
+
+    logging.disable(logging.CRITICAL)
+    fm = ActionPhaseFrameManager()
+    rng = np.random.default_rng(0)
+    frames = []
+    for _ in range(60):
+        noise = rng.integers(0, 256, size=(27, 48, 4), dtype=np.uint8)
+        frames.append(np.ascontiguousarray(np.kron(noise, np.ones((40, 40, 1), dtype=np.uint8))))
+
+    for task in fm.tasks:
+        times = []
+        for frame in frames:
+            task.SetFrameBuffer(frame)
+            begin_time = time.perf_counter()
+            task.Tick()
+            times.append(time.perf_counter() - begin_time)
+        print(f"    {type(task).__name__}: {np.mean(times) * 1000:.3f}ms")
+
+    for num_threads in (1, 2, 4, 8):
+        frame_times = Bench(fm, num_threads, frames)
+        print(f"task_threads={num_threads}: {np.mean(frame_times):.3f}ms per frame, worst {np.max(frame_times):.3f}ms")
+    logging.disable(logging.NOTSET)
+
+    if num_failed > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
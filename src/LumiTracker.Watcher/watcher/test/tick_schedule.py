@@ -0,0 +1,118 @@
+from ..frame_manager import FrameManager
+from ..states import GTasks, EGameState
+from ..stream_filter import StreamFilter
+from ..tasks.base import TickSchedule
+from ..config import cfg
+from ..enums import EClientType
+
+import logging
+import numpy as np
+import sys
+import time
+
+def CheckStagger():
+    """
+    GameOver ticks at its rate, and schedules of the same period tick on different frames.
+    """
+    game_over = GTasks.GameOver.schedule
+    others    = [TickSchedule(GTasks.GameOver.TICK_RATE) for _ in range(3)]
+    num_frames = cfg.frame_limit * 2  # two seconds
+    due_frames = [{i for i in range(num_frames) if schedule.Due(i)} for schedule in [game_over] + others]
+    print(f"    period={game_over.period}, phases={[schedule.phase for schedule in [game_over] + others]}")
+    return (len(due_frames[0]) == 2 * GTasks.GameOver.TICK_RATE
+            and all(not (a & b) for i, a in enumerate(due_frames) for b in due_frames[i + 1:]))
+
+def SignalFrames(values, period, phase, dist, **kwargs):
+    """
+    Frames on which a StreamFilter sampling values every period frames from phase signals.
+    """
+    stream_filter = StreamFilter(null_val=-1, period=period, **kwargs)
+    return [i for i in range(phase, len(values), period) if stream_filter.Filter(values[i], dist=dist) != -1]
+
+def FirstSignal(values, period, phase, dist, **kwargs):
+    frames = SignalFrames(values, period, phase, dist, **kwargs)
+    return frames[0] if frames else -1
+
+def CheckRescaledFilter(name, period, dist, **kwargs):
+    """
+    A glitch of one frame is never signaled, a value lasting a few windows is signaled at every phase,
+    at most a window of the full rate later than at the full rate, and noise alone is never signaled.
+    dist=0 takes the strict branch of SlidingWindow, like the tasks which only report strict matches.
+    """
+    ok = True
+    print(f"    {name}: period={period}, dist={dist}, {kwargs}")
+    for duration in (1, 5, 10, 20, 60, 100, 200):
+        values = [-1] * 50 + [7] * duration + [-1] * 200
+        full = FirstSignal(values, 1, 0, dist, **kwargs)
+        scaled = [FirstSignal(values, period, phase, dist, **kwargs) for phase in range(period)]
+        print(f"        duration={duration}: full rate at {full}, every {period} frames at {scaled}")
+        if duration == 1:
+            ok = ok and all(frame == -1 for frame in scaled)
+        elif duration >= 100:
+            ok = ok and full != -1 and all(frame != -1 and frame - full <= 40 + period for frame in scaled)
+
+    rng = np.random.default_rng(0)
+    for noise_rate in (0.01, 0.02):
+        noise = list(np.where(rng.random(20000) < noise_rate, 7, -1))
+        full = len(SignalFrames(noise, 1, 0, dist, **kwargs))
+        scaled = sum(len(SignalFrames(noise, period, phase, dist, **kwargs)) for phase in range(period))
+        print(f"        {noise_rate:.0%} noise: {full} signals at full rate, {scaled} over every phase")
+        ok = ok and scaled == 0
+    return ok
+
+def Bench():
+    """
+    Per-frame cost of the ActionPhase tasks, every task on every frame against the schedules.
+    """
+    logging.disable(logging.CRITICAL)
+    fm = FrameManager(EClientType.YuanShen.name, "")
+    fm.Resize(1920, 1080)
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 256, size=(27, 48, 4), dtype=np.uint8)
+    frame = np.ascontiguousarray(np.kron(noise, np.ones((40, 40, 1), dtype=np.uint8)))
+    tasks = fm.states[EGameState.ActionPhase.value].CollectTasks()
+
+    for scheduled in (False, True):
+        frame_times = []
+        for frame_index in range(500):
+            fm.frame_index = frame_index
+            begin_time = time.perf_counter()
+            for task in tasks:
+                if scheduled and not task.schedule.Due(frame_index):
+                    continue
+                task.SetFrameBuffer(frame)
+                task.Tick()
+            frame_times.append(time.perf_counter() - begin_time)
+        frame_times = np.array(frame_times[10:]) * 1000
+        print(f"{'scheduled' if scheduled else 'every frame'}: {np.mean(frame_times):.3f}ms per frame, "
+              f"worst {np.max(frame_times):.3f}ms")
+    logging.disable(logging.NOTSET)
+
+def main():
+    """
+    Tasks with a TICK_RATE must tick on their staggered frames only, and their rescaled StreamFilters
+    must keep the detection semantics of the full rate.
+    """
+    num_failed = 0
+    FrameManager(EClientType.YuanShen.name, "")
+    ok = CheckStagger()
+    print(f"stagger: {ok}")
+    num_failed += not ok
+
+    configs = [
+        ("GameOverTask", dict(period=GTasks.GameOver.schedule.period, dist=0)),
+        ("round banner", dict(period=5, dist=0, cooldown=30)),
+        ("not strict",   dict(period=10, dist=100)),
+    ]
+    for name, kwargs in configs:
+        ok = CheckRescaledFilter(name, **kwargs)
+        print(f"rescaled filter, {name}: {ok}")
+        num_failed += not ok
+
+    Bench()
+
+    if num_failed > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
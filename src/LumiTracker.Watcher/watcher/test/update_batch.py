@@ -0,0 +1,49 @@
+from ..database import Database
+from ..feature import ActionCardHandler, CharacterCardHandler, CropBox
+
+import cv2
+import numpy as np
+import sys
+
+def RandomFrame(rng, bboxes):
+    frame = np.zeros((1080, 1920, 4), dtype=np.uint8)
+    for bbox in bboxes:
+        # smooth noise looks more like a card than white noise
+        noise = rng.integers(0, 256, size=(24, 14, 4), dtype=np.uint8)
+        frame[bbox.top:bbox.bottom, bbox.left:bbox.right] = cv2.resize(
+            noise, (bbox.width, bbox.height), interpolation=cv2.INTER_CUBIC)
+    return frame
+
+def main():
+    """
+    UpdateBatch must return exactly what Update returns for each bbox.
+    """
+    db = Database()
+    db.Load()
+
+    rng = np.random.default_rng(0)
+    width, height = 186, 319
+    bboxes = [CropBox(50 + i * (width + 20), 300, 50 + i * (width + 20) + width, 300 + height) for i in range(8)]
+
+    num_failed = 0
+    for HandlerType in (ActionCardHandler, CharacterCardHandler):
+        for _ in range(20):
+            frame_buffer = RandomFrame(rng, bboxes)
+            batch_results = HandlerType().UpdateBatch(frame_buffer, bboxes, db, threshold=40, check_next_dist=False)
+
+            single_results = []
+            for bbox in bboxes:
+                handler = HandlerType()
+                handler.OnResize(bbox)
+                single_results.append(handler.Update(frame_buffer, db, threshold=40, check_next_dist=False))
+
+            if batch_results != single_results:
+                num_failed += 1
+                print(f"{HandlerType.__name__}: {batch_results} != {single_results}")
+
+    print(f"{num_failed} mismatches")
+    if num_failed > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
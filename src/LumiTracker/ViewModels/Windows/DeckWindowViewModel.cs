@@ -231,6 +231,17 @@ namespace LumiTracker.ViewModels.Windows
             }
 
             bool found = FindMatchedDeckBuildAndSetActive(card_ids, out string sharecode);
+
+            // Restrict the recognition of my cards to the deck, an empty sharecode clears the previous one
+            if (_hook is GameWatcher watcher)
+            {
+                Task.Run(() => watcher.DumpToBackend(new
+                {
+                    input_type = EInputType.MyDeck.ToString(),
+                    sharecode  = found ? sharecode : "",
+                }));
+            }
+
             if (!found)
             {
                 Configuration.Logger.LogInformation($"Characters tuple ({card_ids[0]}, {card_ids[1]}, {card_ids[2]}) is not found in the deck list.");